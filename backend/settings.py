@@ -41,8 +41,19 @@ env = environ.Env(DEBUG=(bool, False),
                   FLOWBACK_ALLOW_DYNAMIC_POLL=(bool, False),
                   FLOWBACK_ALLOW_GROUP_CREATION=(bool, True),
                   FLOWBACK_GROUP_ADMIN_USER_LIST_ACCESS_ONLY=(bool, False),
+                  FLOWBACK_HOME_FEED_FANOUT_LIMIT=(int, 1000),
+                  FLOWBACK_NOTIFICATION_FANOUT_ASYNC_LIMIT=(int, 1000),
+                  FLOWBACK_NOTIFICATION_PULL_LIMIT=(int, 10000),
+                  FLOWBACK_CHAT_WRITE_BEHIND_ORIGINS=(list, []),
+                  FLOWBACK_CHAT_FAN_IN=(bool, False),
+                  FLOWBACK_CHAT_PRESENCE_INTERVAL=(int, 250),
+                  FLOWBACK_CHAT_PRESENCE_TTL=(int, 60),
+                  FLOWBACK_CHAT_TYPING_INTERVAL=(int, 2000),
+                  FLOWBACK_CHAT_WRITE_BEHIND_INTERVAL=(int, 20),
+                  FLOWBACK_CHAT_WRITE_BEHIND_BATCH_SIZE=(int, 500),
                   FLOWBACK_DEFAULT_PERMISSION=(str, 'rest_framework.permissions.IsAuthenticated'),
                   FLOWBACK_PREDICTION_HISTORY_LIMIT=(int, 100),  # TODO Unused?
+                  FLOWBACK_POLL_PHASE_DISPATCH_INTERVAL=(int, 10),
                   EMAIL_HOST=(str, None),
                   EMAIL_PORT=(str, None),
                   EMAIL_FROM=(str, None),
@@ -137,6 +148,26 @@ INSTALLED_APPS = [
 
 CELERY_BROKER_URL = f"redis://{env('FLOWBACK_REDIS_HOST')}:{env('FLOWBACK_REDIS_PORT')}/0"
 
+# Write-behind queue and presence state of the chat
+FLOWBACK_CHAT_REDIS_URL = f"redis://{env('FLOWBACK_REDIS_HOST')}:{env('FLOWBACK_REDIS_PORT')}/3"
+
+# Chat messages to channels of these origins (e.g. group) are broadcast before they're saved, and saved in batches
+# every FLOWBACK_CHAT_WRITE_BEHIND_INTERVAL milliseconds, see flowback.chat.write_behind
+FLOWBACK_CHAT_WRITE_BEHIND_ORIGINS = env('FLOWBACK_CHAT_WRITE_BEHIND_ORIGINS')
+FLOWBACK_CHAT_WRITE_BEHIND_INTERVAL = env('FLOWBACK_CHAT_WRITE_BEHIND_INTERVAL')
+FLOWBACK_CHAT_WRITE_BEHIND_BATCH_SIZE = env('FLOWBACK_CHAT_WRITE_BEHIND_BATCH_SIZE')
+
+# Chat connections only join the channel-layer group of their user, messages to a channel are sent to the group of
+# each participant. Fewer group operations on (re)connect, more sends per message, see flowback.chat.subscriptions
+FLOWBACK_CHAT_FAN_IN = env('FLOWBACK_CHAT_FAN_IN')
+
+# Presence changes of each channel are sent in one batch every FLOWBACK_CHAT_PRESENCE_INTERVAL milliseconds, users are
+# online for FLOWBACK_CHAT_PRESENCE_TTL seconds after their last sign of life, and typing is sent at most once every
+# FLOWBACK_CHAT_TYPING_INTERVAL milliseconds per user and channel, see flowback.chat.presence
+FLOWBACK_CHAT_PRESENCE_INTERVAL = env('FLOWBACK_CHAT_PRESENCE_INTERVAL')
+FLOWBACK_CHAT_PRESENCE_TTL = env('FLOWBACK_CHAT_PRESENCE_TTL')
+FLOWBACK_CHAT_TYPING_INTERVAL = env('FLOWBACK_CHAT_TYPING_INTERVAL')
+
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'flowback.common.documentation.CustomAutoSchema',
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -166,6 +197,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'flowback.common.cache.RequestCacheMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -248,6 +280,16 @@ CHANNEL_LAYERS = {
     },
 }
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": f"redis://{env('FLOWBACK_REDIS_HOST')}:{env('FLOWBACK_REDIS_PORT')}/2",
+    },
+}
+
+if TESTING or "pytest" in sys.modules:
+    CACHES["default"] = {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+
 
 # OIDC Settings
 LOGIN_URL = '/login/'
@@ -317,10 +359,31 @@ FLOWBACK_SCORE_VOTE_FLOOR = env('FLOWBACK_SCORE_VOTE_FLOOR')
 FLOWBACK_ALLOW_DYNAMIC_POLL = env('FLOWBACK_ALLOW_DYNAMIC_POLL')
 FLOWBACK_PREDICTION_HISTORY_LIMIT = env('FLOWBACK_PREDICTION_HISTORY_LIMIT')
 
+# Seconds between each check for due poll phases, see flowback.poll.tasks.poll_phase_dispatch
+FLOWBACK_POLL_PHASE_DISPATCH_INTERVAL = env('FLOWBACK_POLL_PHASE_DISPATCH_INTERVAL')
+CELERY_BEAT_SCHEDULE = {
+    'poll_phase_dispatch': {
+        'task': 'flowback.poll.tasks.poll_phase_dispatch',
+        'schedule': FLOWBACK_POLL_PHASE_DISPATCH_INTERVAL
+    }
+}
+
 # Group related settings
 FLOWBACK_ALLOW_GROUP_CREATION = env('FLOWBACK_ALLOW_GROUP_CREATION')
 FLOWBACK_GROUP_ADMIN_USER_LIST_ACCESS_ONLY = env('FLOWBACK_GROUP_ADMIN_USER_LIST_ACCESS_ONLY')
 
+# Groups with more members than this share one home feed entry per poll/thread instead of one entry per member,
+# see flowback.user.services.home_feed_fan_out
+FLOWBACK_HOME_FEED_FANOUT_LIMIT = env('FLOWBACK_HOME_FEED_FANOUT_LIMIT')
+
+# Notifications of channels with more subscribers than this are created by a Celery worker,
+# see flowback.notification.services.notification_create
+FLOWBACK_NOTIFICATION_FANOUT_ASYNC_LIMIT = env('FLOWBACK_NOTIFICATION_FANOUT_ASYNC_LIMIT')
+
+# Notifications to every subscriber of channels with more subscribers than this are read from the channel instead of
+# being copied to each subscriber, see flowback.notification.selectors.notification_list
+FLOWBACK_NOTIFICATION_PULL_LIMIT = env('FLOWBACK_NOTIFICATION_PULL_LIMIT')
+
 # Kanban related settings
 FLOWBACK_KANBAN_PRIORITY_LIMIT = env('FLOWBACK_KANBAN_PRIORITY_LIMIT')
 FLOWBACK_KANBAN_LANES = env('FLOWBACK_KANBAN_LANES')
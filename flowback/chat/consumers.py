@@ -1,5 +1,4 @@
 import json
-from json import JSONDecodeError
 from typing import Union
 
 from asgiref.sync import sync_to_async
@@ -9,9 +8,13 @@ from django.shortcuts import get_object_or_404
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
-from flowback.chat.models import MessageChannelParticipant, MessageChannel
+from flowback.chat.models import MessageChannel
 from flowback.chat.serializers import BasicMessageSerializer, MessageSerializer
-from flowback.chat.services import message_create, message_update, message_delete, user_message_channel_permission
+from flowback.chat.subscriptions import ChatSubscriptions, chat_channel_groups, chat_channel_send, chat_user_group
+from flowback.chat.presence import chat_presence
+from flowback.chat.protocol import JSON, MSGPACK, chat_frame, chat_decode
+from flowback.chat.services import message_create_async, message_update, message_delete
+from flowback.chat.write_behind import message_write_behind, message_write_behind_enabled
 from flowback.common.services import get_object
 from flowback.user.models import User
 from flowback.group.models import Group
@@ -28,34 +31,40 @@ class ChatConsumer(AsyncWebsocketConsumer):
         if self.scope['user'].is_anonymous:
             return await self.close()
 
-        # Assign user to their channels
-        self.user_channel = f"user_{self.user.id}"
-        self.participating_channels = await self.get_participating_channels()
-        self.participating_channels.append(self.user_channel)
-        for channel in self.participating_channels:
-            await self.channel_layer.group_add(
-                f"{channel}",
-                self.channel_name
-            )
+        # Assign user to their channels, the verified memberships are kept for the lifetime of the connection
+        self.user_channel = chat_user_group(self.user.id)
+        self.message_channels = await self.get_participating_channels()
+        self.subscriptions = ChatSubscriptions(self.channel_layer, self.channel_name)
+        await self.subscriptions.update(chat_channel_groups(user_id=self.user.id, channel_ids=self.message_channels))
+        await chat_presence.connect(self.channel_layer,
+                                    user_id=self.user.id,
+                                    connection=self.channel_name,
+                                    channel_ids=list(self.message_channels))
 
-        await self.accept()
+        # Wire protocol, JSON unless the client asks for MessagePack, see flowback.chat.protocol
+        subprotocols = self.scope.get('subprotocols', [])
+        self.protocol = MSGPACK if MSGPACK in subprotocols else JSON
+        self.sent_users: dict[str, bytes] = {}  # Profiles sent to a MessagePack client, by user id
+
+        await self.accept(subprotocol=self.protocol if self.protocol in subprotocols else None)
 
     async def disconnect(self, close_code):
         if self.scope['user'].is_anonymous:
             return await self.close()
 
+        # Save the messages queued by write-behind channels before the connection goes away
+        await message_write_behind.flush()
+
         # Disconnect from channels
-        for channel in self.participating_channels:
-            await self.channel_layer.group_discard(
-                f"{channel}",
-                self.channel_name)
+        await self.subscriptions.update(())
+        await chat_presence.disconnect(connection=self.channel_name)
 
     # Receive message from WebSocket
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         try:
-            data = json.loads(text_data or '{}')
+            data = chat_decode(text_data=text_data, bytes_data=bytes_data)
 
-        except JSONDecodeError as e:
+        except ValueError:
             return await self.send_error_message(method="JSONDecodeError",
                                                  detail="Wrong Format")
 
@@ -72,6 +81,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
         elif data.get('method') == 'message_notify':
             await self.message_notify(data=data)
 
+        elif data.get('method') == 'presence_list':
+            await self.presence_list(data=data)
+
         elif data.get('method') == 'connect_channel':
             await self.connect_channel(data=data)
 
@@ -88,15 +100,24 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
         return True
 
-    # Messages passes here before being sent
+    # Messages passes here before being sent, broadcasts arrive encoded already
     async def message(self, content: dict):
-        await self.send(text_data=json.dumps(content))
+        frame = chat_frame(content)['frame']
 
-    @database_sync_to_async
-    def get_participating_channels(self):
-        return list(MessageChannelParticipant.objects.filter(user=self.user,
-                                                             active=True).values_list('channel_id',
-                                                                                      flat=True))
+        if self.protocol == JSON:
+            return await self.send(text_data=frame['json'])
+
+        for user_id, profile in frame['users'].items():
+            if self.sent_users.get(user_id) != profile:
+                self.sent_users[user_id] = profile
+                await self.send(bytes_data=profile)
+
+        await self.send(bytes_data=frame['msgpack'])
+
+    async def get_participating_channels(self) -> dict[int, MessageChannel]:
+        return {channel.id: channel async for channel in MessageChannel.objects.filter(
+            messagechannelparticipant__user=self.user,
+            messagechannelparticipant__active=True).only('id', 'origin_name', 'title')}
 
     @staticmethod
     def generate_status_message(message: str, method: str = None, **kwargs):
@@ -135,24 +156,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
             if not message.get("type"):
                 message["type"] = "message"
 
-        await self.channel_layer.group_send(
-            f"{channel_id}",
-            message
-        )
-
-    @database_sync_to_async
-    def _create_message(self, *,
-                        user_id: int,
-                        channel_id: int,
-                        message: str,
-                        attachments_id: int = None,
-                        parent_id: int = None,
-                        topic_id: int = None):
-
-        message = message_create(user_id=user_id, channel_id=channel_id, message=message,
-                                 attachments_id=attachments_id, parent_id=parent_id, topic_id=topic_id)
+        if channel_id == self.user_channel:
+            await self.channel_layer.group_send(channel_id, chat_frame(message))
 
-        return MessageSerializer(message).data
+        else:
+            await chat_channel_send(self.channel_layer, int(channel_id), chat_frame(message))
 
     async def message_create(self, data: dict):
         class InputSerializer(serializers.Serializer):
@@ -166,14 +174,23 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
         try:
             serializer.is_valid(raise_exception=True)
-            message = await self._create_message(user_id=self.user.id, **serializer.validated_data)
+            data = serializer.validated_data
+            channel = self.message_channels.get(data.pop('channel_id'))
+
+            if not channel:
+                raise ValidationError("User is not participating in this channel")
+
+            message = MessageSerializer(await message_create_async(user=self.user,
+                                                                   channel=channel,
+                                                                   write_behind=message_write_behind_enabled(channel),
+                                                                   **data)).data
 
         except ValidationError as e:
             return await self.send_error_message(detail=e.detail,
                                                  method="message_create",
                                                  channel_id=self.user_channel)
 
-        await self.send_message(channel_id=data.get('channel_id'), message=message)
+        await self.send_message(channel_id=message['channel_id'], message=message)
 
     @database_sync_to_async
     def _update_message(self, *,
@@ -193,6 +210,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
         serializer = InputSerializer(data=data)
         try:
             serializer.is_valid(raise_exception=True)
+            await message_write_behind.flush()  # The message may still be queued
             message = await self._update_message(user_id=self.user.id, **serializer.validated_data)
 
         except ValidationError as e:
@@ -217,6 +235,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
         try:
             serializer.is_valid(raise_exception=True)
+            await message_write_behind.flush()  # The message may still be queued
             message = await self._delete_message(user_id=self.user.id, **serializer.validated_data)
 
         except ValidationError as e:
@@ -236,26 +255,45 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
         try:
             serializer.is_valid(raise_exception=True)
-            await MessageChannelParticipant.objects.aget(user=self.user,
-                                                         channel_id=data['channel_id'])
 
         except ValidationError as e:
             return await self.send_error_message(detail=e.detail,
                                                  method="message_notify",
                                                  channel_id=self.user_channel)
 
-        except MessageChannelParticipant.DoesNotExist:
+        if serializer.validated_data['channel_id'] not in self.message_channels:
             return await self.send_error_message(detail="User is not participating in this channel",
                                                  method="message_notify",
                                                  channel_id=self.user_channel)
 
-        data = serializer.validated_data
-        message = self.generate_status_message(channel_id=data['channel_id'],
-                                               user_id=self.user.id,
-                                               message=data['action'],
-                                               method='message_notify')
+        # Sent along with the next presence update of the channel, repeated events are coalesced
+        chat_presence.typing(user_id=self.user.id, channel_id=serializer.validated_data['channel_id'])
+
+    # Lists the users that are online in a channel
+    async def presence_list(self, data: dict):
+        class InputSerializer(serializers.Serializer):
+            channel_id = serializers.IntegerField()
+
+        serializer = InputSerializer(data=data)
+
+        try:
+            serializer.is_valid(raise_exception=True)
+
+        except ValidationError as e:
+            return await self.send_error_message(detail=e.detail,
+                                                 method="presence_list",
+                                                 channel_id=self.user_channel)
 
-        await self.send_message(channel_id=str(data['channel_id']), message=message)
+        channel_id = serializer.validated_data['channel_id']
+        if channel_id not in self.message_channels:
+            return await self.send_error_message(detail="User is not participating in this channel",
+                                                 method="presence_list",
+                                                 channel_id=self.user_channel)
+
+        await self.send_message(channel_id=self.user_channel,
+                                message=dict(method="presence_list",
+                                             channel_id=channel_id,
+                                             online=await chat_presence.online(channel_id)))
 
     # Allows user to add/remove channels without reconnecting, for e.g. joining and leaving a group
     async def connect_channel(self, data, disconnect=False):
@@ -267,12 +305,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
         data = serializer.validated_data
         channel_id = data.get('channel_id')
 
-        if not disconnect and channel_id in await self.get_participating_channels():
-            await self.channel_layer.group_add(f"{channel_id}", self.channel_name)
-            self.participating_channels.append(f"{channel_id}")
+        if not disconnect and (channel := (await self.get_participating_channels()).get(channel_id)):
+            await self.join_channel(channel)
 
-        elif disconnect and channel_id in self.participating_channels:
-            await self.channel_layer.group_discard(f"{channel_id}", self.channel_name)
+        elif disconnect and channel_id in self.message_channels:
+            await self.leave_channel(channel_id)
 
         else:
             await self.channel_layer.group_send(self.user_channel,
@@ -281,3 +318,24 @@ class ChatConsumer(AsyncWebsocketConsumer):
                                                      message="Unknown operation"))
 
         return True
+
+    async def join_channel(self, channel: MessageChannel):
+        self.message_channels[channel.id] = channel
+        await self.subscriptions.update(chat_channel_groups(user_id=self.user.id, channel_ids=self.message_channels))
+        await chat_presence.join(connection=self.channel_name, channel_id=channel.id)
+
+    async def leave_channel(self, channel_id: int):
+        self.message_channels.pop(channel_id, None)
+        await self.subscriptions.update(chat_channel_groups(user_id=self.user.id, channel_ids=self.message_channels))
+        await chat_presence.leave(connection=self.channel_name, channel_id=channel_id)
+
+    # Keeps the verified memberships of the connection up to date, sent by the MessageChannelParticipant signals
+    async def channel_membership(self, content: dict):
+        if content['active']:
+            channel = await MessageChannel.objects.only('id', 'origin_name', 'title').filter(
+                id=content['channel_id']).afirst()
+            if channel:
+                await self.join_channel(channel)
+
+        else:
+            await self.leave_channel(content['channel_id'])
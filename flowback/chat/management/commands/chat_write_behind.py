@@ -0,0 +1,27 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+from redis import asyncio as redis
+
+from backend.settings import FLOWBACK_CHAT_REDIS_URL
+from flowback.chat.write_behind import message_write_behind_recover, RECOVERY_GRACE
+
+
+class Command(BaseCommand):
+    help = 'Saves the chat messages left in the write-behind stream by crashed processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=RECOVERY_GRACE,
+                            help='Only recover messages queued at least this many seconds ago, 0 recovers every '
+                                 'message (only while no ASGI process is running)')
+
+    def handle(self, *args, grace: int, **options):
+        async def recover():
+            client = redis.from_url(FLOWBACK_CHAT_REDIS_URL)
+            try:
+                return await message_write_behind_recover(client, grace=grace)
+
+            finally:
+                await client.close()
+
+        self.stdout.write(self.style.SUCCESS(f'Recovered {asyncio.run(recover())} chat message(s)'))
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.17 on 2026-10-18 05:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_message_type'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['channel', 'created_at', 'id'], name='message_channel_created_at_idx'),
+        ),
+    ]
@@ -56,3 +56,7 @@ class Message(BaseModel):
                                     blank=True)  # TODO instead of MessageFileCollection, use FileCollection directly
     parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='message_parent')
     active = models.BooleanField(default=True)
+
+    class Meta:
+        # Message history is paginated by (created_at, id) within a channel, see CursorPagination
+        indexes = [models.Index(fields=['channel', 'created_at', 'id'], name='message_channel_created_at_idx')]
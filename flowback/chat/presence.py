@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+
+from redis import asyncio as redis
+
+from backend.settings import (FLOWBACK_CHAT_REDIS_URL,
+                              FLOWBACK_CHAT_PRESENCE_INTERVAL,
+                              FLOWBACK_CHAT_PRESENCE_TTL,
+                              FLOWBACK_CHAT_TYPING_INTERVAL)
+from flowback.chat.protocol import chat_frame
+from flowback.chat.subscriptions import chat_channel_send
+
+# Presence and typing indicators of the chat.
+#
+# Online state is shared by every process through Redis: each user has a sorted set of their connections and each
+# channel a sorted set of its online users, both scored by the time they expire. Processes refresh the scores of their
+# own connections every third of FLOWBACK_CHAT_PRESENCE_TTL, so connections of a crashed process expire on their own.
+# The online users of a channel are read from the set of the channel alone, after dropping its expired entries. The
+# connections of a user in each channel are kept apart as well, so a user leaving a channel on one connection stays
+# online there while another of their connections (e.g. a second tab) is still in it.
+#
+# Changes are not broadcast one by one: every FLOWBACK_CHAT_PRESENCE_INTERVAL milliseconds each channel with changes
+# gets one "presence" message listing the users that came online, went offline or are typing. Typing is only
+# forwarded once every FLOWBACK_CHAT_TYPING_INTERVAL milliseconds per user and channel, the rest is coalesced.
+
+logger = logging.getLogger(__name__)
+
+
+def _user_key(user_id: int) -> str:
+    return f'chat:presence:user:{user_id}'
+
+
+def _channel_key(channel_id: int) -> str:
+    return f'chat:presence:channel:{channel_id}'
+
+
+def _member_key(channel_id: int, user_id: int) -> str:
+    return f'chat:presence:channel:{channel_id}:user:{user_id}'
+
+
+class ChatPresence:
+    """The presence state of the connections of this process, see chat_presence"""
+
+    def __init__(self):
+        self.client = None
+        self.channel_layer = None
+        self.flusher = None
+        self.connections: dict[str, tuple[int, set[int]]] = {}  # Connection: user id, channel ids
+        self.deltas = defaultdict(lambda: dict(online=set(), offline=set(), typing=set()))
+        self.typing_sent: dict[tuple[int, int], float] = {}
+
+    def start(self, channel_layer):
+        if self.flusher and not self.flusher.done():
+            return
+
+        self.channel_layer = channel_layer
+        self.client = redis.from_url(FLOWBACK_CHAT_REDIS_URL)
+        self.flusher = asyncio.create_task(self.run())
+
+    async def connect(self, channel_layer, *, user_id: int, connection: str, channel_ids: list[int]) -> None:
+        self.start(channel_layer)
+        self.connections[connection] = (user_id, set(channel_ids))
+        expires = time.time() + FLOWBACK_CHAT_PRESENCE_TTL
+
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zcount(_user_key(user_id), time.time(), '+inf')
+        pipe.zadd(_user_key(user_id), {connection: expires})
+        pipe.expire(_user_key(user_id), FLOWBACK_CHAT_PRESENCE_TTL)
+        for channel_id in channel_ids:
+            pipe.zadd(_channel_key(channel_id), {user_id: expires})
+            pipe.expire(_channel_key(channel_id), FLOWBACK_CHAT_PRESENCE_TTL)
+            pipe.zadd(_member_key(channel_id, user_id), {connection: expires})
+            pipe.expire(_member_key(channel_id, user_id), FLOWBACK_CHAT_PRESENCE_TTL)
+        online_connections, *_ = await pipe.execute()
+
+        if not online_connections:
+            for channel_id in channel_ids:
+                self.deltas[channel_id]['online'].add(user_id)
+
+    async def disconnect(self, *, connection: str) -> None:
+        if connection not in self.connections:
+            return
+
+        user_id, channel_ids = self.connections.pop(connection)
+
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zrem(_user_key(user_id), connection)
+        pipe.zcount(_user_key(user_id), time.time(), '+inf')
+        for channel_id in channel_ids:
+            pipe.zrem(_member_key(channel_id, user_id), connection)
+        _, online_connections, *_ = await pipe.execute()
+
+        # The user stays online while they have other connections
+        if online_connections:
+            return
+
+        pipe = self.client.pipeline(transaction=False)
+        for channel_id in channel_ids:
+            pipe.zrem(_channel_key(channel_id), user_id)
+            self.deltas[channel_id]['offline'].add(user_id)
+        await pipe.execute()
+
+    async def join(self, *, connection: str, channel_id: int) -> None:
+        if connection not in self.connections:
+            return
+
+        user_id, channel_ids = self.connections[connection]
+        channel_ids.add(channel_id)
+        expires = time.time() + FLOWBACK_CHAT_PRESENCE_TTL
+
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zadd(_channel_key(channel_id), {user_id: expires})
+        pipe.zadd(_member_key(channel_id, user_id), {connection: expires})
+        pipe.expire(_member_key(channel_id, user_id), FLOWBACK_CHAT_PRESENCE_TTL)
+        await pipe.execute()
+
+        self.deltas[channel_id]['online'].add(user_id)
+
+    async def leave(self, *, connection: str, channel_id: int) -> None:
+        if connection not in self.connections:
+            return
+
+        user_id, channel_ids = self.connections[connection]
+        channel_ids.discard(channel_id)
+
+        # Atomic, so that of connections leaving at once (every connection of the user gets the membership change)
+        # exactly the last one finds none left
+        pipe = self.client.pipeline(transaction=True)
+        pipe.zrem(_member_key(channel_id, user_id), connection)
+        pipe.zcount(_member_key(channel_id, user_id), time.time(), '+inf')
+        _, member_connections = await pipe.execute()
+
+        # The user stays online in the channel while they have other connections in it
+        if member_connections:
+            return
+
+        await self.client.zrem(_channel_key(channel_id), user_id)
+        self.deltas[channel_id]['offline'].add(user_id)
+
+    async def online(self, channel_id: int) -> list[int]:
+        """The users that are online in the channel"""
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zremrangebyscore(_channel_key(channel_id), 0, time.time())
+        pipe.zrange(_channel_key(channel_id), 0, -1)
+        _, user_ids = await pipe.execute()
+
+        return [int(user_id) for user_id in user_ids]
+
+    def typing(self, *, user_id: int, channel_id: int) -> bool:
+        """Queues a typing event, returns False if it was coalesced with one sent less than an interval ago"""
+        now = time.monotonic()
+        sent = self.typing_sent.get((user_id, channel_id))
+        if sent is not None and now - sent < FLOWBACK_CHAT_TYPING_INTERVAL / 1000:
+            return False
+
+        self.typing_sent[(user_id, channel_id)] = now
+        self.deltas[channel_id]['typing'].add(user_id)
+        return True
+
+    async def flush(self, channel_layer) -> None:
+        """Sends the queued presence changes, one message per channel"""
+        deltas, self.deltas = self.deltas, defaultdict(lambda: dict(online=set(), offline=set(), typing=set()))
+
+        await asyncio.gather(*[chat_channel_send(channel_layer, channel_id, chat_frame(dict(
+            type="message",
+            method="presence",
+            channel_id=channel_id,
+            **{state: sorted(user_ids) for state, user_ids in delta.items() if user_ids})))
+                               for channel_id, delta in deltas.items()])
+
+        # Forget typing events that can't coalesce anymore
+        expired = time.monotonic() - FLOWBACK_CHAT_TYPING_INTERVAL / 1000
+        self.typing_sent = {key: sent for key, sent in self.typing_sent.items() if sent > expired}
+
+    async def refresh(self) -> None:
+        """Keeps the connections of this process (and their users in their channels) online"""
+        if not self.connections:
+            return
+
+        expires = time.time() + FLOWBACK_CHAT_PRESENCE_TTL
+        pipe = self.client.pipeline(transaction=False)
+
+        for connection, (user_id, channel_ids) in self.connections.items():
+            pipe.zadd(_user_key(user_id), {connection: expires})
+            pipe.expire(_user_key(user_id), FLOWBACK_CHAT_PRESENCE_TTL)
+            for channel_id in channel_ids:
+                pipe.zadd(_channel_key(channel_id), {user_id: expires})
+                pipe.expire(_channel_key(channel_id), FLOWBACK_CHAT_PRESENCE_TTL)
+                pipe.zadd(_member_key(channel_id, user_id), {connection: expires})
+                pipe.expire(_member_key(channel_id, user_id), FLOWBACK_CHAT_PRESENCE_TTL)
+
+        await pipe.execute()
+
+    async def run(self):
+        refreshed = time.monotonic()
+
+        while True:
+            await asyncio.sleep(FLOWBACK_CHAT_PRESENCE_INTERVAL / 1000)
+
+            try:
+                await self.flush(self.channel_layer)
+
+                if time.monotonic() - refreshed > FLOWBACK_CHAT_PRESENCE_TTL / 3:
+                    await self.refresh()
+                    refreshed = time.monotonic()
+
+            except Exception:
+                logger.exception('Failed to update chat presence')
+
+
+chat_presence = ChatPresence()
@@ -0,0 +1,63 @@
+import json
+
+import msgpack
+from django.core.serializers.json import DjangoJSONEncoder
+
+# Wire protocols of the chat websocket, picked by the client through the websocket subprotocol.
+#
+# JSON (the default, when the client asks for no subprotocol) sends every message as a text frame, as it always has.
+# MessagePack sends binary frames in which user objects are replaced by their id: the profile of each user is sent in a
+# separate {"type": "user", ...} frame, once per connection (or again when it changed).
+#
+# Messages that are broadcast are encoded by the sender, once for every recipient, see chat_frame.
+
+JSON = 'flowback.json'
+MSGPACK = 'flowback.msgpack'
+
+
+def _reference_users(content, users: dict):
+    if isinstance(content, dict):
+        user = content.get('user')
+        if isinstance(user, dict) and 'id' in user:
+            users[user['id']] = user
+
+        return {key: user['id'] if key == 'user' and isinstance(user, dict) and 'id' in user
+                else _reference_users(value, users)
+                for key, value in content.items()}
+
+    if isinstance(content, (list, tuple)):
+        return [_reference_users(value, users) for value in content]
+
+    return content
+
+
+def chat_frame(content: dict) -> dict:
+    """
+    Encodes a channel-layer message for ChatConsumer.message in every wire protocol, so that a broadcast is encoded
+    once rather than by each recipient
+    """
+    if 'frame' in content:
+        return content
+
+    users = {}
+    body = _reference_users(content, users)
+
+    return dict(type=content.get('type') or 'message',
+                frame=dict(json=json.dumps(content, cls=DjangoJSONEncoder),
+                           msgpack=msgpack.packb(body, default=str),
+                           users={str(user_id): msgpack.packb(dict(type='user', **user), default=str)
+                                  for user_id, user in users.items()}))
+
+
+def chat_decode(*, text_data: str = None, bytes_data: bytes = None) -> dict:
+    """Decodes a frame from the client, raises ValueError if it isn't an object in either protocol"""
+    try:
+        data = msgpack.unpackb(bytes_data) if bytes_data is not None else json.loads(text_data or '{}')
+
+    except (ValueError, TypeError, msgpack.UnpackException) as e:
+        raise ValueError(str(e))
+
+    if not isinstance(data, dict):
+        raise ValueError('Expected an object')
+
+    return data
@@ -1,8 +1,11 @@
+from asgiref.sync import sync_to_async
 from django.contrib.admin import action
+from django.db.models import prefetch_related_objects
 from django.shortcuts import get_object_or_404
 from django.utils.datetime_safe import datetime
 from rest_framework.exceptions import ValidationError
 
+from flowback.chat.write_behind import message_write_behind
 from flowback.chat.models import MessageChannel, Message, MessageChannelParticipant, MessageFileCollection, \
     MessageChannelTopic
 from flowback.common.services import get_object, model_update
@@ -52,11 +55,67 @@ def message_create(*,
     return message
 
 
+async def message_create_async(*,
+                               user: User,
+                               channel: MessageChannel,
+                               message: str,
+                               attachments_id: int = None,
+                               parent_id: int = None,
+                               topic_id: int = None,
+                               write_behind: bool = False) -> Message:
+    """
+    message_create for callers that have already verified that the user participates in the channel (see
+    ChatConsumer). Plain messages cost a single INSERT, the parent, topic and attachments are only queried when given.
+    The relations of the returned message are loaded, so MessageSerializer can run in an async context.
+
+    With write_behind, the message is queued instead of saved (see flowback.chat.write_behind).
+    """
+    if len(message) > Message._meta.get_field('message').max_length:
+        raise ValidationError("Message is too long")
+
+    parent = topic = attachments = None
+
+    if parent_id:
+        parent = await (Message.objects.select_related('user', 'channel', 'topic', 'attachments__file_collection')
+                        .filter(id=parent_id, channel=channel, topic_id=topic_id).afirst())
+
+        if not parent:
+            raise ValidationError("Parent does not exist")
+
+    if topic_id:
+        topic = await MessageChannelTopic.objects.filter(id=topic_id, channel=channel).afirst()
+
+        if not topic:
+            raise ValidationError("Topic does not exist")
+
+    if attachments_id:
+        attachments = await (MessageFileCollection.objects.select_related('file_collection')
+                             .filter(id=attachments_id).afirst())
+
+        if not attachments:
+            raise ValidationError("Attachments does not exist")
+
+        if attachments.user_id != user.id and attachments.channel_id != channel.id:
+            raise ValidationError("Unauthorized usage of Attachments")
+
+    # File segments are serialized along with the attachments of the message and its parent
+    collections = [collection for collection in (attachments, parent and parent.attachments) if collection]
+    if collections:
+        await sync_to_async(prefetch_related_objects)(collections, 'file_collection__filesegment_set')
+
+    message = Message(user=user, channel=channel, message=message, attachments=attachments, parent=parent, topic=topic)
+
+    if write_behind:
+        return await message_write_behind.enqueue(message)
+
+    await message.asave(force_insert=True)
+    return message
+
+
 def message_update(*, user_id: int, message_id: int, **data):
-    user = get_object(User, id=user_id)
     message = get_object(Message, id=message_id, active=True)
 
-    if not user == message.user:
+    if not user_id == message.user_id:
         raise ValidationError('User is not author of message')
 
     fields = ['message']
@@ -67,10 +126,9 @@ def message_update(*, user_id: int, message_id: int, **data):
 
 
 def message_delete(*, user_id: int, message_id: int):
-    user = get_object(User, id=user_id)
     message = get_object(Message, id=message_id, active=True)
 
-    if not user == message.user:
+    if not user_id == message.user_id:
         raise ValidationError('User is not author of message')
 
     message.message = ""
@@ -5,6 +5,7 @@ from django.dispatch import receiver
 
 from backend.settings import TESTING
 from flowback.chat.models import MessageChannelParticipant, Message
+from flowback.chat.subscriptions import chat_channel_send, chat_user_group
 
 
 @receiver(post_save, sender=MessageChannelParticipant)
@@ -20,13 +21,20 @@ def message_channel_participant_post_save(sender, instance, created, update_fiel
             channel_layer = get_channel_layer()
 
             # Send the message to the group
-            async_to_sync(channel_layer.group_send)(
-                f"{instance.channel.id}",
+            async_to_sync(chat_channel_send)(
+                channel_layer,
+                instance.channel_id,
                 dict(type="info",
                      method="message_notify",
                      message=f"User {instance.user.username} {'joined' if instance.active else 'left'} the channel")
             )
 
+            # Update the verified memberships of the user's connections, see ChatConsumer.channel_membership
+            async_to_sync(channel_layer.group_send)(
+                chat_user_group(instance.user_id),
+                dict(type="channel_membership", channel_id=instance.channel_id, active=instance.active)
+            )
+
         Message.objects.create(user=instance.user,
                                channel=instance.channel,
                                message=f"User {instance.user.username} {'joined' if instance.active else 'left'}"
@@ -40,13 +48,19 @@ def message_channel_participant_post_delete(sender, instance, **kwargs):
         channel_layer = get_channel_layer()
 
         # Send the message to the group
-        async_to_sync(channel_layer.group_send)(
-            f"{instance.channel.id}",
+        async_to_sync(chat_channel_send)(
+            channel_layer,
+            instance.channel_id,
             dict(type="info",
                  method="message_notify",
                  message=f"User {instance.user.username} joined the channel")
         )
 
+        async_to_sync(channel_layer.group_send)(
+            chat_user_group(instance.user_id),
+            dict(type="channel_membership", channel_id=instance.channel_id, active=False)
+        )
+
     Message.objects.create(user=instance.user,
                            channel=instance.channel,
                            message=f"User {instance.user.username} left the channel",
@@ -0,0 +1,87 @@
+import asyncio
+import time
+from collections import defaultdict
+from typing import Iterable
+
+from channels_redis.core import RedisChannelLayer
+
+from backend.settings import FLOWBACK_CHAT_FAN_IN
+from flowback.chat.models import MessageChannelParticipant
+
+
+def chat_user_group(user_id: int) -> str:
+    return f"user_{user_id}"
+
+
+def chat_channel_groups(*, user_id: int, channel_ids: Iterable[int]) -> set[str]:
+    """
+    The channel-layer groups of a connection: the group of its user, and the group of every channel the user
+    participates in unless FLOWBACK_CHAT_FAN_IN is set, in which case channel messages are sent to the group of each
+    participant instead (see chat_channel_send)
+    """
+    return {chat_user_group(user_id)} | (set() if FLOWBACK_CHAT_FAN_IN else {str(channel_id)
+                                                                           for channel_id in channel_ids})
+
+
+async def chat_channel_send(channel_layer, channel_id: int, message: dict) -> None:
+    if not FLOWBACK_CHAT_FAN_IN:
+        return await channel_layer.group_send(str(channel_id), message)
+
+    user_ids = [user_id async for user_id in MessageChannelParticipant.objects.filter(
+        channel_id=channel_id, active=True).values_list('user_id', flat=True)]
+    await asyncio.gather(*[channel_layer.group_send(chat_user_group(user_id), message) for user_id in user_ids])
+
+
+class ChatSubscriptions:
+    """
+    The channel-layer groups of one connection. Changes are applied as a diff against the groups the connection is
+    already in, and on the Redis channel layer the operations on each shard are sent in a single pipeline instead of
+    one round trip per group.
+    """
+
+    def __init__(self, channel_layer, channel_name: str):
+        self.channel_layer = channel_layer
+        self.channel_name = channel_name
+        self.groups: set[str] = set()
+
+    async def update(self, groups: Iterable[str]) -> None:
+        """Moves the connection into exactly the given groups"""
+        groups = set(groups)
+        add, discard = groups - self.groups, self.groups - groups
+
+        if not add and not discard:
+            return
+
+        if isinstance(self.channel_layer, RedisChannelLayer):
+            await self._pipeline(add=add, discard=discard)
+
+        else:
+            await asyncio.gather(*[self.channel_layer.group_add(group, self.channel_name) for group in add],
+                                 *[self.channel_layer.group_discard(group, self.channel_name) for group in discard])
+
+        self.groups = groups
+
+    async def _pipeline(self, *, add: set[str], discard: set[str]) -> None:
+        layer: RedisChannelLayer = self.channel_layer
+        shards = defaultdict(lambda: ([], []))
+
+        for operation, groups in enumerate((add, discard)):
+            for group in groups:
+                assert layer.valid_group_name(group), "Group name not valid"
+                shards[layer.consistent_hash(group)][operation].append(layer._group_key(group))
+
+        # Same commands as RedisChannelLayer.group_add and group_discard
+        async def execute(index: int, add_keys: list[bytes], discard_keys: list[bytes]):
+            pipe = layer.connection(index).pipeline(transaction=False)
+            now = time.time()
+
+            for key in add_keys:
+                pipe.zadd(key, {self.channel_name: now})
+                pipe.expire(key, layer.group_expiry)
+
+            for key in discard_keys:
+                pipe.zrem(key, self.channel_name)
+
+            await pipe.execute()
+
+        await asyncio.gather(*[execute(index, *keys) for index, keys in shards.items()])
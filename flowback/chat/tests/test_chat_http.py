@@ -1,8 +1,14 @@
+import unittest
 from pprint import pprint
+from urllib.parse import urlparse, parse_qs
 
+from asgiref.sync import async_to_sync
+from django.db import connection
 from django.test import TransactionTestCase
 from django.utils import timezone
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
 from rest_framework.test import APIRequestFactory, force_authenticate
 
 from ..models import (MessageChannel,
@@ -11,7 +17,9 @@ from ..models import (MessageChannel,
                       MessageChannelTopic,
                       MessageFileCollection)
 
+from ..serializers import MessageSerializer
 from ..services import (message_create,
+                        message_create_async,
                         message_update,
                         message_delete,
                         message_channel_create,
@@ -24,8 +32,10 @@ from .factories import (MessageChannelFactory,
                         MessageChannelParticipantFactory,
                         MessageChannelTopicFactory,
                         MessageFileCollectionFactory)
+from ..write_behind import _message_reserve_ids, _message_dump, _message_load, message_bulk_save
 from ..views import MessageListAPI, MessageChannelPreviewAPI, MessageChannelParticipantListAPI
-from ...common.tests import generate_request
+from ...common.pagination import CursorPagination, LimitOffsetPagination
+from ...common.tests import generate_request, benchmark, RUN_BENCHMARKS
 from ...user.tests.factories import UserFactory
 
 
@@ -79,6 +89,54 @@ class ChatTestHTTP(TransactionTestCase):
         self.assertEqual(message_one.user.id, self.message_channel_participant_one.user.id)
         self.assertEqual(message_one.attachments_id, self.message_channel_file_collection.id)
 
+    def test_message_create_async(self):
+        user = self.message_channel_participant_one.user
+        parent = MessageFactory(user=self.message_channel_participant_two.user, channel=self.message_channel)
+
+        # Plain messages are a single INSERT, and serialize without querying
+        with self.assertNumQueries(1):
+            message = async_to_sync(message_create_async)(user=user, channel=self.message_channel, message="test")
+            data = MessageSerializer(message).data
+
+        self.assertEqual((data['user']['id'], data['channel_id'], data['message']),
+                         (user.id, self.message_channel.id, "test"))
+
+        message = async_to_sync(message_create_async)(user=user,
+                                                      channel=self.message_channel,
+                                                      message="reply",
+                                                      parent_id=parent.id,
+                                                      attachments_id=self.message_channel_file_collection.id)
+        with self.assertNumQueries(0):
+            data = MessageSerializer(message).data
+
+        self.assertEqual(data['parent']['id'], parent.id)
+        self.assertEqual(Message.objects.get(id=data['id']).attachments_id, self.message_channel_file_collection.id)
+
+        with self.assertRaises(ValidationError):
+            async_to_sync(message_create_async)(user=user, channel=MessageChannelFactory(), message="test",
+                                                parent_id=parent.id)
+
+    def test_message_write_behind_save(self):
+        user = self.message_channel_participant_one.user
+        ids = _message_reserve_ids(3)
+        messages = [Message(id=message_id, user=user, channel=self.message_channel, message=f"test {message_id}",
+                            created_at=timezone.now()) for message_id in ids]
+
+        # Messages are saved with their reserved id, and saving them again (e.g. on recovery) is skipped
+        queued = [_message_load(_message_dump(message)) for message in messages]
+        self.assertEqual(message_bulk_save(queued), [])
+        self.assertEqual(message_bulk_save(queued), [])
+        self.assertEqual(list(Message.objects.filter(id__in=ids).order_by('id').values_list('message', flat=True)),
+                         [message.message for message in messages])
+
+        # Messages that can't be saved are dropped without the rest of the batch
+        message = Message(id=_message_reserve_ids(1)[0], user=user, channel_id=0, message="test",
+                          created_at=timezone.now(), updated_at=timezone.now())
+        valid = Message(id=_message_reserve_ids(1)[0], user=user, channel=self.message_channel, message="test",
+                        created_at=timezone.now(), updated_at=timezone.now())
+        self.assertEqual(message_bulk_save([message, valid]), [message])
+        self.assertTrue(Message.objects.filter(id=valid.id).exists())
+
     def test_message_update(self):
         message = MessageFactory()
 
@@ -109,6 +167,43 @@ class ChatTestHTTP(TransactionTestCase):
 
         self.assertEqual(response.data.get('count'), 10)
 
+    def test_message_list_cursor(self):
+        messages = [MessageFactory(user=self.message_channel_participant_one.user,
+                                   channel=self.message_channel) for x in range(25)]
+        Message.objects.filter(id__in=[message.id for message in messages[:10]]).update(created_at=timezone.now())
+
+        user = self.message_channel_participant_one.user
+        data = dict(limit=10, cursor='')
+        pages = []
+
+        while True:
+            response = generate_request(api=MessageListAPI,
+                                        data=data,
+                                        url_params=dict(channel_id=self.message_channel.id),
+                                        user=user)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+            pages.append(response.data)
+
+            if not response.data['next']:
+                break
+
+            data['cursor'] = parse_qs(urlparse(response.data['next']).query)['cursor'][0]
+
+        # Newest first, messages sharing created_at are neither skipped nor repeated
+        expected = list(Message.objects.filter(channel=self.message_channel)
+                        .order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual([message['id'] for page in pages for message in page['results']], expected)
+        self.assertEqual(len(pages), 3)
+        self.assertEqual([page['count'] for page in pages], [len(expected), None, None])
+
+        # Without a cursor the list is paginated by limit/offset as before
+        response = generate_request(api=MessageListAPI,
+                                    data=dict(limit=10),
+                                    url_params=dict(channel_id=self.message_channel.id),
+                                    user=user)
+        self.assertEqual((response.data['offset'], response.data['count']), (0, len(expected)))
+        self.assertEqual([message['id'] for message in response.data['results']], expected[:10])
+
     def test_message_channel_preview(self):
         # Test if there's correct amount of messages
         for i in range(10):
@@ -195,3 +290,47 @@ class ChatTestHTTP(TransactionTestCase):
                                     user=self.user_one)
 
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN, response.data)
+
+
+@unittest.skipUnless(RUN_BENCHMARKS, 'Set FLOWBACK_RUN_BENCHMARKS to run benchmarks')
+class MessageListBenchmark(TransactionTestCase):
+    size = 200_000
+    depths = (0, 1_000, 10_000, 100_000, 190_000)
+
+    def setUp(self):
+        self.participant = MessageChannelParticipantFactory()
+        now = timezone.now()
+        Message.objects.bulk_create([Message(user=self.participant.user,
+                                             channel=self.participant.channel,
+                                             message=f'message {i}',
+                                             created_at=now - timezone.timedelta(seconds=i))
+                                     for i in range(self.size)], batch_size=10_000)
+
+        # Give the planner statistics for the bulk inserted rows, as autovacuum would in production
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Message._meta.db_table}')
+
+    @staticmethod
+    def paginate(pagination_class, queryset, **data):
+        request = Request(APIRequestFactory().get('', data=dict(limit=50, **data)))
+        return pagination_class().paginate_queryset(queryset, request)
+
+    def test_message_list_depth_benchmark(self):
+        messages = Message.objects.filter(channel=self.participant.channel).order_by('-created_at', '-id')
+
+        for depth in self.depths:
+            offset = benchmark(self.paginate, LimitOffsetPagination, messages, offset=depth)
+            cursor = dict(cursor='')
+
+            if depth:
+                last = messages.values('created_at', 'id')[depth - 1]
+                cursor = dict(cursor=CursorPagination.encode_cursor([last['created_at'], last['id']]))
+
+            keyset = benchmark(self.paginate, CursorPagination, messages, **cursor)
+
+            self.assertEqual([message.id for message in self.paginate(LimitOffsetPagination, messages, offset=depth)],
+                             [message.id for message in self.paginate(CursorPagination, messages, **cursor)])
+
+            print(f"\nMessage list, {self.size} messages, depth {depth}: "
+                  f"offset {offset['seconds'] * 1000:.1f}ms ({offset['queries']} queries), "
+                  f"cursor {keyset['seconds'] * 1000:.1f}ms ({keyset['queries']} queries)")
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import time
+import unittest
+
+import msgpack
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer
+from channels_redis.core import RedisChannelLayer
+from django.test import SimpleTestCase
+
+from backend.settings import CHANNEL_LAYERS
+from ..presence import ChatPresence
+from ..protocol import chat_frame, chat_decode
+from ..subscriptions import ChatSubscriptions
+from ...common.tests import RUN_BENCHMARKS
+
+
+class ChatSubscriptionsTest(SimpleTestCase):
+    def test_chat_subscriptions_update(self):
+        layer = InMemoryChannelLayer()
+
+        async def run():
+            channel_name = await layer.new_channel()
+            subscriptions = ChatSubscriptions(layer, channel_name)
+
+            await subscriptions.update(['user_1', '1', '2'])
+            await subscriptions.update(['user_1', '2', '3'])
+            await layer.group_send('1', dict(type='message', text='left'))
+            await layer.group_send('3', dict(type='message', text='joined'))
+            received = await layer.receive(channel_name)
+
+            await subscriptions.update(())
+            return subscriptions.groups, received, {group for group, channels in layer.groups.items() if channels}
+
+        groups, received, remaining = async_to_sync(run)()
+        self.assertEqual(received['text'], 'joined')
+        self.assertEqual(groups, set())
+        self.assertEqual(remaining, set())
+
+
+class ChatPresenceTest(SimpleTestCase):
+    def test_chat_presence_typing(self):
+        layer = InMemoryChannelLayer()
+        presence = ChatPresence()
+
+        async def run():
+            channel_name = await layer.new_channel()
+            await layer.group_add('1', channel_name)
+
+            # Repeated typing events of a user in a channel are coalesced, other users and channels are not
+            sent = [presence.typing(user_id=user_id, channel_id=channel_id)
+                    for user_id, channel_id in ((1, 1), (1, 1), (2, 1), (1, 2), (2, 1))]
+
+            await presence.flush(layer)
+            return sent, await layer.receive(channel_name)
+
+        sent, message = async_to_sync(run)()
+        message = json.loads(message['frame']['json'])
+        self.assertEqual(sent, [True, False, True, True, False])
+        self.assertEqual((message['method'], message['channel_id'], message['typing']), ('presence', 1, [1, 2]))
+        self.assertNotIn('online', message)
+
+
+class ChatProtocolTest(SimpleTestCase):
+    def test_chat_frame(self):
+        user = dict(id=1, username='lorem', profile_image=None)
+        content = dict(type='message', id=2, user=user, message='ipsum', parent=dict(id=1, user=user))
+        frame = chat_frame(content)['frame']
+
+        # JSON is sent as is, MessagePack references the users and carries their profiles apart
+        self.assertEqual(json.loads(frame['json']), content)
+        self.assertEqual(msgpack.unpackb(frame['msgpack']), dict(content, user=1, parent=dict(id=1, user=1)))
+        self.assertEqual({user_id: msgpack.unpackb(profile) for user_id, profile in frame['users'].items()},
+                         {'1': dict(type='user', **user)})
+
+        self.assertEqual(chat_decode(bytes_data=msgpack.packb(dict(method='message_create'))),
+                         dict(method='message_create'))
+        self.assertEqual(chat_decode(text_data='{"method": "message_create"}'), dict(method='message_create'))
+        for frame in (dict(text_data='[]'), dict(text_data='{'), dict(bytes_data=b'\xc1')):
+            with self.assertRaises(ValueError):
+                chat_decode(**frame)
+
+
+@unittest.skipUnless(RUN_BENCHMARKS, 'Set FLOWBACK_RUN_BENCHMARKS to run benchmarks')
+class ChatReconnectBenchmark(SimpleTestCase):
+    """Reconnect storm against the Redis channel layer in CHANNEL_LAYERS (e.g. after a deploy)"""
+    connections = 500
+    groups = 200
+
+    async def reconnect(self, layer: RedisChannelLayer, pipelined: bool) -> float:
+        groups = [f"benchmark_{i}" for i in range(self.groups)]
+        channel_names = [await layer.new_channel() for _ in range(self.connections)]
+
+        async def connect(channel_name: str):
+            if pipelined:
+                await ChatSubscriptions(layer, channel_name).update(groups)
+
+            else:
+                for group in groups:
+                    await layer.group_add(group, channel_name)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[connect(channel_name) for channel_name in channel_names])
+        seconds = time.perf_counter() - start
+
+        await layer.flush()
+        return seconds
+
+    def test_chat_reconnect_benchmark(self):
+        layer = RedisChannelLayer(**CHANNEL_LAYERS['default']['CONFIG'], prefix='benchmark')
+
+        per_group = async_to_sync(self.reconnect)(layer, pipelined=False)
+        pipelined = async_to_sync(self.reconnect)(layer, pipelined=True)
+
+        print(f"\nChat reconnect storm, {self.connections} connections in {self.groups} groups: "
+              f"group_add per group {per_group * 1000:.0f}ms, pipelined {pipelined * 1000:.0f}ms")
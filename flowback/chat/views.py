@@ -6,12 +6,12 @@ from .selectors import message_list, message_channel_preview_list, message_chann
     message_channel_participant_list
 from .serializers import MessageSerializer, BasicMessageSerializer
 from .services import message_channel_userdata_update, message_channel_leave, message_files_upload
-from flowback.common.pagination import get_paginated_response, LimitOffsetPagination
+from flowback.common.pagination import get_paginated_response, LimitOffsetPagination, CursorPagination
 from ..user.serializers import BasicUserSerializer
 
 
 class MessageListAPI(APIView):
-    class Pagination(LimitOffsetPagination):
+    class Pagination(CursorPagination):
         default_limit = 50
         max_limit = 50
 
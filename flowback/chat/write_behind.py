@@ -0,0 +1,205 @@
+import asyncio
+import json
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.db import connection, IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from redis import asyncio as redis
+
+from backend.settings import (FLOWBACK_CHAT_WRITE_BEHIND_ORIGINS,
+                              FLOWBACK_CHAT_WRITE_BEHIND_INTERVAL,
+                              FLOWBACK_CHAT_WRITE_BEHIND_BATCH_SIZE,
+                              FLOWBACK_CHAT_REDIS_URL)
+from flowback.chat.models import Message
+
+# Write-behind persistence of chat messages.
+#
+# Messages to channels with an origin in FLOWBACK_CHAT_WRITE_BEHIND_ORIGINS are broadcast by ChatConsumer as soon as
+# they're validated, and saved by a flusher in the event loop of the process every
+# FLOWBACK_CHAT_WRITE_BEHIND_INTERVAL milliseconds, or once FLOWBACK_CHAT_WRITE_BEHIND_BATCH_SIZE messages are queued.
+# Their ids are reserved from the Message sequence up front, so the id that is broadcast is the one that is saved.
+#
+# Every queued message is appended to a Redis stream before it's broadcast and removed once saved. Entries that are
+# still in the stream after RECOVERY_GRACE seconds were left by a crashed process, every running flusher looks for them
+# once per RECOVERY_GRACE seconds (and manage.py chat_write_behind saves them on demand). Saving is idempotent, since
+# the ids are fixed.
+#
+# Messages are saved in the order they were queued, which keeps the order of each channel within a process.
+
+logger = logging.getLogger(__name__)
+
+STREAM = 'chat:message:write_behind'
+RECOVERY_GRACE = 60
+ID_BLOCK_SIZE = 100
+
+
+def message_write_behind_enabled(channel) -> bool:
+    return channel.origin_name in FLOWBACK_CHAT_WRITE_BEHIND_ORIGINS
+
+
+def _message_reserve_ids(amount: int) -> list[int]:
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT nextval(pg_get_serial_sequence('{Message._meta.db_table}', 'id')) "
+                       f"FROM generate_series(1, %s)", [amount])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _message_dump(message: Message) -> str:
+    return json.dumps(dict(id=message.id,
+                           user_id=message.user_id,
+                           channel_id=message.channel_id,
+                           type=message.type,
+                           topic_id=message.topic_id,
+                           message=message.message,
+                           attachments_id=message.attachments_id,
+                           parent_id=message.parent_id,
+                           active=message.active,
+                           created_at=message.created_at.isoformat()))
+
+
+def _message_load(data: str) -> Message:
+    data = json.loads(data)
+    data['created_at'] = parse_datetime(data['created_at'])
+
+    return Message(updated_at=data['created_at'], **data)
+
+
+def message_bulk_save(messages: list[Message]) -> list[Message]:
+    """
+    Saves queued messages, skipping the ones that are saved already. If the batch fails (e.g. the channel of a message
+    was deleted meanwhile), the messages are saved one by one and the ones that fail are dropped.
+
+    :return: the messages that were dropped
+    """
+    try:
+        with transaction.atomic():
+            Message.objects.bulk_create(messages, ignore_conflicts=True)
+        return []
+
+    except IntegrityError:
+        dropped = []
+        for message in messages:
+            try:
+                with transaction.atomic():
+                    Message.objects.bulk_create([message], ignore_conflicts=True)
+
+            except IntegrityError:
+                dropped.append(message)
+
+        logger.warning('Dropped %s queued chat message(s) that could not be saved: %s',
+                       len(dropped), [message.id for message in dropped])
+        return dropped
+
+
+async def message_write_behind_recover(client: redis.Redis, grace: int = RECOVERY_GRACE) -> int:
+    """
+    Saves the messages left in the stream by crashed processes, older than grace seconds
+
+    :return: amount of recovered messages
+    """
+    recovered = 0
+    end = f'{int((time.time() - grace) * 1000)}'
+
+    while entries := await client.xrange(STREAM, min='-', max=end, count=FLOWBACK_CHAT_WRITE_BEHIND_BATCH_SIZE):
+        await sync_to_async(message_bulk_save)([_message_load(fields[b'message']) for _, fields in entries])
+        await client.xdel(STREAM, *[entry_id for entry_id, _ in entries])
+        recovered += len(entries)
+
+    if recovered:
+        logger.warning('Recovered %s queued chat message(s) left by a crashed process', recovered)
+
+    return recovered
+
+
+class MessageWriteBehind:
+    """The write-behind queue of the process, see message_write_behind"""
+
+    def __init__(self):
+        self.queue: list[tuple[bytes, Message]] = []
+        self.reserved_ids: list[int] = []
+        self.client = None
+        self.flusher = None
+        self.wake = None
+        self.lock = None
+
+    def start(self):
+        if self.flusher and not self.flusher.done():
+            return
+
+        self.client = redis.from_url(FLOWBACK_CHAT_REDIS_URL)
+        self.wake = asyncio.Event()
+        self.lock = asyncio.Lock()
+        self.flusher = asyncio.create_task(self.run())
+
+    async def enqueue(self, message: Message) -> Message:
+        """Reserves an id for the message and queues it, the message can be broadcast once this returns"""
+        self.start()
+
+        if not self.reserved_ids:
+            self.reserved_ids = await sync_to_async(_message_reserve_ids)(ID_BLOCK_SIZE)
+
+        message.id = self.reserved_ids.pop(0)
+        message.created_at = message.updated_at = timezone.now()
+
+        entry_id = await self.client.xadd(STREAM, dict(message=_message_dump(message)))
+        self.queue.append((entry_id, message))
+
+        if len(self.queue) >= FLOWBACK_CHAT_WRITE_BEHIND_BATCH_SIZE:
+            self.wake.set()
+
+        return message
+
+    async def flush(self) -> None:
+        """Saves every queued message"""
+        if not self.lock:
+            return
+
+        async with self.lock:
+            while self.queue:
+                batch = self.queue[:FLOWBACK_CHAT_WRITE_BEHIND_BATCH_SIZE]
+                start = time.perf_counter()
+
+                await sync_to_async(message_bulk_save)([message for _, message in batch])
+                await self.client.xdel(STREAM, *[entry_id for entry_id, _ in batch])
+                del self.queue[:len(batch)]
+
+                logger.debug('Saved %s queued chat message(s) in %.1f ms',
+                             len(batch), (time.perf_counter() - start) * 1000)
+
+    async def recover(self) -> None:
+        try:
+            await message_write_behind_recover(self.client)
+
+        except Exception:
+            logger.exception('Failed to recover queued chat messages')
+
+    async def run(self):
+        await self.recover()
+        recovered = time.monotonic()
+
+        while True:
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout=FLOWBACK_CHAT_WRITE_BEHIND_INTERVAL / 1000)
+
+            except asyncio.TimeoutError:
+                pass
+
+            self.wake.clear()
+
+            # Failed batches stay queued (and in the stream), they're retried on the next flush
+            try:
+                await self.flush()
+
+            except Exception:
+                logger.exception('Failed to save queued chat messages')
+
+            # Messages of processes that crashed since are only left in the stream
+            if time.monotonic() - recovered > RECOVERY_GRACE:
+                await self.recover()
+                recovered = time.monotonic()
+
+
+message_write_behind = MessageWriteBehind()
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from flowback.comment.models import Comment, CommentVote
+from flowback.common.counters import COUNTERS, counter_reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the score of every comment from its vote counters (e.g. after a migration)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--counters', action='store_true',
+                            help='Rebuild the vote counters from the votes first')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Comments updated per query')
+
+    def handle(self, *args, counters: bool, batch_size: int, **options):
+        if counters:
+            for counter in COUNTERS:
+                if counter.model is CommentVote:
+                    rebuilt = counter_reconcile(counter, rebuild=True)
+                    self.stdout.write(f'{counter.name}: rebuilt {rebuilt} counter(s)')
+
+        last_id, updated = 0, 0
+        while ids := list(Comment.objects.filter(id__gt=last_id).order_by('id')
+                          .values_list('id', flat=True)[:batch_size]):
+            updated += Comment.objects.filter(id__range=(ids[0], ids[-1])).update(score=Comment.wilson_score())
+            last_id = ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Recomputed the score of {updated} comment(s)'))
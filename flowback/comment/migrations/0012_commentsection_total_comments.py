@@ -0,0 +1,32 @@
+# Generated by Django 4.2.17 on 2026-10-18 05:32
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count(model, parent: str, **condition):
+    return Coalesce(Subquery(model.objects.filter(**{parent: OuterRef('pk')}, **condition)
+                             .values(parent).annotate(total=Count('*')).values('total')[:1]), 0)
+
+
+def pre_populate_fields(apps, schema_editor):
+    CommentSection = apps.get_model('comment', 'commentsection')
+    Comment = apps.get_model('comment', 'comment')
+    CommentSection.objects.update(total_comments=count(Comment, 'comment_section_id', active=True))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comment', '0011_alter_comment_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commentsection',
+            name='total_comments',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(pre_populate_fields, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.17 on 2026-10-18 05:51
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count(model, parent: str, **condition):
+    return Coalesce(Subquery(model.objects.filter(**{parent: OuterRef('pk')}, **condition)
+                             .values(parent).annotate(total=Count('*')).values('total')[:1]), 0)
+
+
+def pre_populate_fields(apps, schema_editor):
+    Comment = apps.get_model('comment', 'comment')
+    CommentVote = apps.get_model('comment', 'commentvote')
+    Comment.objects.update(positive_votes=count(CommentVote, 'comment_id', vote=True),
+                           negative_votes=count(CommentVote, 'comment_id', vote=False))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comment', '0012_commentsection_total_comments'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='negative_votes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='positive_votes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(pre_populate_fields, migrations.RunPython.noop),
+    ]
@@ -1,15 +1,17 @@
-from math import sqrt
-
 from django.db import models
-from django.db.models import Q, Count
+from django.db.models import Q, F, Case, When, Value
+from django.db.models.functions import Cast, Sqrt
+from django.db.models.lookups import Exact
 from django.db.models.signals import post_save, post_delete
 from tree_queries.models import TreeNode
 
+from flowback.common.counters import ModelCounter, counter_register
 from flowback.common.models import BaseModel
 
 
 class CommentSection(BaseModel):
     active = models.BooleanField(default=True)
+    total_comments = models.IntegerField(default=0)  # Active comments, see counter_register below
 
 
 class Comment(BaseModel, TreeNode):
@@ -21,35 +23,48 @@ class Comment(BaseModel, TreeNode):
     active = models.BooleanField(default=True)
     score = models.DecimalField(default=0, max_digits=17, decimal_places=10)
 
+    # Vote totals, see counter_register below
+    positive_votes = models.IntegerField(default=0)
+    negative_votes = models.IntegerField(default=0)
+    counter_fields = ('positive_votes', 'negative_votes')
+
+    def save(self, *args, **kwargs):
+        # Counters (and the score derived from them) are only written by database updates, saving an instance loaded
+        # before a vote would overwrite them
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred_fields = self.get_deferred_fields()
+            kwargs['update_fields'] = [field.attname for field in self._meta.concrete_fields
+                                       if not field.primary_key
+                                       and field.attname not in deferred_fields
+                                       and field.name not in (*self.counter_fields, 'score')]
+
+        super().save(*args, **kwargs)
+
     @classmethod
     def comment_save(cls, instance, created, *args, **kwargs):
         if created:
             CommentVote.objects.create(comment=instance, created_by=instance.author, vote=True)
 
-    # Updates score based on Wilson score interval when creating/deleting comment votes
-    @classmethod
-    def comment_score_update(cls, instance, *args, **kwargs):
-        comment = Comment.objects.filter(id=instance.comment.id
-                                         ).annotate(upvotes=Count('commentvote',
-                                                                  filter=Q(commentvote__vote=True)),
-                                                    downvotes=Count('commentvote',
-                                                                    filter=Q(commentvote__vote=False))
-                                                    ).first()
-
-        n = comment.upvotes + comment.downvotes
-
-        if n == 0 or comment.upvotes - comment.downvotes == 0:
-            return 0
+    # Lower bound of the Wilson score interval of the vote counters, as a database expression. Comments with as many
+    # positive as negative votes (or none) score 0
+    @staticmethod
+    def wilson_score(positive=F('positive_votes'), negative=F('negative_votes'), z: float = 1.281551565545):
+        positive, negative = Cast(positive, models.FloatField()), Cast(negative, models.FloatField())
+        n = positive + negative
+        p = positive / n
 
-        z = 1.281551565545
-        p = float(comment.upvotes) / n
+        left = p + z * z / (2 * n)
+        right = z * Sqrt(p * (1 - p) / n + z * z / (4 * n * n))
+        under = 1 + z * z / n
 
-        left = p + 1 / (2 * n) * z * z
-        right = z * sqrt(p * (1 - p) / n + z * z / (4 * n * n))
-        under = 1 + 1 / n * z * z
+        return Case(When(Exact(positive, negative), then=Value(0.0)),
+                    default=(left - right) / under,
+                    output_field=models.FloatField())
 
-        comment.score = (left - right) / under
-        comment.save()
+    # Updates score based on Wilson score interval when creating/deleting comment votes, after the vote counters
+    @classmethod
+    def comment_score_update(cls, instance, *args, **kwargs):
+        Comment.objects.filter(id=instance.comment_id).update(score=cls.wilson_score())
 
     class Meta:
         constraints = [models.CheckConstraint(check=Q(attachments__isnull=False) | Q(message__isnull=False),
@@ -57,8 +72,11 @@ class Comment(BaseModel, TreeNode):
 
 
 post_save.connect(Comment.comment_save, sender=Comment)
-post_save.connect(Comment.comment_score_update, sender="comment.CommentVote")
-post_delete.connect(Comment.comment_score_update, sender="comment.CommentVote")
+counter_register(ModelCounter(counter_model=CommentSection,
+                              field='total_comments',
+                              model=Comment,
+                              parent='comment_section_id',
+                              condition=dict(active=True)))
 
 
 class CommentVote(BaseModel):
@@ -70,6 +88,20 @@ class CommentVote(BaseModel):
         constraints = [models.UniqueConstraint(fields=['comment', 'created_by'], name='comment_vote_unique')]
 
 
+counter_register(ModelCounter(counter_model=Comment,
+                              field='positive_votes',
+                              model=CommentVote,
+                              parent='comment_id',
+                              condition=dict(vote=True)))
+counter_register(ModelCounter(counter_model=Comment,
+                              field='negative_votes',
+                              model=CommentVote,
+                              parent='comment_id',
+                              condition=dict(vote=False)))
+post_save.connect(Comment.comment_score_update, sender=CommentVote)
+post_delete.connect(Comment.comment_score_update, sender=CommentVote)
+
+
 def comment_section_create(*, active: bool = True) -> CommentSection:
     comments = CommentSection(active=active)
     comments.full_clean()
@@ -1,5 +1,5 @@
 import django_filters
-from django.db.models import OuterRef, Subquery, Sum, Case, When, Q, Count
+from django.db.models import OuterRef, Subquery, F, prefetch_related_objects
 
 from flowback.comment.models import Comment, CommentVote
 from flowback.user.models import User
@@ -42,8 +42,7 @@ def comment_list(*, fetched_by: User, comment_section_id: int, filters=None):
         qs = Comment.objects.filter(comment_section_id=comment_section_id)
 
     qs = qs.annotate(user_vote=Subquery(user_vote),
-                     raw_score=Count('commentvote', filter=Q(commentvote__vote=True)) -
-                               Count('commentvote', filter=Q(commentvote__vote=False))).all()
+                     raw_score=F('positive_votes') - F('negative_votes')).all()
     return BaseCommentFilter(filters, qs).qs
 
 
@@ -54,7 +53,90 @@ def comment_ancestor_list(*, fetched_by: User, comment_section_id: int, comment_
           .ancestors(include_self=True)
           .reverse()
           .annotate(user_vote=Subquery(user_vote),
-                    raw_score=Count('commentvote', filter=Q(commentvote__vote=True)) -
-                              Count('commentvote', filter=Q(commentvote__vote=False))).all())
+                    raw_score=F('positive_votes') - F('negative_votes')).all())
 
     return qs
+
+
+COMMENT_TREE_ORDERING = {'created_at_asc': 'created_at ASC, id ASC',
+                         'created_at_desc': 'created_at DESC, id DESC',
+                         'score_asc': 'score ASC, id ASC',
+                         'score_desc': 'score DESC, id DESC'}
+
+
+def comment_tree(*,
+                 fetched_by: User,
+                 comment_section_id: int,
+                 parent_id: int = None,
+                 order_by: str = 'score_desc',
+                 depth: int = 2,
+                 replies: int = 3,
+                 limit: int = 20,
+                 offset: int = 0) -> tuple[list[Comment], int]:
+    """
+    A page of comments (top-level, or the replies of parent_id) with their replies nested in `replies`: the first
+    `replies` replies of every comment, down to `depth` levels below the page. Every comment has `depth`,
+    `total_replies` (all direct replies, to tell if more can be loaded), `raw_score` and `user_vote`.
+
+    The tree is loaded in one recursive query, the votes of the user in one lookup for the whole tree.
+
+    :return: the comments of the page, and the total amount of comments the page is taken from
+    """
+    ordering = COMMENT_TREE_ORDERING[order_by]
+    table = Comment._meta.db_table
+    parent = 'parent_id IS NULL' if parent_id is None else 'parent_id = %(parent_id)s'
+
+    comments = list(Comment.objects.raw(f"""
+        WITH RECURSIVE page AS (
+            SELECT id, row_number() OVER (ORDER BY {ordering}) AS rank, count(*) OVER () AS total_count
+            FROM {table}
+            WHERE comment_section_id = %(comment_section_id)s
+              AND {parent}
+            ORDER BY {ordering}
+            LIMIT %(limit)s OFFSET %(offset)s
+        ), tree AS (
+            SELECT id, 0 AS depth, ARRAY[rank] AS path, total_count FROM page
+            UNION ALL
+            SELECT reply.id, tree.depth + 1, tree.path || reply.rank, tree.total_count
+            FROM tree CROSS JOIN LATERAL (
+                SELECT id, row_number() OVER (ORDER BY {ordering}) AS rank
+                FROM {table}
+                WHERE parent_id = tree.id
+                ORDER BY {ordering}
+                LIMIT %(replies)s
+            ) reply
+            WHERE tree.depth < %(depth)s
+        )
+        SELECT comment.*,
+               tree.depth,
+               tree.total_count,
+               comment.positive_votes - comment.negative_votes AS raw_score,
+               (SELECT count(*) FROM {table} WHERE parent_id = comment.id) AS total_replies
+        FROM tree JOIN {table} comment ON comment.id = tree.id
+        ORDER BY tree.path
+    """, dict(comment_section_id=comment_section_id, parent_id=parent_id, depth=depth, replies=replies,
+              limit=limit, offset=offset)))
+
+    prefetch_related_objects(comments, 'author', 'attachments__filesegment_set')
+    user_votes = dict(CommentVote.objects.filter(created_by=fetched_by, comment_id__in=[c.id for c in comments])
+                      .values_list('comment_id', 'vote'))
+
+    page, parents = [], {}
+    for comment in comments:
+        comment.user_vote = user_votes.get(comment.id)
+        comment.replies = []
+        parents[comment.id] = comment
+
+        if comment.depth == 0:
+            page.append(comment)
+
+        else:
+            parents[comment.parent_id].replies.append(comment)
+
+    if comments:
+        total_count = comments[0].total_count
+
+    else:
+        total_count = Comment.objects.filter(comment_section_id=comment_section_id, parent_id=parent_id).count()
+
+    return page, total_count
@@ -24,7 +24,7 @@ class CommentFactory(factory.django.DjangoModelFactory):
     def post(self, create, extracted, **kwargs):
         if score := kwargs.get('score'):
             self.score = score
-            self.save()
+            self.save(update_fields=['score'])
 
 
 class CommentVoteFactory(factory.django.DjangoModelFactory):
@@ -1,12 +1,15 @@
+from io import StringIO
+
+from django.core.management import call_command
 from rest_framework.exceptions import ValidationError
 from rest_framework import status
 from rest_framework.test import APITransactionTestCase, APIRequestFactory, force_authenticate
 
-from flowback.comment.models import Comment, CommentSection
-from flowback.comment.selectors import comment_list
+from flowback.comment.models import Comment, CommentSection, CommentVote
+from flowback.comment.selectors import comment_list, comment_tree
 from flowback.comment.services import comment_delete, comment_update
 from flowback.comment.tests.factories import CommentSectionFactory, CommentFactory, CommentVoteFactory
-from flowback.comment.views import CommentListAPI, CommentVoteAPI, CommentAncestorListAPI
+from flowback.comment.views import CommentListAPI, CommentVoteAPI, CommentAncestorListAPI, CommentTreeAPI
 from flowback.user.tests.factories import UserFactory
 
 
@@ -77,6 +80,48 @@ class CommentSectionTest(APITransactionTestCase):
                         'Comments are not ordered by ancestors')
 
 
+    def test_comment_tree(self):
+        comment, comment_b, comment_c = [CommentFactory(comment_section=self.comment_section, post__score=score)
+                                         for score in (5, 9, 1)]
+        replies = [CommentFactory(comment_section=self.comment_section, parent=comment, post__score=score)
+                   for score in (1, 3, 2)]
+        reply_1 = CommentFactory(comment_section=self.comment_section, parent=replies[1])
+        CommentFactory(comment_section=self.comment_section, parent=reply_1)
+
+        # Votes update the score as well, comment_c stays last
+        CommentVoteFactory(comment=comment_c, created_by=comment_b.author, vote=False)
+        CommentVoteFactory(comment=comment_c, vote=False)
+
+        with self.assertNumQueries(3):
+            page, total_count = comment_tree(fetched_by=comment_b.author,
+                                             comment_section_id=self.comment_section.id,
+                                             replies=2)
+
+        self.assertEqual(total_count, 3)
+        self.assertEqual([c.id for c in page], [comment_b.id, comment.id, comment_c.id])
+        self.assertEqual([c.id for c in page[1].replies], [replies[1].id, replies[2].id])
+        self.assertEqual(page[1].total_replies, 3)
+        self.assertEqual(page[2].raw_score, -1)
+        self.assertEqual(page[2].user_vote, False)
+        self.assertEqual(page[0].user_vote, True)
+
+        # Depth is counted from the page, replies of reply_1 are not loaded
+        self.assertEqual([c.id for c in page[1].replies[0].replies], [reply_1.id])
+        self.assertEqual(page[1].replies[0].replies[0].replies, [])
+        self.assertEqual(page[1].replies[0].replies[0].total_replies, 1)
+
+        # A page of replies, through the API
+        factory = APIRequestFactory()
+        request = factory.get('', data=dict(parent_id=comment.id, order_by='created_at_asc', depth=0, limit=2))
+        force_authenticate(request, user=comment.author)
+        response = CommentTreeAPI.as_view()(request, comment_section_id=self.comment_section.id)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual([c['id'] for c in response.data['results']], [replies[0].id, replies[1].id])
+        self.assertEqual(response.data['results'][1]['replies'], [])
+        self.assertIsNotNone(response.data['next'])
+
     def test_comment_update(self):
         user_one = UserFactory()
         user_two = UserFactory()
@@ -105,6 +150,35 @@ class CommentSectionTest(APITransactionTestCase):
 
         comment_delete(fetched_by=user_one.id, comment_section_id=self.comment_section, comment_id=comment.id)
 
+    def test_comment_score_recompute(self):
+        comment: Comment = CommentFactory(comment_section=self.comment_section)
+        CommentVoteFactory.create_batch(39, comment=comment, vote=True)
+        negative_votes = CommentVoteFactory.create_batch(20, comment=comment, vote=False)
+
+        # Wilson score of 40 positive and 20 negative votes
+        comment.refresh_from_db()
+        self.assertEqual((comment.positive_votes, comment.negative_votes), (40, 20))
+        self.assertAlmostEqual(float(comment.score), 0.5851513139, places=9)
+
+        # Votes written in bulk bypass the counters and the score
+        CommentVote.objects.filter(id__in=[vote.id for vote in negative_votes]).update(vote=True)
+        call_command('comment_scores', counters=True, batch_size=1, stdout=StringIO())
+
+        comment.refresh_from_db()
+        self.assertEqual((comment.positive_votes, comment.negative_votes), (60, 0))
+        self.assertAlmostEqual(float(comment.score), 0.9733564057, places=9)
+
+        CommentVote.objects.filter(id__in=[vote.id for vote in negative_votes[:10]]).delete()
+        self.assertAlmostEqual(float(Comment.objects.get(id=comment.id).score), 0.9681971553, places=9)
+
+        # Saving an instance loaded before a vote keeps the counters and score of the vote
+        CommentVoteFactory(comment=comment, vote=False)
+        comment.message = 'edited'
+        comment.save()
+
+        comment.refresh_from_db()
+        self.assertEqual((comment.message, comment.positive_votes, comment.negative_votes), ('edited', 50, 1))
+        self.assertAlmostEqual(float(comment.score), 0.9366926374, places=9)
 
     # Test if the algorithm prioritizes potentially higher score comments
     def test_comment_vote(self):
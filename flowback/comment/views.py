@@ -4,7 +4,7 @@ from rest_framework import serializers, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from flowback.comment.selectors import comment_list, comment_ancestor_list
+from flowback.comment.selectors import comment_list, comment_ancestor_list, comment_tree, COMMENT_TREE_ORDERING
 from flowback.comment.services import comment_create, comment_update, comment_delete, comment_vote
 from flowback.common.pagination import LimitOffsetPagination, get_paginated_response
 from flowback.files.serializers import FileSerializer
@@ -83,6 +83,49 @@ class CommentAncestorListAPI(APIView):
                                       view=self)
 
 
+# Returns a page of comments with their replies nested, see comment_tree
+class CommentTreeAPI(APIView):
+    lazy_action = comment_tree
+
+    class Pagination(LimitOffsetPagination):
+        default_limit = 20
+        max_limit = 100
+
+    class FilterSerializer(serializers.Serializer):
+        order_by = serializers.ChoiceField(choices=list(COMMENT_TREE_ORDERING), default='score_desc')
+        parent_id = serializers.IntegerField(required=False)
+        depth = serializers.IntegerField(min_value=0, max_value=10, default=2)
+        replies = serializers.IntegerField(min_value=0, max_value=50, default=3)
+
+    class OutputSerializer(CommentListAPI.OutputSerializer):
+        depth = serializers.IntegerField()
+        total_replies = serializers.IntegerField()
+
+        def get_fields(self):
+            fields = super().get_fields()
+            fields['replies'] = self.__class__(many=True)
+
+            return fields
+
+    def get(self, request, *args, **kwargs):
+        serializer = self.FilterSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+
+        paginator = self.Pagination()
+        paginator.request = request
+        paginator.limit = paginator.get_limit(request)
+        paginator.offset = paginator.get_offset(request)
+
+        comments, paginator.count = self.lazy_action.__func__(fetched_by=request.user,
+                                                              limit=paginator.limit,
+                                                              offset=paginator.offset,
+                                                              *args,
+                                                              **kwargs,
+                                                              **serializer.validated_data)
+
+        return paginator.get_paginated_response(self.OutputSerializer(comments, many=True).data)
+
+
 class CommentCreateAPI(APIView):
     lazy_action = comment_create
 
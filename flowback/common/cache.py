@@ -0,0 +1,74 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core.cache import cache
+
+# Request scoped memoization.
+#
+# Selectors that run several times during one request (e.g. permission checks) can keep their results in
+# request_cache(namespace). The cache only exists inside request_cache_scope, which RequestCacheMiddleware opens for
+# every HTTP request, everywhere else (celery tasks, websocket consumers, tests) request_cache returns None and
+# nothing is memoized.
+
+_request_cache: ContextVar[dict | None] = ContextVar('request_cache', default=None)
+
+
+@contextmanager
+def request_cache_scope():
+    token = _request_cache.set({})
+
+    try:
+        yield
+
+    finally:
+        _request_cache.reset(token)
+
+
+def request_cache(namespace: str) -> dict | None:
+    cache = _request_cache.get()
+    if cache is None:
+        return None
+
+    return cache.setdefault(namespace, {})
+
+
+def request_cache_clear(namespace: str) -> None:
+    cache = _request_cache.get()
+    if cache is not None:
+        cache.pop(namespace, None)
+
+
+class RequestCacheMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with request_cache_scope():
+            return self.get_response(request)
+
+
+# Versioned keys for the shared cache.
+#
+# Entries depending on a version key include its current value in their own key, so bumping the version makes all of
+# them unreachable at once without finding and deleting them, they expire on their own.
+
+
+def cache_versions(*keys: str) -> list[int]:
+    versions = cache.get_many(keys)
+
+    for key in keys:
+        if key not in versions:
+            # Missing versions (new or evicted) start at a fresh value, stale entries are never reachable again
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key, 0)
+
+    return [versions[key] for key in keys]
+
+
+def cache_version_bump(key: str) -> None:
+    try:
+        cache.incr(key)
+
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
@@ -0,0 +1,110 @@
+from dataclasses import dataclass, field as dataclass_field
+from functools import partial
+from typing import Type
+
+from django.db import models
+from django.db.models import F, Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import pre_save, post_save, post_delete
+
+# Denormalized counters.
+#
+# A counter stores the amount of rows of a model belonging to a parent (e.g. the proposals of a poll) in a column of
+# counter_model, whose primary key is the parent id. Side tables are used for parents that are saved as a whole
+# elsewhere, so a stale instance can't overwrite the count (unless the parent leaves its counters out of full saves,
+# see Comment.save). Counters follow every save and delete through signals,
+# within the transaction of the caller, rows written with bulk_create or queryset.update are not counted until
+# counter_reconcile (manage.py counters) runs.
+
+COUNTERS: list['ModelCounter'] = []
+
+
+@dataclass(frozen=True)
+class ModelCounter:
+    counter_model: Type[models.Model]
+    field: str
+    model: Type[models.Model]  # The counted model
+    parent: str  # Field of the counted model holding the parent id
+    condition: dict = dataclass_field(default_factory=dict)  # Rows are only counted while matching these values
+
+    @property
+    def name(self) -> str:
+        return f'{self.counter_model._meta.label}.{self.field}'
+
+    def rows(self) -> models.QuerySet:
+        return self.model.objects.filter(**self.condition)
+
+    def counted(self, instance) -> bool:
+        return all(getattr(instance, key) == value for key, value in self.condition.items())
+
+
+def counter_add(counter: ModelCounter, *, parent_id: int | None, delta: int) -> None:
+    if not parent_id or not delta:
+        return
+
+    rows = counter.counter_model.objects.filter(pk=parent_id)
+    if rows.update(**{counter.field: F(counter.field) + delta}) or delta < 0:
+        return
+
+    # Side tables (keyed by their parent) get their row along with the first counted row, decrements never create one
+    # (e.g. while the parent is being deleted)
+    if not counter.counter_model._meta.pk.is_relation:
+        return
+
+    counter.counter_model.objects.get_or_create(pk=parent_id)
+    rows.update(**{counter.field: F(counter.field) + delta})
+
+
+def _counter_pre_save(counter: ModelCounter, sender, instance, raw=False, **kwargs):
+    # Rows without a condition are counted for as long as they exist
+    if raw or instance._state.adding or not counter.condition:
+        return
+
+    instance.__dict__.setdefault('_counted', {})[counter.name] = counter.rows().filter(pk=instance.pk).exists()
+
+
+def _counter_post_save(counter: ModelCounter, sender, instance, created, raw=False, **kwargs):
+    if raw or not (created or counter.condition):
+        return
+
+    was_counted = False if created else instance.__dict__.get('_counted', {}).pop(counter.name, False)
+    counter_add(counter, parent_id=getattr(instance, counter.parent), delta=counter.counted(instance) - was_counted)
+
+
+def _counter_post_delete(counter: ModelCounter, sender, instance, **kwargs):
+    counter_add(counter, parent_id=getattr(instance, counter.parent), delta=-counter.counted(instance))
+
+
+def counter_register(counter: ModelCounter) -> None:
+    COUNTERS.append(counter)
+
+    for signal, receiver in ((pre_save, _counter_pre_save),
+                             (post_save, _counter_post_save),
+                             (post_delete, _counter_post_delete)):
+        signal.connect(partial(receiver, counter), sender=counter.model, weak=False, dispatch_uid=counter.name)
+
+
+def counter_reconcile(counter: ModelCounter, *, rebuild: bool = False) -> int:
+    """
+    Compares the counter of every parent with a full count, and replaces the ones that differ if rebuild is set.
+
+    :return: amount of parents whose counter differed (or was missing)
+    """
+    counter_rows = counter.counter_model.objects
+    actual = Coalesce(Subquery(counter.rows().filter(**{counter.parent: OuterRef('pk')})
+                               .values(counter.parent)
+                               .annotate(total=Count('*'))
+                               .values('total')[:1]), 0)
+
+    missing = set(counter.rows().filter(**{f'{counter.parent}__isnull': False})
+                  .exclude(**{f'{counter.parent}__in': counter_rows.values('pk')})
+                  .values_list(counter.parent, flat=True).distinct())
+    mismatched = list(counter_rows.annotate(actual=actual).exclude(**{counter.field: F('actual')})
+                      .values_list('pk', flat=True))
+
+    if rebuild:
+        counter_rows.bulk_create([counter.counter_model(pk=parent_id) for parent_id in missing],
+                                 ignore_conflicts=True)
+        counter_rows.filter(pk__in=[*mismatched, *missing]).update(**{counter.field: actual})
+
+    return len(mismatched) + len(missing)
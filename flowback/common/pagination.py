@@ -1,7 +1,12 @@
+import json
+from base64 import urlsafe_b64encode, urlsafe_b64decode
 from collections import OrderedDict
 
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import LimitOffsetPagination as _LimitOffsetPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 # Default pagination getter for list views
@@ -46,4 +51,129 @@ class LimitOffsetPagination(_LimitOffsetPagination):
             ('next', self.get_next_link()),
             ('previous', self.get_previous_link()),
             ('results', data)
-        ]))
\ No newline at end of file
+        ]))
+
+
+# Keyset pagination for list views with deep scrolling (chat history, notifications, home feed)
+class CursorPagination(LimitOffsetPagination):
+    """
+    Pages through the queryset by its ordering instead of OFFSET: the cursor holds the ordering values of the last
+    row of the previous page, and the next page continues after it. The ordering of the queryset (or `ordering` if it
+    has none) is used, with the primary key added as tiebreaker. Ordering fields must be non-nullable.
+
+    Keyset pagination is opt-in: it's used when the request passes `cursor` (empty for the first page), every other
+    request is paginated by limit/offset as before. The total count is only included on the first page, or on any page
+    with `count=true`, `count=false` leaves it out entirely.
+    """
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    ordering = ('-created_at',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view=view)
+
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.offset = None
+        self.count = None
+
+        # Combined querysets can only be ordered by their columns, which have no pk alias
+        tiebreaker = 'id' if queryset.query.combinator else 'pk'
+        ordering = list(queryset.query.order_by or self.ordering)
+        if not {field.lstrip('-') for field in ordering} & {tiebreaker, queryset.model._meta.pk.name}:
+            ordering.append(f'-{tiebreaker}' if ordering[0].startswith('-') else tiebreaker)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        count = request.query_params.get(self.count_query_param, '').lower()
+        if count == 'true' or (not cursor and count != 'false'):
+            self.count = self.get_count(queryset)
+
+        if cursor:
+            queryset = self._filter_after(queryset, ordering, self.decode_cursor(cursor))
+
+        page = list(queryset.order_by(*ordering)[:self.limit + 1])
+        self.next_cursor = (self.encode_cursor([self._value(page[self.limit - 1], field.lstrip('-'))
+                                                for field in ordering])
+                            if len(page) > self.limit else None)
+
+        return page[:self.limit]
+
+    @staticmethod
+    def _value(row, field: str):
+        if isinstance(row, dict):
+            return row[field]
+
+        for attribute in field.split('__'):
+            row = getattr(row, attribute)
+
+        return row
+
+    @staticmethod
+    def _keyset_condition(ordering: list[str], values: list) -> Q:
+        """
+        Rows after the given values in the ordering: a >= x AND ((a > x) OR (a = x AND b > y) OR ...), the redundant
+        bound on the first field lets the database seek an index on the ordering instead of filtering every row
+        """
+        condition = Q(pk__in=[])
+
+        for i, field in enumerate(ordering):
+            name = field.lstrip('-')
+            q = Q(**{f"{name}__{'lt' if field.startswith('-') else 'gt'}": values[i]})
+
+            for previous, value in zip(ordering[:i], values[:i]):
+                q &= Q(**{previous.lstrip('-'): value})
+
+            condition |= q
+
+        first = ordering[0]
+        return Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": values[0]}) & condition
+
+    def _filter_after(self, queryset, ordering: list[str], values: list):
+        if len(values) != len(ordering):
+            raise NotFound('Invalid cursor')
+
+        condition = self._keyset_condition(ordering, values)
+
+        if not queryset.query.combinator:
+            return queryset.filter(condition)
+
+        # Combined querysets (e.g. UNION) can't be filtered, filter every part before combining them again
+        parts = []
+        for query in queryset.query.combined_queries:
+            part = queryset.__class__(model=query.model, query=query.clone())
+            part._iterable_class, part._fields = queryset._iterable_class, queryset._fields
+            parts.append(part.filter(condition))
+
+        combine = getattr(parts[0], queryset.query.combinator)
+        return combine(*parts[1:], all=queryset.query.combinator_all)
+
+    @staticmethod
+    def encode_cursor(values: list) -> str:
+        # Datetimes keep their microseconds, DjangoJSONEncoder would round them to milliseconds
+        return urlsafe_b64encode(json.dumps(values, default=lambda value: value.isoformat()
+                                            if hasattr(value, 'isoformat') else str(value)).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> list:
+        try:
+            return json.loads(urlsafe_b64decode(cursor.encode()))
+
+        except (ValueError, TypeError):
+            raise NotFound('Invalid cursor')
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+
+        if not self.next_cursor:
+            return None
+
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_previous_link(self):
+        if not self.keyset:
+            return super().get_previous_link()
+
+        return None
@@ -1,6 +1,9 @@
 import inspect
-from typing import Type
+import os
+import time
+from typing import Type, Callable
 
+from django.db import connection
 from faker import Faker
 from rest_framework.test import APIRequestFactory, force_authenticate
 from rest_framework.views import APIView
@@ -9,6 +12,10 @@ from flowback.user.models import User
 
 fake = Faker()
 
+# Benchmarks are regular test cases that are skipped unless this environment variable is set
+RUN_BENCHMARKS = bool(os.environ.get('FLOWBACK_RUN_BENCHMARKS'))
+BENCHMARK_SIZE = int(os.environ.get('FLOWBACK_BENCHMARK_SIZE', 500))
+
 
 def generate_request(api: Type[APIView],
                      data: dict = None,
@@ -36,3 +43,21 @@ def generate_request(api: Type[APIView],
         force_authenticate(request, user=user)
 
     return view(request, **url_params)
+
+
+def benchmark(func: Callable, *args, **kwargs) -> dict:
+    """Calls func once, returns the wall time in seconds and the amount of queries that were executed"""
+    queries = 0
+
+    # CaptureQueriesContext is capped at 9000 queries, count them through an execute wrapper instead
+    def count_queries(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count_queries):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+
+    return dict(seconds=seconds, queries=queries)
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from flowback.common.counters import COUNTERS, counter_reconcile
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds or checks the denormalized counters (poll, group, thread and comment section counts)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Replace counters differing from a full count')
+        parser.add_argument('--check', action='store_true', help='Compare the counters with a full count')
+        parser.add_argument('--counter', action='append', dest='counters',
+                            help='Only the given counter(s), e.g. poll.PollCounter.total_proposals')
+
+    def handle(self, *args, rebuild: bool, check: bool, counters: list[str], **options):
+        if not rebuild and not check:
+            raise CommandError('Use --rebuild and/or --check')
+
+        selected = [counter for counter in COUNTERS if not counters or counter.name in counters]
+        if counters and len(selected) != len(counters):
+            raise CommandError(f'Unknown counter, available: {", ".join(counter.name for counter in COUNTERS)}')
+
+        mismatched_counters = 0
+        for counter in selected:
+            if rebuild:
+                rebuilt = counter_reconcile(counter, rebuild=True)
+                self.stdout.write(f'{counter.name}: rebuilt {rebuilt} counter(s)')
+
+            if check:
+                mismatches = counter_reconcile(counter)
+                mismatched_counters += bool(mismatches)
+
+                if mismatches:
+                    self.stdout.write(self.style.ERROR(f'{counter.name}: {mismatches} counter(s) differ'))
+
+        if check and mismatched_counters:
+            raise CommandError(f'{mismatched_counters} of {len(selected)} counter(s) do not match a full count')
+
+        if check:
+            self.stdout.write(self.style.SUCCESS(f'{len(selected)} counter(s) match a full count'))
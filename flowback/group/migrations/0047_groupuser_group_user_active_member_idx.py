@@ -0,0 +1,17 @@
+# Generated by Django 4.2.17 on 2026-10-18 04:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('group', '0046_alter_workgroup_chat_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='groupuser',
+            index=models.Index(condition=models.Q(('active', True)), fields=['user', 'group'], include=('is_admin',), name='group_user_active_member_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.17 on 2026-10-18 05:24
+
+from django.db import migrations, models
+from django.db.models import F
+
+# GroupPermissions.PERMISSIONS at the time of this migration
+PERMISSIONS = ('invite_user',
+               'create_poll',
+               'poll_fast_forward',
+               'poll_quorum',
+               'allow_vote',
+               'send_group_email',
+               'allow_delegate',
+               'kick_members',
+               'ban_members',
+               'create_proposal',
+               'update_proposal',
+               'delete_proposal',
+               'prediction_statement_create',
+               'prediction_statement_delete',
+               'prediction_bet_create',
+               'prediction_bet_update',
+               'prediction_bet_delete',
+               'create_kanban_task',
+               'update_kanban_task',
+               'delete_kanban_task',
+               'force_delete_poll',
+               'force_delete_proposal',
+               'force_delete_comment')
+
+
+def pre_populate_fields(apps, schema_editor):
+    GroupPermissions = apps.get_model('group', 'grouppermissions')
+    for bit, permission in enumerate(PERMISSIONS):
+        GroupPermissions.objects.filter(**{permission: True}).update(permission_mask=F('permission_mask').bitor(1 << bit))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('group', '0047_groupuser_group_user_active_member_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='grouppermissions',
+            name='permission_mask',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(pre_populate_fields, migrations.RunPython.noop),
+    ]
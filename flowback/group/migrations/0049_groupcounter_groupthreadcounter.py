@@ -0,0 +1,58 @@
+# Generated by Django 4.2.17 on 2026-10-18 05:32
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def count(model, parent: str, **condition):
+    return Coalesce(Subquery(model.objects.filter(**{parent: OuterRef('pk')}, **condition)
+                             .values(parent).annotate(total=Count('*')).values('total')[:1]), 0)
+
+
+def pre_populate_fields(apps, schema_editor):
+    Group = apps.get_model('group', 'group')
+    GroupUser = apps.get_model('group', 'groupuser')
+    GroupCounter = apps.get_model('group', 'groupcounter')
+    GroupThread = apps.get_model('group', 'groupthread')
+    GroupThreadVote = apps.get_model('group', 'groupthreadvote')
+    GroupThreadCounter = apps.get_model('group', 'groupthreadcounter')
+
+    GroupCounter.objects.bulk_create([GroupCounter(group_id=group_id)
+                                      for group_id in Group.objects.values_list('id', flat=True).iterator()],
+                                     batch_size=1000)
+    GroupCounter.objects.update(member_count=count(GroupUser, 'group_id', active=True))
+
+    GroupThreadCounter.objects.bulk_create([GroupThreadCounter(thread_id=thread_id)
+                                            for thread_id in GroupThread.objects.values_list('id', flat=True)
+                                            .iterator()],
+                                           batch_size=1000)
+    GroupThreadCounter.objects.update(positive_votes=count(GroupThreadVote, 'thread_id', vote=True),
+                                      negative_votes=count(GroupThreadVote, 'thread_id', vote=False))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('group', '0048_grouppermissions_permission_mask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupCounter',
+            fields=[
+                ('group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counter', serialize=False, to='group.group')),
+                ('member_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GroupThreadCounter',
+            fields=[
+                ('thread', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counter', serialize=False, to='group.groupthread')),
+                ('positive_votes', models.IntegerField(default=0)),
+                ('negative_votes', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(pre_populate_fields, migrations.RunPython.noop),
+    ]
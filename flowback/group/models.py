@@ -1,5 +1,6 @@
 import logging
 import uuid
+from functools import cache
 
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db.models import Q
@@ -10,6 +11,7 @@ from rest_framework.exceptions import ValidationError
 from backend.settings import FLOWBACK_DEFAULT_GROUP_JOIN
 from flowback.chat.models import MessageChannel, MessageChannelParticipant
 from flowback.comment.models import CommentSection, comment_section_create, comment_section_create_model_default
+from flowback.common.counters import ModelCounter, counter_register
 from flowback.common.models import BaseModel
 from flowback.files.models import FileCollection
 from flowback.kanban.models import Kanban, KanbanSubscription
@@ -162,9 +164,64 @@ class GroupPermissions(BaseModel):
     force_delete_proposal = models.BooleanField(default=False)
     force_delete_comment = models.BooleanField(default=False)
 
+    # Every permission above as one bit (1 << position in PERMISSIONS), kept in sync on save
+    permission_mask = models.BigIntegerField(default=0)
+
+    # Append only, the position of a permission is its bit in permission_mask
+    PERMISSIONS = ('invite_user',
+                   'create_poll',
+                   'poll_fast_forward',
+                   'poll_quorum',
+                   'allow_vote',
+                   'send_group_email',
+                   'allow_delegate',
+                   'kick_members',
+                   'ban_members',
+                   'create_proposal',
+                   'update_proposal',
+                   'delete_proposal',
+                   'prediction_statement_create',
+                   'prediction_statement_delete',
+                   'prediction_bet_create',
+                   'prediction_bet_update',
+                   'prediction_bet_delete',
+                   'create_kanban_task',
+                   'update_kanban_task',
+                   'delete_kanban_task',
+                   'force_delete_poll',
+                   'force_delete_proposal',
+                   'force_delete_comment')
+
     @staticmethod
     def negate_field_perms():
-        return ['id', 'created_at', 'updated_at', 'role_name', 'author']
+        return ['id', 'created_at', 'updated_at', 'role_name', 'author', 'permission_mask']
+
+    @classmethod
+    def mask(cls, permissions: list[str] | tuple[str, ...]) -> int:
+        """The bits of the given permissions, names that are not a permission (e.g. admin) have none"""
+        mask = 0
+        for permission in permissions:
+            if permission in cls.PERMISSIONS:
+                mask |= 1 << cls.PERMISSIONS.index(permission)
+
+        return mask
+
+    @classmethod
+    @cache
+    def default_mask(cls) -> int:
+        """The mask of the field defaults, used by groups without a default role"""
+        return cls.mask([name for name in cls.PERMISSIONS if cls._meta.get_field(name).default])
+
+    def get_permission_mask(self) -> int:
+        return self.mask([name for name in self.PERMISSIONS if getattr(self, name)])
+
+    def save(self, *args, **kwargs):
+        self.permission_mask = self.get_permission_mask()
+
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'permission_mask'}
+
+        super().save(*args, **kwargs)
 
 
 # Permission Tags for each group, and for user to put on delegators
@@ -238,6 +295,12 @@ class GroupUser(BaseModel):
     class Meta:
         unique_together = ('user', 'group')
 
+        # Covers the membership checks of group_content_visible_for with index only scans
+        indexes = [models.Index(fields=['user', 'group'],
+                                include=['is_admin'],
+                                condition=Q(active=True),
+                                name='group_user_active_member_idx')]
+
 
 pre_save.connect(GroupUser.pre_save, sender=GroupUser)
 post_save.connect(GroupUser.post_save, sender=GroupUser)
@@ -325,6 +388,35 @@ class GroupThreadVote(BaseModel):
     vote = models.BooleanField(default=True)
 
 
+# Denormalized counts for group and thread lists, kept up-to-date by flowback.common.counters
+class GroupCounter(models.Model):
+    group = models.OneToOneField(Group, primary_key=True, related_name='counter', on_delete=models.CASCADE)
+    member_count = models.IntegerField(default=0)
+
+
+class GroupThreadCounter(models.Model):
+    thread = models.OneToOneField(GroupThread, primary_key=True, related_name='counter', on_delete=models.CASCADE)
+    positive_votes = models.IntegerField(default=0)
+    negative_votes = models.IntegerField(default=0)
+
+
+counter_register(ModelCounter(counter_model=GroupCounter,
+                              field='member_count',
+                              model=GroupUser,
+                              parent='group_id',
+                              condition=dict(active=True)))
+counter_register(ModelCounter(counter_model=GroupThreadCounter,
+                              field='positive_votes',
+                              model=GroupThreadVote,
+                              parent='thread_id',
+                              condition=dict(vote=True)))
+counter_register(ModelCounter(counter_model=GroupThreadCounter,
+                              field='negative_votes',
+                              model=GroupThreadVote,
+                              parent='thread_id',
+                              condition=dict(vote=False)))
+
+
 class GroupUserInvite(BaseModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     group = models.ForeignKey(Group, on_delete=models.CASCADE)
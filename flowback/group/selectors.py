@@ -1,18 +1,22 @@
 import django_filters
+from collections import Counter
+from functools import cache
 from typing import Union
 
 from django.contrib.postgres.aggregates import ArrayAgg
-from django.db import models
-from django.db.models import Q, Exists, OuterRef, Count, Case, When, F, Subquery, Sum
-from django.db.models.functions import Abs, Coalesce
+from django.core.cache import cache as shared_cache
+from django.db import models, transaction
+from django.db.models import Q, Exists, OuterRef, Count, F, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import GreaterThan
 from django.forms import model_to_dict
 
-from flowback.comment.models import Comment
-from flowback.comment.selectors import comment_list, comment_ancestor_list
+from flowback.comment.selectors import comment_list, comment_ancestor_list, comment_tree
+from flowback.common.cache import request_cache, request_cache_clear, cache_versions, cache_version_bump
 from flowback.common.filters import NumberInFilter
 from flowback.common.services import get_object
 from flowback.kanban.selectors import kanban_entry_list
-from flowback.poll.models import PollPredictionStatement
+from flowback.poll.models import PollPredictionStatistics
 from flowback.user.models import User
 from flowback.group.models import Group, GroupUser, GroupUserInvite, GroupPermissions, GroupTags, GroupUserDelegator, \
     GroupUserDelegatePool, GroupThread, GroupFolder, GroupThreadVote, WorkGroup, WorkGroupUser, WorkGroupUserJoinRequest
@@ -27,15 +31,145 @@ def group_default_permissions(*, group: Union[Group, int]):
     if group.default_permission:
         return model_to_dict(group.default_permission)
 
-    fields = GroupPermissions._meta.get_fields()
-    fields = [field for field in fields if not field.auto_created
-              and field.name not in GroupPermissions.negate_field_perms()]
+    return dict(group_permission_defaults())
 
-    defaults = dict()
-    for field in fields:
-        defaults[field.name] = field.default
 
-    return defaults
+@cache
+def group_permission_fields() -> tuple[str, ...]:
+    return tuple(field.name for field in GroupPermissions._meta.get_fields()
+                 if not field.auto_created and field.name not in GroupPermissions.negate_field_perms())
+
+
+@cache
+def group_permission_defaults() -> dict[str, bool]:
+    return {name: GroupPermissions._meta.get_field(name).default for name in group_permission_fields()}
+
+
+# Group memberships resolved by group_user_permissions.
+#
+# A member entry holds the active group user of (user, group) with its user, group and roles loaded, the permission
+# mask of its role and the work groups it is a member of, or no group user for non-members. Entries are
+# kept in the shared cache under keys versioned by group and by user: role, group and work group changes bump the
+# group version, user, membership and work group membership changes bump the user version (see
+# flowback.group.signals), invalidating every entry involved at once. Within a request entries are memoized as well.
+GROUP_PERMISSIONS_CACHE = 'group_permissions'
+GROUP_PERMISSIONS_CACHE_TIMEOUT = 60 * 60
+GROUP_PERMISSIONS_CACHE_FORMAT = 2  # Bump when the member entry changes
+
+# Shared cache hits and misses of member entries in this process
+group_permissions_cache_stats = Counter(hits=0, misses=0)
+
+
+def group_permissions_cache_invalidate(*, group_id: int = None, user_id: int = None, work_group_id: int = None):
+    """Invalidates the cached memberships of a group and/or user once the current transaction is committed"""
+    request_cache_clear(GROUP_PERMISSIONS_CACHE)
+
+    def invalidate():
+        if group_id:
+            cache_version_bump(f'{GROUP_PERMISSIONS_CACHE}:group:{group_id}')
+
+        if user_id:
+            cache_version_bump(f'{GROUP_PERMISSIONS_CACHE}:user:{user_id}')
+
+        if work_group_id:
+            shared_cache.delete(f'{GROUP_PERMISSIONS_CACHE}:work_group:{work_group_id}')
+
+    transaction.on_commit(invalidate)
+
+
+def _group_member_load(*, user_id: int, group_id: int) -> dict:
+    work_group_users = WorkGroupUser.objects.filter(group_user=OuterRef('pk')).values('group_user')
+    group_user = GroupUser.objects.select_related('user',
+                                                  'group',
+                                                  'permission',
+                                                  'group__default_permission').defer('user__password').annotate(
+        work_group_ids=Subquery(work_group_users.annotate(ids=ArrayAgg('work_group_id')).values('ids')),
+        moderated_work_group_ids=Subquery(work_group_users.filter(is_moderator=True)
+                                          .annotate(ids=ArrayAgg('work_group_id')).values('ids'))
+    ).filter(user_id=user_id, group_id=group_id, active=True).first()
+
+    if group_user is None:
+        return dict(group_user=None)
+
+    role = group_user.permission if group_user.permission_id else group_user.group.default_permission
+    moderated_work_groups = set(group_user.moderated_work_group_ids or [])
+
+    return dict(group_user=group_user,
+                permission_mask=role.permission_mask if role else GroupPermissions.default_mask(),
+                work_groups={work_group_id: work_group_id in moderated_work_groups
+                             for work_group_id in group_user.work_group_ids or []})
+
+
+def group_member_resolve(*, user_id: int, group_id: int) -> dict:
+    """The member entry of (user, group), from the request memo, the shared cache or one database query"""
+    memo = request_cache(GROUP_PERMISSIONS_CACHE)
+    if memo is not None and ('member', user_id, group_id) in memo:
+        return memo[('member', user_id, group_id)]
+
+    group_version, user_version = cache_versions(f'{GROUP_PERMISSIONS_CACHE}:group:{group_id}',
+                                                 f'{GROUP_PERMISSIONS_CACHE}:user:{user_id}')
+    key = (f'{GROUP_PERMISSIONS_CACHE}:member:{GROUP_PERMISSIONS_CACHE_FORMAT}:'
+           f'{group_id}:{user_id}:{group_version}:{user_version}')
+    member = shared_cache.get(key)
+
+    if member is None:
+        group_permissions_cache_stats['misses'] += 1
+        member = _group_member_load(user_id=user_id, group_id=group_id)
+        shared_cache.set(key, member, GROUP_PERMISSIONS_CACHE_TIMEOUT)
+
+    else:
+        group_permissions_cache_stats['hits'] += 1
+
+    if memo is not None:
+        memo[('member', user_id, group_id)] = member
+
+        if member['group_user']:
+            memo[('group_user', member['group_user'].id)] = (user_id, group_id)
+
+    return member
+
+
+def _group_user_member_resolve(*, group_user_id: int) -> dict:
+    memo = request_cache(GROUP_PERMISSIONS_CACHE)
+    key = f'{GROUP_PERMISSIONS_CACHE}:group_user:{group_user_id}'
+
+    membership = memo.get(('group_user', group_user_id)) if memo is not None else None
+    membership = membership or shared_cache.get(key)
+
+    if membership is None:
+        membership = GroupUser.objects.filter(id=group_user_id).values_list('user_id', 'group_id').first()
+
+        if membership is None:
+            raise GroupUser.DoesNotExist('GroupUser matching query does not exist.')
+
+        shared_cache.set(key, membership, GROUP_PERMISSIONS_CACHE_TIMEOUT)
+
+    member = group_member_resolve(user_id=membership[0], group_id=membership[1])
+    if not member['group_user'] or member['group_user'].id != group_user_id:
+        raise GroupUser.DoesNotExist('GroupUser matching query does not exist.')
+
+    return member
+
+
+def _work_group_group_id(*, work_group_id: int) -> int:
+    memo = request_cache(GROUP_PERMISSIONS_CACHE)
+    key = f'{GROUP_PERMISSIONS_CACHE}:work_group:{work_group_id}'
+
+    group_id = memo.get(('work_group', work_group_id)) if memo is not None else None
+    group_id = group_id or shared_cache.get(key)
+
+    if group_id is None:
+        group_id = WorkGroup.objects.filter(id=work_group_id).values_list('group_id', flat=True).first()
+
+        if group_id is None:
+            raise WorkGroup.DoesNotExist('WorkGroup matching query does not exist.')
+
+        shared_cache.set(key, group_id, GROUP_PERMISSIONS_CACHE_TIMEOUT)
+
+    if memo is not None:
+        memo[('work_group', work_group_id)] = group_id
+
+    return group_id
 
 
 # Check if user have any one of the permissions
@@ -49,56 +183,72 @@ def group_user_permissions(*,
                            allow_admin: bool = False) -> Union[GroupUser, bool]:
     permissions = permissions or []
     work_group_moderator_check = False
+    member = None
 
     # Setup initial values for the function
-    if isinstance(user, int):
-        user = User.objects.get(id=user, is_active=True)
-
-    if isinstance(group, int):
-        group = Group.objects.get(id=group, active=True)
-
     if isinstance(permissions, str):
         permissions = [permissions]
 
-    if isinstance(work_group, int):
-        work_group = WorkGroup.objects.get(id=work_group)
+    if isinstance(work_group, WorkGroup):
+        work_group_id, work_group_group_id = work_group.id, work_group.group_id
+
+    elif work_group:
+        work_group_id, work_group_group_id = work_group, _work_group_group_id(work_group_id=work_group)
 
     if isinstance(group_user, int):
-        group_user = GroupUser.objects.get(id=group_user, active=True)
+        member = _group_user_member_resolve(group_user_id=group_user)
+        group_user = member['group_user']
 
     if group_user:
         if not group_user.active:
             raise ValidationError('Group user is not active')
 
-    if user and group:
-        group_user = GroupUser.objects.get(user=user, group=group, active=True)
+    if user and (group or work_group):
+        user_id = user if isinstance(user, int) else user.id
+        group_id = (group if isinstance(group, int) else group.id) if group else work_group_group_id
+        member = group_member_resolve(user_id=user_id, group_id=group_id)
+        group_user = member['group_user']
+
+        # Users and groups given by id must be active, instances are trusted as they are
+        if group_user and isinstance(user, int) and not group_user.user.is_active:
+            raise User.DoesNotExist('User matching query does not exist.')
+
+        if group_user and isinstance(group, int) and not group_user.group.active:
+            raise Group.DoesNotExist('Group matching query does not exist.')
+
+        if group_user is None:
+            raise GroupUser.DoesNotExist('GroupUser matching query does not exist.')
 
-    elif user and work_group:
-        group_user = GroupUser.objects.get(group=work_group.group, user=user, active=True)
+    elif group_user and not member:
+        member = group_member_resolve(user_id=group_user.user_id, group_id=group_user.group_id)
+
+        if not member['group_user'] or member['group_user'].id != group_user.id:
+            raise GroupUser.DoesNotExist('GroupUser matching query does not exist.')
 
     elif not group_user:
         raise Exception('group_user_permissions is missing appropiate parameters')
 
     # Logic behind checking permissions
-    admin = group_user.is_admin
-    user_permissions = model_to_dict(group_user.permission) if group_user.permission else group_default_permissions(
-        group=group_user.group)
+    member_group_user = member['group_user']
+    admin = member_group_user.is_admin
+    is_creator = (member_group_user.group.created_by_id == member_group_user.user_id
+                  or member_group_user.user.is_superuser)
 
     # Check if admin permission is present
     if 'admin' in permissions:
-        if group_user.is_admin or group_user.group.created_by == group_user.user or group_user.user.is_superuser:
+        if admin or is_creator:
             allow_admin = True
 
     # Check if creator permission is present
     if 'creator' in permissions:
-        if group_user.group.created_by == group_user.user or group_user.user.is_superuser:
+        if is_creator:
             allow_admin = True
 
     # Check if work_group_moderator is present, mark as true and check further down
     if 'work_group_moderator' in permissions:
         work_group_moderator_check = True
 
-    validated_permissions = any([user_permissions.get(key, False) for key in permissions]) or not permissions
+    validated_permissions = bool(member['permission_mask'] & GroupPermissions.mask(permissions)) or not permissions
     if not validated_permissions and not (admin and allow_admin):
         if raise_exception:
             raise PermissionDenied(
@@ -107,13 +257,10 @@ def group_user_permissions(*,
             return False
 
     if work_group and not admin:
-        try:
-            work_group_user = WorkGroupUser.objects.get(group_user=group_user, work_group=work_group)
-
-        except WorkGroupUser.DoesNotExist:
+        if work_group_id not in member['work_groups']:
             raise PermissionDenied("Requires work group membership")
 
-        if work_group_moderator_check and not work_group_user.is_moderator:
+        if work_group_moderator_check and not member['work_groups'][work_group_id]:
             raise PermissionDenied("Requires work group moderator permission")
 
     return group_user
@@ -121,10 +268,37 @@ def group_user_permissions(*,
 
 # Simple statement to return Q object for group visibility
 def _group_get_visible_for(user: User):
-    query = Q(public=True) | Q(Q(public=False) & Q(groupuser__user__in=[user]))
+    query = Q(public=True) | Q(Q(public=False) & Exists(GroupUser.objects.filter(group=OuterRef('pk'), user=user)))
     return Group.objects.filter(query)
 
 
+def group_content_visible_for(*, user: User, public: bool = True, group_field: str = 'created_by__group') -> Q:
+    """
+    Q object for group content (polls, threads) visible to the user, for models with created_by (GroupUser) and
+    work_group. Each rule is an EXISTS over the membership of the user, so no rows are multiplied by group size.
+
+    Active members see content outside work groups, and work group content of work groups they are in (or of every
+    work group if they are group admin). With public, content outside work groups of public groups is visible to
+    everyone else as well. Models referring to the group directly pass it as group_field.
+
+    The groups visible to the user aren't precomputed: the membership checks are index-only probes of the partial
+    (user, group) index on active members, which a stored set would have to be kept in sync with on every membership
+    and work group change.
+    """
+    membership = GroupUser.objects.filter(user=user, group_id=OuterRef(f'{group_field}_id'), active=True)
+    work_group_membership = WorkGroupUser.objects.filter(work_group_id=OuterRef('work_group_id'),
+                                                         group_user__user=user,
+                                                         group_user__active=True)
+
+    q = (Q(work_group__isnull=True) & Exists(membership)
+         | Q(work_group__isnull=False) & (Exists(work_group_membership) | Exists(membership.filter(is_admin=True))))
+
+    if public:
+        q |= Q(work_group__isnull=True, **{f'{group_field}__public': True})
+
+    return q
+
+
 class BaseGroupFilter(django_filters.FilterSet):
     joined = django_filters.BooleanFilter(lookup_expr='exact')
     chat_ids = django_filters.NumberFilter(lookup_expr='in')
@@ -152,7 +326,7 @@ def group_list(*, fetched_by: User, filters=None):
                                 ).annotate(joined=Exists(joined_groups),
                                            pending_invite=Exists(pending_invite),
                                            pending_join=Exists(pending_join),
-                                           member_count=Count('groupuser')
+                                           member_count=Coalesce(F('counter__member_count'), 0)
                                            ).order_by('created_at').all()
     qs = BaseGroupFilter(filters, qs).qs
     return qs
@@ -175,7 +349,7 @@ def group_kanban_entry_list(*, fetched_by: User, group_id: int, filters=None):
 
 def group_detail(*, fetched_by: User, group_id: int):
     group_user = group_user_permissions(user=fetched_by, group=group_id)
-    return Group.objects.annotate(member_count=Count('groupuser')).get(id=group_user.group.id)
+    return Group.objects.annotate(member_count=Coalesce(F('counter__member_count'), 0)).get(id=group_user.group.id)
 
 
 def group_schedule_event_list(*, fetched_by: User, group_id: int, filters=None):
@@ -184,10 +358,27 @@ def group_schedule_event_list(*, fetched_by: User, group_id: int, filters=None):
     return schedule_event_list(schedule_id=group_user.group.schedule.id, group_user=group_user, filters=filters)
 
 
+def group_user_has_permission(*, permissions: list[str] | str) -> GreaterThan:
+    """Filter for group users with any of the permissions in their role, or the group default role without one"""
+    if isinstance(permissions, str):
+        permissions = [permissions]
+
+    permission_mask = Coalesce(F('permission__permission_mask'),
+                               F('group__default_permission__permission_mask'),
+                               Value(GroupPermissions.default_mask()),
+                               output_field=models.BigIntegerField())
+
+    return GreaterThan(permission_mask.bitand(GroupPermissions.mask(permissions)), 0)
+
+
 class BaseGroupUserFilter(django_filters.FilterSet):
     username__icontains = django_filters.CharFilter(field_name='user__username', lookup_expr='icontains')
     delegate_pool_id = django_filters.NumberFilter(),
     is_delegate = django_filters.BooleanFilter(field_name='delegate_pool_id', lookup_expr='isnull', exclude=True)
+    has_permission = django_filters.CharFilter(method='has_permission_filter')
+
+    def has_permission_filter(self, queryset, name, value):
+        return queryset.filter(group_user_has_permission(permissions=value))
 
     class Meta:
         model = GroupUser
@@ -279,6 +470,8 @@ def group_tags_interval_mean_absolute_correctness(*, tag_id: int, fetched_by: Us
         abs(sum(combined_bet) – sum(outcome))/N
         - N is the number of predictions that had at least one bet
 
+    Read from the running sums in PollPredictionStatistics, see flowback.poll.services.prediction_statistics
+
     TODO add this value to the group_tags_list selector
     """
     tag = GroupTags.objects.get(id=tag_id)
@@ -286,23 +479,12 @@ def group_tags_interval_mean_absolute_correctness(*, tag_id: int, fetched_by: Us
     if fetched_by:
         group_user_permissions(user=fetched_by, group=tag.group)
 
-    qs_filter = PollPredictionStatement.objects.filter(poll__tag_id=tag_id, pollpredictionstatementvote__isnull=False)
-
-    qs_annotate = qs_filter.annotate(
-        outcome_sum=Sum(Case(When(pollpredictionstatementvote__vote=True, then=1),
-                             When(pollpredictionstatementvote__vote=False, then=-1),
-                             default=0,
-                             output_field=models.IntegerField())),
+    statistics = PollPredictionStatistics.objects.filter(tag_id=tag_id).first()
 
-        outcome=Case(When(outcome_sum__gt=0, then=1),
-                     When(outcome_sum__lte=0, then=0),
-                     default=0.5,
-                     output_field=models.DecimalField(max_digits=14, decimal_places=4)),
-        has_bets=Case(When(pollpredictionbet__isnull=True, then=0), default=1),
-        p1=Abs(F('combined_bet') - F('outcome')))
+    if not statistics or not statistics.error_count:
+        return None
 
-    qs = qs_annotate.aggregate(interval_mean_absolute_correctness=1 - (Sum('p1') / Sum('has_bets')))
-    return qs.get('interval_mean_absolute_correctness')
+    return 1 - statistics.error_sum / statistics.error_count
 
 
 class BaseGroupUserDelegateFilter(django_filters.FilterSet):
@@ -357,38 +539,12 @@ def group_thread_list(*, fetched_by: User, filters=None):
 
     threads = GroupThread.objects.filter(id__in=[t['id'] for t in threads])  # TODO make this one query
 
-    comment_qs = Coalesce(Subquery(
-        Comment.objects.filter(comment_section_id=OuterRef('comment_section_id'), active=True).values(
-            'comment_section_id').annotate(total=Count('*')).values('total')[:1]), 0)
-
     user_vote_qs = GroupThreadVote.objects.filter(thread_id=OuterRef('id'), created_by__user=fetched_by).values('vote')
 
-    positive_votes_qs = (
-        GroupThreadVote.objects.filter(
-            thread_id=OuterRef('pk'),
-            vote=True
-        )
-        .values('thread_id')
-        .annotate(positive_count=Count('id'))
-        .values('positive_count')
-    )
-
-    negative_votes_qs = (
-        GroupThreadVote.objects.filter(
-            thread_id=OuterRef('pk'),
-            vote=False
-        )
-        .values('thread_id')
-        .annotate(negative_count=Count('id'))
-        .values('negative_count')
-    )
-
-    qs = threads.annotate(total_comments=comment_qs,
+    qs = threads.annotate(total_comments=F('comment_section__total_comments'),
                           user_vote=Subquery(user_vote_qs),
-                          score=Coalesce(Subquery(positive_votes_qs,
-                                                  output_field=models.IntegerField()), 0) -
-                                Coalesce(Subquery(negative_votes_qs,
-                                                  output_field=models.IntegerField()), 0)).all()
+                          score=Coalesce(F('counter__positive_votes'), 0) -
+                                Coalesce(F('counter__negative_votes'), 0)).all()
 
     return BaseGroupThreadFilter(filters, qs).qs
 
@@ -400,6 +556,13 @@ def group_thread_comment_list(*, fetched_by: User, thread_id: int, filters=None)
     return comment_list(fetched_by=fetched_by, comment_section_id=thread.comment_section_id, filters=filters)
 
 
+def group_thread_comment_tree(*, fetched_by: User, thread_id: int, **kwargs):
+    thread = get_object(GroupThread, id=thread_id)
+    group_user_permissions(user=fetched_by, group=thread.created_by.group)
+
+    return comment_tree(fetched_by=fetched_by, comment_section_id=thread.comment_section_id, **kwargs)
+
+
 def group_thread_comment_ancestor_list(*, fetched_by: User, thread_id: int, comment_id: int):
     thread = get_object(GroupThread, id=thread_id)
     group_user_permissions(user=fetched_by, group=thread.created_by.group)
@@ -417,6 +580,13 @@ def group_delegate_pool_comment_list(*, fetched_by: User, delegate_pool_id: int,
     return comment_list(fetched_by=fetched_by, comment_section_id=delegate_pool.comment_section.id, filters=filters)
 
 
+def group_delegate_pool_comment_tree(*, fetched_by: User, delegate_pool_id: int, **kwargs):
+    delegate_pool = get_object(GroupUserDelegatePool, id=delegate_pool_id)
+    group_user_permissions(user=fetched_by, group=delegate_pool.group)
+
+    return comment_tree(fetched_by=fetched_by, comment_section_id=delegate_pool.comment_section_id, **kwargs)
+
+
 # Work Group
 class BaseWorkGroupFilter(django_filters.FilterSet):
     order_by = django_filters.OrderingFilter(fields=(('created_at', 'created_at_asc'),
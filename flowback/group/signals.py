@@ -0,0 +1,38 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from flowback.group.models import Group, GroupPermissions, GroupUser, WorkGroup, WorkGroupUser
+from flowback.group.selectors import group_permissions_cache_invalidate
+from flowback.user.models import User
+
+
+# Invalidates the memberships resolved by group_user_permissions, see group_member_resolve
+@receiver([post_save, post_delete], sender=User)
+def group_permissions_invalidate_user(sender, instance, **kwargs):
+    group_permissions_cache_invalidate(user_id=instance.id)
+
+
+@receiver([post_save, post_delete], sender=Group)
+def group_permissions_invalidate_group(sender, instance, **kwargs):
+    group_permissions_cache_invalidate(group_id=instance.id)
+
+
+@receiver([post_save, post_delete], sender=GroupPermissions)
+def group_permissions_invalidate_role(sender, instance, **kwargs):
+    group_permissions_cache_invalidate(group_id=instance.author_id)
+
+
+@receiver([post_save, post_delete], sender=GroupUser)
+def group_permissions_invalidate_group_user(sender, instance, **kwargs):
+    group_permissions_cache_invalidate(user_id=instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=WorkGroup)
+def group_permissions_invalidate_work_group(sender, instance, **kwargs):
+    group_permissions_cache_invalidate(group_id=instance.group_id,
+                                       work_group_id=instance.id if kwargs['signal'] is post_delete else None)
+
+
+@receiver([post_save, post_delete], sender=WorkGroupUser)
+def group_permissions_invalidate_work_group_user(sender, instance, **kwargs):
+    group_permissions_cache_invalidate(user_id=instance.group_user.user_id)
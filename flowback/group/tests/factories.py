@@ -1,5 +1,6 @@
 import factory
 
+from flowback.chat.models import MessageChannelParticipant
 from flowback.comment.tests.factories import CommentSectionFactory
 from flowback.common.tests import fake
 
@@ -14,6 +15,7 @@ from flowback.group.models import (Group,
                                    GroupUserDelegator, GroupThreadVote, WorkGroup, WorkGroupUser,
                                    WorkGroupUserJoinRequest)
 from flowback.kanban.models import KanbanEntry
+from flowback.user.models import User
 from flowback.user.tests.factories import UserFactory
 
 
@@ -35,6 +37,18 @@ class GroupUserFactory(factory.django.DjangoModelFactory):
     is_admin = factory.LazyAttribute(lambda o: o.group.created_by == o.user)
 
 
+def group_user_bulk_create(*, group: Group, amount: int) -> list[GroupUser]:
+    """Creates a large amount of group users without triggering model signals, used by benchmarks"""
+    users = User.objects.bulk_create([User(username=f'bulk_{group.id}_{i}',
+                                           email=f'bulk_{group.id}_{i}@example.com') for i in range(amount)])
+    participants = MessageChannelParticipant.objects.bulk_create([MessageChannelParticipant(user=user,
+                                                                                            channel_id=group.chat_id)
+                                                                  for user in users])
+
+    return GroupUser.objects.bulk_create([GroupUser(user=user, group=group, chat_participant=participant)
+                                          for user, participant in zip(users, participants)])
+
+
 class WorkGroupFactory(factory.django.DjangoModelFactory):
     class Meta:
         model = WorkGroup
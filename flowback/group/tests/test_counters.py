@@ -0,0 +1,92 @@
+from io import StringIO
+
+from django.core.management import call_command, CommandError
+from rest_framework.test import APITransactionTestCase
+
+from flowback.comment.models import CommentSection, Comment
+from flowback.comment.services import comment_delete
+from flowback.comment.tests.factories import CommentFactory
+from flowback.group.models import GroupUser, GroupCounter, GroupThreadCounter, GroupThreadVote
+from flowback.group.selectors import group_detail
+from flowback.group.services.group import group_leave
+from flowback.group.services.thread import group_thread_vote_update
+from flowback.group.tests.factories import GroupFactory, GroupUserFactory, GroupThreadFactory
+from flowback.poll.models import PollCounter
+from flowback.poll.tests.factories import PollFactory, PollProposalFactory, PollPredictionStatementFactory
+
+
+class CounterTest(APITransactionTestCase):
+    def setUp(self):
+        self.group = GroupFactory()
+        self.group_creator = GroupUser.objects.get(user=self.group.created_by, group=self.group)
+        self.group_user = GroupUserFactory(group=self.group)
+
+    def test_member_count(self):
+        other_user = GroupUserFactory(group=self.group)
+        self.assertEqual(group_detail(fetched_by=self.group.created_by, group_id=self.group.id).member_count, 3)
+
+        # Members that left are not counted, until they join again
+        group_leave(user=other_user.user.id, group=self.group.id)
+        self.assertEqual(GroupCounter.objects.get(group=self.group).member_count, 2)
+
+        other_user.refresh_from_db()
+        other_user.active = True
+        other_user.save()
+        self.assertEqual(GroupCounter.objects.get(group=self.group).member_count, 3)
+
+        other_user.delete()
+        self.assertEqual(GroupCounter.objects.get(group=self.group).member_count, 2)
+
+    def test_thread_and_comment_counts(self):
+        thread = GroupThreadFactory(created_by=self.group_creator)
+        comments = CommentFactory.create_batch(3, comment_section=thread.comment_section)
+
+        group_thread_vote_update(user_id=self.group_creator.user.id, thread_id=thread.id, vote=True)
+        group_thread_vote_update(user_id=self.group_user.user.id, thread_id=thread.id, vote=True)
+        group_thread_vote_update(user_id=self.group_user.user.id, thread_id=thread.id, vote=False)
+
+        counter = GroupThreadCounter.objects.get(thread=thread)
+        self.assertEqual((counter.positive_votes, counter.negative_votes), (1, 1))
+
+        group_thread_vote_update(user_id=self.group_user.user.id, thread_id=thread.id, vote=None)
+        counter.refresh_from_db()
+        self.assertEqual((counter.positive_votes, counter.negative_votes), (1, 0))
+
+        # Deleted comments stay as inactive rows, and are no longer counted
+        comment_delete(fetched_by=comments[0].author_id,
+                       comment_section_id=thread.comment_section_id,
+                       comment_id=comments[0].id)
+        self.assertEqual(CommentSection.objects.get(id=thread.comment_section_id).total_comments, 2)
+
+    def test_poll_counts(self):
+        poll = PollFactory(created_by=self.group_creator)
+        proposals = PollProposalFactory.create_batch(3, created_by=self.group_creator, poll=poll)
+        PollPredictionStatementFactory.create_batch(2, created_by=self.group_creator, poll=poll)
+
+        counter = PollCounter.objects.get(poll=poll)
+        self.assertEqual((counter.total_proposals, counter.total_predictions), (3, 2))
+
+        proposals[0].delete()
+        counter.refresh_from_db()
+        self.assertEqual(counter.total_proposals, 2)
+
+    def test_counter_reconcile(self):
+        thread = GroupThreadFactory(created_by=self.group_creator)
+        poll = PollFactory(created_by=self.group_creator)
+
+        # Bulk operations bypass the counters
+        GroupThreadVote.objects.bulk_create([GroupThreadVote(created_by=self.group_user, thread=thread, vote=False)])
+        Comment.objects.bulk_create([Comment(comment_section=poll.comment_section, author=self.group.created_by,
+                                             message='bulk')])
+        GroupUser.objects.filter(id=self.group_user.id).update(active=False)
+
+        with self.assertRaises(CommandError):
+            call_command('counters', check=True, stdout=StringIO())
+
+        output = StringIO()
+        call_command('counters', rebuild=True, check=True, stdout=output)
+        self.assertIn('match a full count', output.getvalue())
+
+        self.assertEqual(GroupThreadCounter.objects.get(thread=thread).negative_votes, 1)
+        self.assertEqual(CommentSection.objects.get(id=poll.comment_section_id).total_comments, 1)
+        self.assertEqual(GroupCounter.objects.get(group=self.group).member_count, 1)
@@ -1,9 +1,15 @@
+from django.core.cache import cache
+from django.test import override_settings
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.test import APITransactionTestCase
 
-from flowback.group.models import GroupUser
-from flowback.group.selectors import group_user_permissions
-from flowback.group.tests.factories import GroupFactory, GroupUserFactory, GroupPermissionsFactory
+from flowback.common.cache import request_cache_scope
+from flowback.group.models import GroupUser, GroupPermissions
+from flowback.group.selectors import group_user_permissions, group_permissions_cache_stats, group_permission_fields, \
+    group_user_has_permission
+from flowback.group.tests.factories import GroupFactory, GroupUserFactory, GroupPermissionsFactory, WorkGroupFactory, \
+    WorkGroupUserFactory
+from flowback.user.models import User
 
 
 class GroupPermissionTest(APITransactionTestCase):
@@ -43,4 +49,125 @@ class GroupPermissionTest(APITransactionTestCase):
         self.assertEqual(group_user_permissions(user=self.group_creator.user,
                                                 group=self.group,
                                                 permissions='creator').id,
-                         self.group_creator.id)
\ No newline at end of file
+                         self.group_creator.id)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_group_permission_request_cache(self):
+        permission = GroupPermissionsFactory(author=self.group, create_poll=False)
+        self.group_user.permission = permission
+        self.group_user.save()
+
+        # Membership, user, group and role are loaded in one query
+        with self.assertNumQueries(1):
+            self.assertFalse(group_user_permissions(user=self.group_user.user.id,
+                                                    group=self.group.id,
+                                                    permissions='create_poll',
+                                                    raise_exception=False))
+
+        with request_cache_scope():
+            with self.assertNumQueries(1):
+                for _ in range(3):
+                    group_user_permissions(user=self.group_user.user, group=self.group)
+                    group_user_permissions(group_user=self.group_user.id, permissions='admin', allow_admin=True,
+                                           raise_exception=False)
+
+            # Changing the role clears the memoized permissions
+            permission.create_poll = True
+            permission.save()
+
+            self.assertEqual(group_user_permissions(user=self.group_user.user,
+                                                    group=self.group,
+                                                    permissions='create_poll'), self.group_user)
+
+        # Outside of a request nothing is memoized
+        with self.assertNumQueries(2):
+            group_user_permissions(user=self.group_user.user, group=self.group)
+            group_user_permissions(user=self.group_user.user, group=self.group)
+
+    def test_group_permission_shared_cache(self):
+        cache.clear()
+        work_group = WorkGroupFactory(group=self.group)
+        stats = dict(group_permissions_cache_stats)
+
+        def check(**kwargs):
+            # Every check is a new request, only the shared cache is used
+            with request_cache_scope():
+                return group_user_permissions(user=self.group_user.user.id, group=self.group.id,
+                                              raise_exception=False, **kwargs)
+
+        # The membership and the group of the work group are loaded once
+        with self.assertNumQueries(2):
+            self.assertEqual(check(), self.group_user)
+            with self.assertRaises(PermissionDenied):
+                check(work_group=work_group.id)
+
+        with self.assertNumQueries(0):
+            self.assertFalse(check(permissions='admin', allow_admin=True))
+            with self.assertRaises(PermissionDenied):
+                check(work_group=work_group.id)
+
+        self.assertEqual(group_permissions_cache_stats['hits'] - stats['hits'], 3)
+        self.assertEqual(group_permissions_cache_stats['misses'] - stats['misses'], 1)
+
+        # Editing the group default role invalidates every member of the group
+        self.group.default_permission = GroupPermissionsFactory(author=self.group, create_poll=False)
+        self.group.save()
+        with self.assertNumQueries(1):
+            self.assertFalse(check(permissions='create_poll'))
+
+        role = GroupPermissionsFactory(author=self.group, create_poll=False)
+        self.group_user.permission = role
+        self.group_user.save()
+        self.assertFalse(check(permissions='create_poll'))
+
+        role.create_poll = True
+        role.save()
+        self.assertEqual(check(permissions='create_poll'), self.group_user)
+
+        WorkGroupUserFactory(work_group=work_group, group_user=self.group_user)
+        self.assertEqual(check(work_group=work_group.id), self.group_user)
+        with self.assertRaises(PermissionDenied):
+            check(work_group=work_group.id, permissions=['create_poll', 'work_group_moderator'])
+
+        self.group_user.is_admin = True
+        self.group_user.save()
+        self.assertEqual(check(permissions='admin', allow_admin=True), self.group_user)
+
+        self.group_user.user.is_active = False
+        self.group_user.user.save()
+        with self.assertRaises(User.DoesNotExist):
+            check()
+
+    def test_group_permission_mask(self):
+        # Every boolean permission has a bit
+        self.assertEqual(set(GroupPermissions.PERMISSIONS), set(group_permission_fields()))
+
+        role = GroupPermissionsFactory(author=self.group, invite_user=True, create_poll=False, kick_members=True,
+                                       allow_vote=False)
+        self.assertEqual(role.permission_mask, role.get_permission_mask())
+        self.assertTrue(role.permission_mask & GroupPermissions.mask(['kick_members', 'admin']))
+        self.assertFalse(role.permission_mask & GroupPermissions.mask(['create_poll', 'admin']))
+
+        # Updating only some fields keeps the mask in sync
+        role.create_poll = True
+        role.save(update_fields=['create_poll'])
+        role.refresh_from_db()
+        self.assertEqual(role.permission_mask, role.get_permission_mask())
+        self.assertTrue(role.permission_mask & GroupPermissions.mask(['create_poll']))
+
+        self.group_user.permission = role
+        self.group_user.save()
+        default_user = GroupUserFactory(group=self.group)
+
+        def members_with(permission: str) -> set[int]:
+            return set(GroupUser.objects.filter(group_user_has_permission(permissions=permission),
+                                                group=self.group).values_list('id', flat=True))
+
+        # Members without a role get the defaults, or the group default role once there is one
+        self.assertEqual(members_with('kick_members'), {self.group_user.id})
+        self.assertEqual(members_with('allow_vote'), {self.group_creator.id, default_user.id})
+
+        self.group.default_permission = GroupPermissionsFactory(author=self.group, allow_vote=False, kick_members=True)
+        self.group.save()
+        self.assertEqual(members_with('kick_members'), {self.group_creator.id, self.group_user.id, default_user.id})
+        self.assertEqual(members_with('allow_vote'), set())
@@ -43,8 +43,9 @@ from .views.thread import (GroupThreadListAPI,
                            GroupThreadCommentCreateAPI,
                            GroupThreadCommentUpdateAPI,
                            GroupThreadCommentDeleteAPI, GroupThreadNotificationSubscribeAPI, GroupThreadCommentVoteAPI,
-                           GroupThreadCommentAncestorListAPI, GroupThreadVoteUpdateAPI)
+                           GroupThreadCommentAncestorListAPI, GroupThreadVoteUpdateAPI, GroupThreadCommentTreeAPI)
 from .views.comment import (GroupDelegatePoolCommentListAPI,
+                            GroupDelegatePoolCommentTreeAPI,
                             GroupDelegatePoolCommentCreateAPI,
                             GroupDelegatePoolCommentUpdateAPI,
                             GroupDelegatePoolCommentDeleteAPI, GroupDelegatePoolCommentVoteAPI)
@@ -110,6 +111,9 @@ group_patterns = [
     path('delegate/pool/<int:delegate_pool_id>/comment/list',
          GroupDelegatePoolCommentListAPI.as_view(),
          name='group_user_delegate_pool_list'),
+    path('delegate/pool/<int:delegate_pool_id>/comment/tree',
+         GroupDelegatePoolCommentTreeAPI.as_view(),
+         name='group_user_delegate_pool_comment_tree'),
     path('delegate/pool/<int:delegate_pool_id>/comment/create',
          GroupDelegatePoolCommentCreateAPI.as_view(),
          name='group_user_delegate_pool_create'),
@@ -148,6 +152,9 @@ group_patterns = [
     path('thread/<int:thread_id>/comment/<int:comment_id>/ancestor',
          GroupThreadCommentAncestorListAPI.as_view(),
          name='group_thread_comment_ancestor_list'),
+    path('thread/<int:thread_id>/comment/tree',
+         GroupThreadCommentTreeAPI.as_view(),
+         name='group_thread_comment_tree'),
     path('thread/<int:thread_id>/comment/create',
          GroupThreadCommentCreateAPI.as_view(),
          name='group_thread_comment_create'),
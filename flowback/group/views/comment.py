@@ -1,7 +1,8 @@
 from drf_spectacular.utils import extend_schema
 
-from flowback.comment.views import CommentListAPI, CommentCreateAPI, CommentUpdateAPI, CommentDeleteAPI, CommentVoteAPI
-from flowback.group.selectors import group_delegate_pool_comment_list
+from flowback.comment.views import (CommentListAPI, CommentCreateAPI, CommentUpdateAPI, CommentDeleteAPI, CommentVoteAPI,
+                                    CommentTreeAPI)
+from flowback.group.selectors import group_delegate_pool_comment_list, group_delegate_pool_comment_tree
 from flowback.group.services.delegate import (group_delegate_pool_comment_create,
                                               group_delegate_pool_comment_update,
                                               group_delegate_pool_comment_delete,
@@ -13,6 +14,11 @@ class GroupDelegatePoolCommentListAPI(CommentListAPI):
     lazy_action = group_delegate_pool_comment_list
 
 
+@extend_schema(tags=['group/delegate'])
+class GroupDelegatePoolCommentTreeAPI(CommentTreeAPI):
+    lazy_action = group_delegate_pool_comment_tree
+
+
 @extend_schema(tags=['group/delegate'])
 class GroupDelegatePoolCommentCreateAPI(CommentCreateAPI):
     lazy_action = group_delegate_pool_comment_create
@@ -5,9 +5,10 @@ from rest_framework.response import Response
 
 from flowback.common.pagination import LimitOffsetPagination, get_paginated_response
 from flowback.comment.views import CommentListAPI, CommentCreateAPI, CommentUpdateAPI, CommentDeleteAPI, CommentVoteAPI, \
-    CommentAncestorListAPI
+    CommentAncestorListAPI, CommentTreeAPI
 from flowback.files.serializers import FileSerializer
-from flowback.group.selectors import group_thread_list, group_thread_comment_list, group_thread_comment_ancestor_list
+from flowback.group.selectors import group_thread_list, group_thread_comment_list, group_thread_comment_ancestor_list, \
+    group_thread_comment_tree
 from flowback.group.serializers import WorkGroupSerializer, GroupUserSerializer
 from flowback.group.services.thread import (group_thread_create,
                                             group_thread_update,
@@ -142,6 +143,11 @@ class GroupThreadCommentAncestorListAPI(CommentAncestorListAPI):
     lazy_action = group_thread_comment_ancestor_list
 
 
+@extend_schema(tags=['group/thread'])
+class GroupThreadCommentTreeAPI(CommentTreeAPI):
+    lazy_action = group_thread_comment_tree
+
+
 @extend_schema(tags=['group/thread'])
 class GroupThreadCommentCreateAPI(CommentCreateAPI):
     lazy_action = group_thread_comment_create
@@ -4,7 +4,7 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from flowback.common.pagination import LimitOffsetPagination, get_paginated_response
 
-from flowback.group.models import GroupUser
+from flowback.group.models import GroupUser, GroupPermissions
 from flowback.group.selectors import group_user_list, group_user_invite_list
 from flowback.group.serializers import GroupUserSerializer
 
@@ -25,6 +25,7 @@ class GroupUserListApi(APIView):
         is_delegate = serializers.BooleanField(required=False, default=None, allow_null=True)
         is_admin = serializers.BooleanField(required=False, default=None, allow_null=True)
         permission = serializers.IntegerField(required=False)
+        has_permission = serializers.ChoiceField(required=False, choices=GroupPermissions.PERMISSIONS)
 
     class OutputSerializer(GroupUserSerializer):
         delegate_pool_id = serializers.IntegerField(allow_null=True)
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.17 on 2026-10-18 06:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notification', '0002_notificationobject_related_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationobject',
+            name='pull',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='notificationsubscription',
+            name='read_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='notificationobject',
+            index=models.Index(fields=['channel', 'timestamp'], name='notification_channel_time_idx'),
+        ),
+    ]
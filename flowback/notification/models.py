@@ -23,10 +23,18 @@ class NotificationObject(BaseModel):
     timestamp = models.DateTimeField(default=timezone.now)
     channel = models.ForeignKey(NotificationChannel, on_delete=models.CASCADE)
 
+    # Pulled by the subscribers of the channel when they read their notifications instead of being copied to each of
+    # them, Notification rows of pulled objects only override their read state, see notification_list
+    pull = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [models.Index(fields=['channel', 'timestamp'], name='notification_channel_time_idx')]
+
 
 class NotificationSubscription(BaseModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     channel = models.ForeignKey(NotificationChannel, on_delete=models.CASCADE)
+    read_until = models.DateTimeField(null=True, blank=True)  # Pulled notifications up to this timestamp are read
 
     class Meta:
         unique_together = ('user', 'channel')
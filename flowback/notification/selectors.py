@@ -1,4 +1,7 @@
 import django_filters
+from django.db import models
+from django.db.models import Q, OuterRef, Exists, Subquery, ExpressionWrapper
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 from .models import NotificationChannel, NotificationObject, Notification, NotificationSubscription
@@ -6,26 +9,23 @@ from ..user.models import User
 
 
 class BaseNotificationFilter(django_filters.FilterSet):
-    object_id = django_filters.NumberFilter(field_name='notification_object_id')
-    message = django_filters.CharFilter(field_name='notification_object_message',
-                                        lookup_expr='iexact')
-    message__icontains = django_filters.CharFilter(field_name='notification_object_message',
-                                                   lookup_expr='icontains')
-    action = django_filters.CharFilter(field_name='notification_object__action')
-    timestamp__lt = django_filters.DateFilter(field_name='notification_object__timestamp',
-                                              lookup_expr='lt')
-    timestamp__gt = django_filters.DateFilter(field_name='notification_object__timestamp',
-                                              lookup_expr='gt')
-
-    channel_sender_type = django_filters.CharFilter(field_name='notification_object__channel__sender_type')
-    channel_sender_id = django_filters.NumberFilter(field_name='notification_object__channel__sender_id')
-
-    channel_sender_category = django_filters.CharFilter(field_name='notification_object__channel__category')
+    id = django_filters.NumberFilter(field_name='notification_id')
+    read = django_filters.BooleanFilter()
+    object_id = django_filters.NumberFilter(field_name='id')
+    message = django_filters.CharFilter(lookup_expr='iexact')
+    message__icontains = django_filters.CharFilter(field_name='message', lookup_expr='icontains')
+    action = django_filters.CharFilter()
+    timestamp__lt = django_filters.DateFilter(field_name='timestamp', lookup_expr='lt')
+    timestamp__gt = django_filters.DateFilter(field_name='timestamp', lookup_expr='gt')
+
+    channel_sender_type = django_filters.CharFilter(field_name='channel__sender_type')
+    channel_sender_id = django_filters.NumberFilter(field_name='channel__sender_id')
+
+    channel_sender_category = django_filters.CharFilter(field_name='channel__category')
 
     class Meta:
-        model = Notification
-        fields = dict(id=['exact'],
-                      read=['exact'])
+        model = NotificationObject
+        fields = []
 
 
 class BaseNotificationSubscriptionFilter(django_filters.FilterSet):
@@ -35,18 +35,54 @@ class BaseNotificationSubscriptionFilter(django_filters.FilterSet):
     order_by = django_filters.OrderingFilter(fields=('notification_object__timestamp_asc', 'notification_object__timestamp_desc'))
 
 
+def notification_visible(*, user_id: int) -> Q:
+    """
+    Notification objects in the inbox of the user: the ones with a Notification row for them, and pulled objects of
+    the channels they subscribe to, created after subscribing or scheduled after it (as future notifications are
+    copied on subscription)
+
+    Both sources are combined with UNION ALL into a single IN, rather than OR'ing two subqueries that would have the
+    database filter every notification object. Pulled objects are looked up by the channels of the user.
+    """
+    subscribed = NotificationSubscription.objects.filter(Q(created_at__lte=OuterRef('created_at'))
+                                                         | Q(created_at__lte=OuterRef('timestamp')),
+                                                         user_id=user_id,
+                                                         channel=OuterRef('channel'))
+    channel_ids = NotificationSubscription.objects.filter(user_id=user_id).values('channel_id')
+
+    notified = Notification.objects.filter(user_id=user_id).values('notification_object_id')
+    pulled = NotificationObject.objects.filter(Exists(subscribed),
+                                               channel_id__in=channel_ids,
+                                               pull=True).values('id')
+
+    return Q(id__in=notified.union(pulled, all=True))
+
+
 def notification_list(*, user: User, filters=None):
+    """
+    Notification objects in the inbox of the user, annotated with their read state: read from their Notification
+    row if any, pulled objects without one are read up to the read_until watermark of the subscription
+    """
     filters = filters or {}
-    qs = Notification.objects.filter(user=user,
-                                     notification_object__timestamp__lte=timezone.now())
-    
+    notification = Notification.objects.filter(user=user, notification_object=OuterRef('pk'))
+    read_until = NotificationSubscription.objects.filter(user=user, channel=OuterRef('channel')).values('read_until')
+    watermark = ExpressionWrapper(Q(timestamp__lte=Subquery(read_until[:1])), output_field=models.BooleanField())
+    qs = NotificationObject.objects.filter(notification_visible(user_id=user.id),
+                                           timestamp__lte=timezone.now()
+                                           ).annotate(notification_id=Subquery(notification.values('id')[:1]),
+                                                      read=Coalesce(Subquery(notification.values('read')[:1]),
+                                                                    watermark,
+                                                                    False,
+                                                                    output_field=models.BooleanField())
+                                                      ).select_related('channel')
+
     order_by = filters.get('order_by')
     if order_by == 'notification_object__timestamp_asc':
-        qs = qs.order_by('notification_object__timestamp')
+        qs = qs.order_by('timestamp')
     elif order_by == 'notification_object__timestamp_desc':
-        qs = qs.order_by('-notification_object__timestamp')
+        qs = qs.order_by('-timestamp')
     else:
-        qs = qs.order_by('notification_object__timestamp')  # default ordering
+        qs = qs.order_by('timestamp')  # default ordering
 
     return BaseNotificationFilter(filters, qs).qs
 
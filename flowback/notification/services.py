@@ -1,13 +1,20 @@
+import logging
+import time
 from datetime import datetime
 from typing import Union
 
-from django.db.models import F, QuerySet
+from django.db import connection, transaction
+from django.db.models import F, Q, QuerySet
 from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 
+from backend.settings import FLOWBACK_NOTIFICATION_FANOUT_ASYNC_LIMIT, FLOWBACK_NOTIFICATION_PULL_LIMIT
 from .models import NotificationChannel, NotificationObject, Notification, NotificationSubscription
+from .selectors import notification_visible
 from flowback.common.services import get_object
 
+logger = logging.getLogger(__name__)
+
 
 def notification_load_channel(*,
                               category: str,
@@ -46,27 +53,66 @@ def notification_create(*, action: str, category: str, sender_type: str, sender_
             target_user_ids = list(target_user_ids)
 
     channel = notification_load_channel(category=category, sender_type=sender_type, sender_id=sender_id)
+    subscriptions = NotificationSubscription.objects.filter(channel=channel).values('id')
+
+    # Notifications to every subscriber of a very large channel are pulled by them instead of being copied
+    pull = not target_user_ids and subscriptions[FLOWBACK_NOTIFICATION_PULL_LIMIT:].exists()
     timestamp = timestamp or timezone.now()
     notification_object = NotificationObject.objects.create(channel=channel,
                                                             action=action,
                                                             message=message,
                                                             timestamp=timestamp,
-                                                            related_id=related_id)
+                                                            related_id=related_id,
+                                                            pull=pull)
 
-    if not target_user_ids:
-        subscribers = NotificationSubscription.objects.filter(channel=channel).all()
-        Notification.objects.bulk_create([Notification(user=subscriber.user,
-                                                       notification_object=notification_object)
-                                          for subscriber in subscribers])
+    if pull:
+        return notification_object
+
+    # Large channels are fanned out by a worker once the notification object is committed
+    if not target_user_ids and subscriptions[FLOWBACK_NOTIFICATION_FANOUT_ASYNC_LIMIT:].exists():
+        from .tasks import notification_fan_out_task
+        transaction.on_commit(lambda: notification_fan_out_task.delay(notification_object_id=notification_object.id))
 
     else:
-        subscribers = NotificationSubscription.objects.filter(channel=channel, user_id__in=target_user_ids).all()
-        Notification.objects.bulk_create(
-            [Notification(user=subscriber.user, notification_object=notification_object) for subscriber in subscribers])
+        notification_fan_out(notification_object_id=notification_object.id, target_user_ids=target_user_ids or None)
 
     return notification_object
 
 
+def notification_fan_out(*, notification_object_id: int, target_user_ids: list[int] = None) -> int:
+    """
+    Creates the notifications of a notification object for every subscriber of its channel (or the subscribers in
+    target_user_ids) with a single INSERT ... SELECT, without loading the subscribers.
+
+    :return: amount of notifications created
+    """
+    start = time.perf_counter()
+    now = timezone.now()
+    params = [now, now, notification_object_id]
+    target_filter = ''
+
+    if target_user_ids is not None:
+        target_filter = 'AND subscription.user_id = ANY(%s)'
+        params.append(list(target_user_ids))
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO {Notification._meta.db_table} (created_at, updated_at, user_id, notification_object_id, read)
+            SELECT %s, %s, subscription.user_id, notification_object.id, false
+            FROM {NotificationObject._meta.db_table} notification_object
+            JOIN {NotificationSubscription._meta.db_table} subscription
+                ON subscription.channel_id = notification_object.channel_id
+            WHERE notification_object.id = %s {target_filter}
+            ON CONFLICT (user_id, notification_object_id) DO NOTHING
+        """, params)
+        created = cursor.rowcount
+
+    logger.info('Notification object %s fanned out to %s user(s) in %.1f ms',
+                notification_object_id, created, (time.perf_counter() - start) * 1000)
+
+    return created
+
+
 def notification_shift(*, category: str, sender_type: str, sender_id: int,
                        related_id: int = None, timestamp: datetime = None,
                        timestamp__lt: datetime = None, timestamp__gt: datetime = None, action: str = None,
@@ -93,8 +139,29 @@ def notification_delete(*, category: str, sender_type: str, sender_id: int,
     notifications.delete()
 
 
-def notification_mark_read(*, fetched_by: int, notification_ids: list[int], read: bool) -> None:
-    Notification.objects.filter(user_id=fetched_by, id__in=notification_ids).update(read=read)
+def notification_mark_read(*, fetched_by: int, read: bool, notification_ids: list[int] = None,
+                           object_ids: list[int] = None) -> None:
+    if notification_ids:
+        Notification.objects.filter(user_id=fetched_by, id__in=notification_ids).update(read=read)
+
+    # Pulled notifications have no Notification row until their read state is overridden
+    if object_ids:
+        object_ids = NotificationObject.objects.filter(notification_visible(user_id=fetched_by),
+                                                       id__in=object_ids).values_list('id', flat=True)
+        Notification.objects.bulk_create([Notification(user_id=fetched_by, notification_object_id=object_id, read=read)
+                                          for object_id in object_ids],
+                                         update_conflicts=True,
+                                         unique_fields=['user', 'notification_object'],
+                                         update_fields=['read'])
+
+
+def notification_mark_all_read(*, fetched_by: int, timestamp: datetime = None) -> None:
+    """Marks every notification of the user up to timestamp (or now) as read, moving the read watermark"""
+    timestamp = timestamp or timezone.now()
+    Notification.objects.filter(user_id=fetched_by, read=False,
+                                notification_object__timestamp__lte=timestamp).update(read=True)
+    NotificationSubscription.objects.filter(Q(read_until__isnull=True) | Q(read_until__lt=timestamp),
+                                            user_id=fetched_by).update(read_until=timestamp)
 
 
 def notification_channel_subscribe(*,
@@ -112,6 +179,7 @@ def notification_channel_subscribe(*,
     future_notifications = [Notification(user_id=user_id, notification_object=notification_object)
                             for notification_object
                             in NotificationObject.objects.filter(channel=channel,
+                                                                 pull=False,
                                                                  timestamp__gte=timezone.now()).all()]
     Notification.objects.bulk_create(future_notifications)
     subscription.full_clean()
@@ -1,3 +1,13 @@
+from celery import shared_task
+
+from flowback.notification.services import notification_fan_out
+
+
+@shared_task
+def notification_fan_out_task(notification_object_id: int, target_user_ids: list[int] = None) -> int:
+    return notification_fan_out(notification_object_id=notification_object_id, target_user_ids=target_user_ids)
+
+
 # TODO Fix
 # import json
 #
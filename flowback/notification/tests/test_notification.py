@@ -0,0 +1,65 @@
+from unittest.mock import patch
+
+from rest_framework.test import APITransactionTestCase
+
+from flowback.notification.models import Notification
+from flowback.notification.selectors import notification_list
+from flowback.notification.services import (NotificationManager,
+                                            notification_create,
+                                            notification_mark_read,
+                                            notification_mark_all_read)
+from flowback.user.tests.factories import UserFactory
+
+
+class NotificationTest(APITransactionTestCase):
+    def setUp(self):
+        self.manager = NotificationManager(sender_type="notification", possible_categories=["lorem",
+                                                                                            "ipsum",
+                                                                                            "dolor"])
+        self.user = UserFactory()
+
+    def test_notification_unsubscribe(self):
+        channel = self.manager.load_channel(sender_id=1, category='lorem')
+        self.manager.channel_subscribe(user_id=self.user.id, sender_id=channel.id, category="lorem")
+        self.manager.channel_unsubscribe(user_id=self.user.id, sender_id=channel.id, category="lorem")
+
+    def test_notification_create_fan_out(self):
+        subscribers = UserFactory.create_batch(3)
+        for user in subscribers:
+            self.manager.channel_subscribe(user_id=user.id, sender_id=1, category="ipsum")
+
+        notification_object = notification_create(action='create', category='ipsum', sender_type='notification',
+                                                   sender_id=1, message='lorem ipsum')
+        self.assertEqual(set(Notification.objects.filter(notification_object=notification_object)
+                             .values_list('user_id', flat=True)), {user.id for user in subscribers})
+
+        notification_object = notification_create(action='create', category='ipsum', sender_type='notification',
+                                                   sender_id=1, message='lorem ipsum',
+                                                   target_user_ids=[subscribers[0].id, self.user.id])
+        self.assertEqual(list(Notification.objects.filter(notification_object=notification_object)
+                              .values_list('user_id', flat=True)), [subscribers[0].id])
+
+    @patch('flowback.notification.services.FLOWBACK_NOTIFICATION_PULL_LIMIT', 1)
+    def test_notification_pull(self):
+        subscriber = UserFactory()
+        for user in (self.user, subscriber):
+            self.manager.channel_subscribe(user_id=user.id, sender_id=1, category="dolor")
+
+        notification_objects = [notification_create(action='create', category='dolor', sender_type='notification',
+                                                    sender_id=1, message=f'lorem {i}') for i in range(3)]
+        self.assertTrue(all(notification_object.pull for notification_object in notification_objects))
+        self.assertFalse(Notification.objects.exists())
+
+        inbox = notification_list(user=self.user)
+        self.assertEqual([(n.id, n.notification_id, n.read) for n in inbox],
+                         [(n.id, None, False) for n in notification_objects])
+
+        notification_mark_all_read(fetched_by=self.user.id)
+        notification_mark_read(fetched_by=self.user.id, object_ids=[notification_objects[1].id], read=False)
+        self.assertEqual([n.read for n in notification_list(user=self.user)], [True, False, True])
+        self.assertEqual(list(notification_list(user=self.user, filters=dict(read=False)).values_list('id', flat=True)),
+                         [notification_objects[1].id])
+
+        # Other subscribers keep their own read state, users that aren't subscribed don't see pulled notifications
+        self.assertEqual([n.read for n in notification_list(user=subscriber)], [False, False, False])
+        self.assertFalse(notification_list(user=UserFactory()).exists())
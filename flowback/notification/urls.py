@@ -2,6 +2,7 @@ from django.urls import path
 
 from .views import (NotificationListAPI,
                     NotificationMarkReadAPI,
+                    NotificationMarkAllReadAPI,
                     NotificationUnsubscribeAPI,
                     NotificationSubscriptionListAPI)
 
@@ -10,5 +11,6 @@ notification_patterns = [
     path('list', NotificationListAPI.as_view(), name='notification_list'),
     path('subscription', NotificationSubscriptionListAPI.as_view(), name='notification_subscription_list'),
     path('read', NotificationMarkReadAPI.as_view(), name='notification_mark_read'),
+    path('read/all', NotificationMarkAllReadAPI.as_view(), name='notification_mark_all_read'),
     path('unsubscribe', NotificationUnsubscribeAPI.as_view(), name='notification_unsubscribe')
 ]
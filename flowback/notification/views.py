@@ -5,15 +5,18 @@ from rest_framework import serializers, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from flowback.common.pagination import LimitOffsetPagination, get_paginated_response
+from flowback.common.pagination import LimitOffsetPagination, CursorPagination, get_paginated_response
 from flowback.notification.selectors import notification_list, notification_subscription_list
-from flowback.notification.services import notification_mark_read, notification_channel_unsubscribe
+from flowback.notification.services import (notification_mark_read,
+                                            notification_mark_all_read,
+                                            notification_channel_unsubscribe)
 
 
 class NotificationListAPI(APIView):
-    class Pagination(LimitOffsetPagination):
+    class Pagination(CursorPagination):
         max_limit = 100
         default_limit = 20
+        ordering = ('timestamp',)
 
     class FilterSerializer(serializers.Serializer):
         id = serializers.IntegerField(required=False)
@@ -32,15 +35,15 @@ class NotificationListAPI(APIView):
                                                     'notification_object__timestamp_desc'])
 
     class OutputSerializer(serializers.Serializer):
-        id = serializers.IntegerField()
-        object_id = serializers.IntegerField(source='notification_object_id')
-        message = serializers.CharField(source='notification_object.message')
-        timestamp = serializers.DateTimeField(source='notification_object.timestamp')
-        action = serializers.CharField(source='notification_object.action')
-        channel_sender_id = serializers.IntegerField(source='notification_object.channel.sender_id')
-        channel_sender_type = serializers.CharField(source='notification_object.channel.sender_type')
-        channel_id = serializers.IntegerField(source='notification_object.channel_id')
-        channel_category = serializers.CharField(source='notification_object.channel.category')
+        id = serializers.IntegerField(source='notification_id', allow_null=True)  # Null for unread pulled notifications
+        object_id = serializers.IntegerField(source='id')
+        message = serializers.CharField()
+        timestamp = serializers.DateTimeField()
+        action = serializers.CharField()
+        channel_sender_id = serializers.IntegerField(source='channel.sender_id')
+        channel_sender_type = serializers.CharField(source='channel.sender_type')
+        channel_id = serializers.IntegerField()
+        channel_category = serializers.CharField(source='channel.category')
         read = serializers.BooleanField()
 
     def get(self, request):
@@ -84,7 +87,8 @@ class NotificationSubscriptionListAPI(APIView):
 
 class NotificationMarkReadAPI(APIView):
     class InputSerializer(serializers.Serializer):
-        notification_ids = serializers.ListField(child=serializers.IntegerField())
+        notification_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+        object_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
         read = serializers.BooleanField()
 
     def post(self, request):
@@ -95,6 +99,18 @@ class NotificationMarkReadAPI(APIView):
         return Response(status=status.HTTP_200_OK)
 
 
+class NotificationMarkAllReadAPI(APIView):
+    class InputSerializer(serializers.Serializer):
+        timestamp = serializers.DateTimeField(required=False)
+
+    def post(self, request):
+        serializer = self.InputSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        notification_mark_all_read(fetched_by=request.user.id, **serializer.validated_data)
+        return Response(status=status.HTTP_200_OK)
+
+
 class NotificationUnsubscribeAPI(APIView):
     class InputSerializer(serializers.Serializer):
         channel_sender_type = serializers.CharField(source='sender_type')
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from flowback.poll.services.prediction_statistics import (poll_prediction_statistics_rebuild,
+                                                          poll_prediction_statistics_check,
+                                                          poll_prediction_statistics_tags)
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds or checks the incrementally maintained prediction statistics of every tag'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Replace the statistics with a full recomputation')
+        parser.add_argument('--check', action='store_true', help='Compare the statistics with a full recomputation')
+        parser.add_argument('--tag', type=int, action='append', dest='tags', help='Only the given tag id(s)')
+        parser.add_argument('--tolerance', type=float, default=1e-6)
+
+    def handle(self, *args, rebuild: bool, check: bool, tags: list[int], tolerance: float, **options):
+        if not rebuild and not check:
+            raise CommandError('Use --rebuild and/or --check')
+
+        tags = tags or poll_prediction_statistics_tags()
+        mismatched_tags = 0
+
+        for tag_id in tags:
+            if rebuild:
+                computation = poll_prediction_statistics_rebuild(tag_id=tag_id)
+                self.stdout.write(f'Tag {tag_id}: rebuilt from {computation.statement_count} statements, '
+                                  f'{len(computation.predictor_statistics)} predictor pairs')
+
+            if check:
+                mismatches = poll_prediction_statistics_check(tag_id=tag_id, tolerance=tolerance)
+                mismatched_tags += bool(mismatches)
+
+                for mismatch in mismatches:
+                    self.stdout.write(self.style.ERROR(f'Tag {tag_id}: {mismatch}'))
+
+        if check and mismatched_tags:
+            raise CommandError(f'{mismatched_tags} of {len(tags)} tag(s) do not match the full recomputation')
+
+        if check:
+            self.stdout.write(self.style.SUCCESS(f'{len(tags)} tag(s) match the full recomputation'))
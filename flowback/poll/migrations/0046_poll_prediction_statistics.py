@@ -0,0 +1,65 @@
+# Generated by Django 4.2.17 on 2026-10-18 03:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('group', '0046_alter_workgroup_chat_and_more'),
+        ('poll', '0045_poll_interval_mean_absolute_correctness'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pollpredictionstatement',
+            name='applied_error',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pollpredictionstatement',
+            name='applied_outcome',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='poll',
+            name='interval_mean_absolute_correctness',
+            field=models.DecimalField(blank=True, decimal_places=9, help_text='Calculates after end date, will contain the current Interval Mean Absolute Correctness at the time of calculation.', max_digits=12, null=True),
+        ),
+        migrations.CreateModel(
+            name='PollPredictionStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('statement_count', models.IntegerField(default=0)),
+                ('outcome_sum', models.FloatField(default=0)),
+                ('error_count', models.IntegerField(default=0)),
+                ('error_sum', models.FloatField(default=0)),
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='group.grouptags')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='PollPredictionPredictorStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('count', models.IntegerField(default=0)),
+                ('bet_sum', models.FloatField(default=0)),
+                ('error_sum', models.FloatField(default=0)),
+                ('error_product_sum', models.FloatField(default=0)),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='group.groupuser')),
+                ('predictor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='group.groupuser')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='group.grouptags')),
+            ],
+            options={
+                'unique_together': {('tag', 'predictor', 'other')},
+            },
+        ),
+    ]
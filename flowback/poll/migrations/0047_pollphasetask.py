@@ -0,0 +1,56 @@
+# Generated by Django 4.2.17 on 2026-10-18 04:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def schedule_running_polls(apps, schema_editor):
+    # Phases of running polls that already passed were handled by their Celery ETA tasks
+    Poll = apps.get_model('poll', 'poll')
+    PollPhaseTask = apps.get_model('poll', 'pollphasetask')
+    now = django.utils.timezone.now()
+
+    tasks = []
+    for poll in Poll.objects.filter(end_date__gt=now).only('id', 'area_vote_end_date',
+                                                           'prediction_bet_end_date', 'end_date'):
+        for task, due_at in (('area_vote_count', poll.area_vote_end_date),
+                             ('prediction_bet_count', poll.prediction_bet_end_date),
+                             ('proposal_vote_count', poll.end_date)):
+            # Dynamic and schedule polls only have an end date
+            if due_at is None:
+                continue
+
+            tasks.append(PollPhaseTask(poll_id=poll.id,
+                                       task=task,
+                                       due_at=due_at,
+                                       dispatched_at=due_at if due_at <= now else None))
+
+    PollPhaseTask.objects.bulk_create(tasks, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0046_poll_prediction_statistics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PollPhaseTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('task', models.CharField(choices=[('area_vote_count', 'Area vote count'), ('prediction_bet_count', 'Prediction bet count'), ('proposal_vote_count', 'Proposal vote count')], max_length=32)),
+                ('due_at', models.DateTimeField()),
+                ('dispatched_at', models.DateTimeField(blank=True, null=True)),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='poll.poll')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('dispatched_at__isnull', True)), fields=['due_at'], name='poll_phase_task_pending_idx')],
+                'unique_together': {('poll', 'task')},
+            },
+        ),
+        migrations.RunPython(schedule_running_polls, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.17 on 2026-10-18 04:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0047_pollphasetask'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='poll',
+            index=models.Index(fields=['created_by', 'work_group'], name='poll_created_by_work_group_idx'),
+        ),
+    ]
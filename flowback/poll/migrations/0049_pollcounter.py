@@ -0,0 +1,43 @@
+# Generated by Django 4.2.17 on 2026-10-18 05:32
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def count(model, parent: str, **condition):
+    return Coalesce(Subquery(model.objects.filter(**{parent: OuterRef('pk')}, **condition)
+                             .values(parent).annotate(total=Count('*')).values('total')[:1]), 0)
+
+
+def pre_populate_fields(apps, schema_editor):
+    Poll = apps.get_model('poll', 'poll')
+    PollCounter = apps.get_model('poll', 'pollcounter')
+    PollProposal = apps.get_model('poll', 'pollproposal')
+    PollPredictionStatement = apps.get_model('poll', 'pollpredictionstatement')
+
+    PollCounter.objects.bulk_create([PollCounter(poll_id=poll_id)
+                                     for poll_id in Poll.objects.values_list('id', flat=True).iterator()],
+                                    batch_size=1000)
+    PollCounter.objects.update(total_proposals=count(PollProposal, 'poll_id'),
+                               total_predictions=count(PollPredictionStatement, 'poll_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0048_poll_poll_created_by_work_group_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PollCounter',
+            fields=[
+                ('poll', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counter', serialize=False, to='poll.poll')),
+                ('total_proposals', models.IntegerField(default=0)),
+                ('total_predictions', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(pre_populate_fields, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.17 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0049_pollcounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pollphasetask',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
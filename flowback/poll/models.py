@@ -2,7 +2,7 @@ from datetime import datetime
 
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
-from django.db.models import Q, F, Count
+from django.db.models import Q, F, Count, Case, When, Value
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
@@ -15,6 +15,7 @@ from flowback.prediction.models import (PredictionBet,
                                         PredictionStatement,
                                         PredictionStatementSegment,
                                         PredictionStatementVote)
+from flowback.common.counters import ModelCounter, counter_register
 from flowback.common.models import BaseModel
 from flowback.group.models import Group, GroupUser, GroupUserDelegatePool, GroupTags, WorkGroup
 from flowback.comment.models import CommentSection, comment_section_create_model_default
@@ -24,6 +25,61 @@ from flowback.schedule.models import Schedule, ScheduleEvent
 from flowback.schedule.services import create_schedule
 
 
+# Phases of a poll in order, as (field the phase starts at, phase). A poll is in the last phase that has started,
+# or 'waiting' before the first one
+POLL_PHASES = (('start_date', 'area_vote'),
+               ('area_vote_end_date', 'proposal'),
+               ('proposal_end_date', 'prediction_statement'),
+               ('prediction_statement_end_date', 'prediction_bet'),
+               ('prediction_bet_end_date', 'delegate_vote'),
+               ('delegate_vote_end_date', 'vote'),
+               ('vote_end_date', 'result'),
+               ('end_date', 'prediction_vote'))
+POLL_PHASES_DYNAMIC = (('start_date', 'dynamic'), ('end_date', 'result'))
+POLL_PHASES_SCHEDULE = (('start_date', 'schedule'), ('end_date', 'result'))
+
+
+class PollQuerySet(models.QuerySet):
+    @staticmethod
+    def _phase_tables() -> tuple:
+        return ((Q(dynamic=True, poll_type=Poll.PollType.SCHEDULE), POLL_PHASES_SCHEDULE),
+                (Q(dynamic=True) & ~Q(poll_type=Poll.PollType.SCHEDULE), POLL_PHASES_DYNAMIC),
+                (Q(dynamic=False), POLL_PHASES))
+
+    @classmethod
+    def phase_expression(cls, now: datetime = None) -> Case:
+        """The phase of each poll at the given time, the SQL equivalent of Poll.phase_at"""
+        now = now or timezone.now()
+
+        return Case(*[When(condition & Q(**{f'{field}__lte': now}), then=Value(phase))
+                      for condition, table in cls._phase_tables()
+                      for field, phase in reversed(table)],
+                    default=Value('waiting'),
+                    output_field=models.CharField())
+
+    def annotate_phase(self, now: datetime = None):
+        return self.annotate(phase=self.phase_expression(now))
+
+    def filter_phase(self, *phases: str, now: datetime = None):
+        """
+        Polls currently in any of the given phases, as range conditions on the phase dates rather than a filter on
+        phase_expression, which lets the database use indexes on the dates
+        """
+        now = now or timezone.now()
+        q = Q(pk__in=[])
+
+        for condition, table in self._phase_tables():
+            if 'waiting' in phases:
+                q |= condition & Q(**{f'{table[0][0]}__gt': now})
+
+            for i, (field, phase) in enumerate(table):
+                if phase in phases:
+                    q |= condition & Q(**{f'{field}__lte': now}) & (Q(**{f'{table[i + 1][0]}__gt': now})
+                                                                     if i + 1 < len(table) else Q())
+
+        return self.filter(q)
+
+
 # Create your models here.
 class Poll(BaseModel):
     class PollType(models.IntegerChoices):
@@ -76,7 +132,14 @@ class Poll(BaseModel):
     0 - Ongoing
     1 - Finished
     -1 - Failed Quorum
+
+    A poll only moves from ongoing to finished/failed quorum, see flowback.poll.tasks.poll_proposal_vote_count
     """
+    class Status(models.IntegerChoices):
+        ONGOING = 0, _('ongoing')
+        FINISHED = 1, _('finished')
+        FAILED_QUORUM = -1, _('failed_quorum')
+
     status = models.IntegerField(default=0)
 
     """
@@ -96,29 +159,23 @@ class Poll(BaseModel):
     participants = models.IntegerField(default=0)
     dynamic = models.BooleanField()
 
+    objects = PollQuerySet.as_manager()
+
     @property
     def finished(self):
         return self.vote_end_date <= timezone.now()
 
     @property
-    def labels(self) -> tuple:
+    def phases(self) -> tuple:
+        """(field, phase) of every phase of this poll, see POLL_PHASES"""
         if self.dynamic:
-            if self.poll_type == self.PollType.SCHEDULE:
-                return ((self.start_date, 'start_date', 'schedule'),
-                        (self.end_date, 'end_date', 'result'))
+            return POLL_PHASES_SCHEDULE if self.poll_type == self.PollType.SCHEDULE else POLL_PHASES_DYNAMIC
 
-            else:
-                return ((self.start_date, 'start_date', 'dynamic'),
-                        (self.end_date, 'end_date', 'result'))
-
-        return ((self.start_date, 'start_date', 'area_vote'),
-                (self.area_vote_end_date, 'area_vote_end_date', 'proposal'),
-                (self.proposal_end_date, 'proposal_end_date', 'prediction_statement'),
-                (self.prediction_statement_end_date, 'prediction_statement_end_date', 'prediction_bet'),
-                (self.prediction_bet_end_date, 'prediction_bet_end_date', 'delegate_vote'),
-                (self.delegate_vote_end_date, 'delegate_vote_end_date', 'vote'),
-                (self.vote_end_date, 'vote_end_date', 'result'),
-                (self.end_date, 'end_date', 'prediction_vote'))
+        return POLL_PHASES
+
+    @property
+    def labels(self) -> tuple:
+        return tuple((getattr(self, field), field, phase) for field, phase in self.phases)
 
     @property
     def time_table(self) -> list:
@@ -183,20 +240,37 @@ class Poll(BaseModel):
                        models.CheckConstraint(check=~Q(Q(poll_type=3) & Q(dynamic=False)),
                                               name='polltypeisscheduleanddynamic_check')]
 
+        # Joins from the visible memberships of a user to their polls, see group_content_visible_for
+        indexes = [models.Index(fields=['created_by', 'work_group'], name='poll_created_by_work_group_idx')]
+
     @property
     def schedule_origin(self):
         return 'group_poll'
 
+    def phase_at(self, now: datetime) -> str:
+        for field, phase in reversed(self.phases):
+            if now >= getattr(self, field):
+                return phase
+
+        return 'waiting'
+
     @property
     def current_phase(self) -> str:
-        labels = self.labels
-        current_time = timezone.now()
+        """
+        The phase when first asked for, resolved once per instance (or taken from PollQuerySet.annotate_phase) so
+        every check in a request sees the same phase. Changing the phase dates resolves it again.
+        """
+        key = (self.phases, *(getattr(self, field) for field, _ in self.phases))
+        cached = self.__dict__.get('_current_phase')
 
-        for x in reversed(range(len(labels))):
-            if current_time >= labels[x][0]:
-                return labels[x][2]
+        if cached is None and 'phase' in self.__dict__:
+            cached = (key, self.__dict__['phase'])
 
-        return 'waiting'
+        if cached is None or cached[0] != key:
+            cached = (key, self.phase_at(timezone.now()))
+
+        self._current_phase = cached
+        return cached[1]
 
     def get_phase(self, phase: str, field_name=False) -> datetime | str:
         time_table = self.time_table
@@ -212,9 +286,7 @@ class Poll(BaseModel):
         raise Exception('Phase not found')
 
     def phase_exist(self, phase: str, raise_exception=True):
-        phases = [label[2] for label in self.labels]
-
-        if phase in phases:
+        if phase in (name for _, name in self.phases):
             return True
 
         if raise_exception:
@@ -223,7 +295,7 @@ class Poll(BaseModel):
         return False
 
     def check_phase(self, *phases: str):
-        if not any(self.phase_exist(phase, raise_exception=False) for phase in phases):
+        if not any(phase in phases for _, phase in self.phases):
             raise ValidationError(f'Action is unavailable for this poll')
 
         current_phase = self.current_phase
@@ -253,6 +325,26 @@ post_save.connect(Poll.post_save, sender=Poll)
 post_delete.connect(Poll.post_delete, sender=Poll)
 
 
+# Pending phase transition work of a poll, dispatched by flowback.poll.tasks.poll_phase_dispatch once due
+class PollPhaseTask(BaseModel):
+    class Task(models.TextChoices):
+        AREA_VOTE_COUNT = 'area_vote_count', _('Area vote count')
+        PREDICTION_BET_COUNT = 'prediction_bet_count', _('Prediction bet count')
+        PROPOSAL_VOTE_COUNT = 'proposal_vote_count', _('Proposal vote count')
+
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE)
+    task = models.CharField(max_length=32, choices=Task.choices)
+    due_at = models.DateTimeField()
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)  # Failed runs, see poll_phase_task_retry
+
+    class Meta:
+        unique_together = ('poll', 'task')
+        indexes = [models.Index(fields=['due_at'],
+                                condition=Q(dispatched_at__isnull=True),
+                                name='poll_phase_task_pending_idx')]
+
+
 class PollTypeSchedule(BaseModel):
     poll = models.OneToOneField(Poll, on_delete=models.CASCADE)
     schedule = models.OneToOneField(Schedule, on_delete=models.CASCADE)
@@ -418,6 +510,11 @@ class PollPredictionStatement(PredictionStatement):
     created_by = models.ForeignKey(GroupUser, on_delete=models.CASCADE)
     poll = models.ForeignKey(Poll, on_delete=models.CASCADE)
 
+    # Outcome (0, 0.5 or 1) and absolute error of the combined bet currently counted in PollPredictionStatistics,
+    # null if the statement is not counted (yet)
+    applied_outcome = models.FloatField(null=True, blank=True)
+    applied_error = models.FloatField(null=True, blank=True)
+
     def clean(self):
         if self.poll.end_date > self.end_date:
             raise ValidationError('Poll ends later than prediction statement deadline')
@@ -430,6 +527,23 @@ class PollPredictionStatement(PredictionStatement):
             .delete()
 
 
+# Denormalized counts for poll_list, kept up-to-date by flowback.common.counters
+class PollCounter(models.Model):
+    poll = models.OneToOneField(Poll, primary_key=True, related_name='counter', on_delete=models.CASCADE)
+    total_proposals = models.IntegerField(default=0)
+    total_predictions = models.IntegerField(default=0)
+
+
+counter_register(ModelCounter(counter_model=PollCounter,
+                              field='total_proposals',
+                              model=PollProposal,
+                              parent='poll_id'))
+counter_register(ModelCounter(counter_model=PollCounter,
+                              field='total_predictions',
+                              model=PollPredictionStatement,
+                              parent='poll_id'))
+
+
 class PollPredictionStatementSegment(PredictionStatementSegment):
     prediction_statement = models.ForeignKey(PollPredictionStatement, on_delete=models.CASCADE)
     proposal = models.ForeignKey(PollProposal, on_delete=models.CASCADE)
@@ -460,6 +574,36 @@ class PollPredictionBet(PredictionBet):
             prediction_statement__pollpredictionstatementsegment__proposal=instance).delete()
 
 
+# Running sums over every ended prediction statement in a tag, maintained by
+# flowback.poll.services.prediction_statistics
+class PollPredictionStatistics(BaseModel):
+    tag = models.OneToOneField(GroupTags, on_delete=models.CASCADE)
+
+    # Every counted statement, used for the mean outcome of the tag (undecided statements count as 0.5)
+    statement_count = models.IntegerField(default=0)
+    outcome_sum = models.FloatField(default=0)
+
+    # Statements with votes and a combined bet, used for the interval mean absolute correctness
+    error_count = models.IntegerField(default=0)
+    error_sum = models.FloatField(default=0)
+
+
+# Sums over the decided statements in a tag that both predictor and other have bet on,
+# predictor == other holds the statistics of the predictor on its own
+class PollPredictionPredictorStatistics(BaseModel):
+    tag = models.ForeignKey(GroupTags, on_delete=models.CASCADE)
+    predictor = models.ForeignKey(GroupUser, on_delete=models.CASCADE)
+    other = models.ForeignKey(GroupUser, on_delete=models.CASCADE, related_name='+')
+
+    count = models.IntegerField(default=0)
+    bet_sum = models.FloatField(default=0)
+    error_sum = models.FloatField(default=0)
+    error_product_sum = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ('tag', 'predictor', 'other')
+
+
 class PollPhaseTemplate(BaseModel):
     created_by_group_user = models.ForeignKey(GroupUser, on_delete=models.CASCADE)
     name = models.CharField(max_length=255)
@@ -1,4 +1,4 @@
-from flowback.comment.selectors import comment_list, comment_ancestor_list
+from flowback.comment.selectors import comment_list, comment_ancestor_list, comment_tree
 from flowback.common.services import get_object
 from flowback.poll.models import Poll, PollDelegateVoting
 from flowback.user.models import User
@@ -14,6 +14,13 @@ def poll_comment_list(*, fetched_by: User, poll_id: int, filters=None):
     return comment_list(fetched_by=fetched_by, comment_section_id=poll.comment_section.id, filters=filters)
 
 
+def poll_comment_tree(*, fetched_by: User, poll_id: int, **kwargs):
+    poll = get_object(Poll, id=poll_id)
+    group_user_permissions(user=fetched_by, group=poll.created_by.group.id)
+
+    return comment_tree(fetched_by=fetched_by, comment_section_id=poll.comment_section_id, **kwargs)
+
+
 def poll_comment_ancestor_list(*, fetched_by: User, poll_id: int, comment_id: int):
     poll = get_object(Poll, id=poll_id)
     group_user_permissions(user=fetched_by, group=poll.created_by.group.id)
@@ -1,17 +1,14 @@
 from typing import Union
 
 import django_filters
-from django.db.models import Q, Exists, OuterRef, Count, Subquery, Case, When, Value, CharField
+from django.db.models import Exists, OuterRef, F
 from django.db.models.functions import Coalesce
-from django.utils import timezone
 
-from flowback.comment.models import Comment
 from flowback.common.filters import ExistsFilter, NumberInFilter
 from flowback.group.models import Group
-from flowback.poll.models import Poll, PollPhaseTemplate, PollPredictionStatement
+from flowback.poll.models import Poll, PollPhaseTemplate
 from flowback.user.models import User
-from flowback.group.models import WorkGroupUser
-from flowback.group.selectors import group_user_permissions
+from flowback.group.selectors import group_user_permissions, group_content_visible_for
 
 
 class BasePollFilter(django_filters.FilterSet):
@@ -27,7 +24,7 @@ class BasePollFilter(django_filters.FilterSet):
     has_attachments = ExistsFilter(field_name='attachments')
     tag_name = django_filters.CharFilter(lookup_expr=['exact', 'icontains'], field_name='tag__name')
     tag_id = django_filters.NumberFilter(lookup_expr='exact', field_name='tag__id')
-    phase = django_filters.CharFilter(lookup_expr='iexact')
+    phase = django_filters.CharFilter(method='phase_filter')
     work_group_ids = NumberInFilter(field_name="work_group_id")
 
     class Meta:
@@ -49,75 +46,20 @@ class BasePollFilter(django_filters.FilterSet):
                       vote_end_date=['lt', 'gt'],
                       end_date=['lt', 'gt'])
 
+    def phase_filter(self, queryset, name, value):
+        return queryset.filter_phase(value.lower())
+
 
 # TODO order_by(pinned, param)
 def poll_list(*, fetched_by: User, group_id: Union[int, None], filters=None):
     filters = filters or {}
 
-    # Determine phase by case qs
-    poll_phase = Case(
-        When(dynamic=True, end_date__lt=timezone.now(), then=Value('result')),
-        When(end_date__lt=timezone.now(), then=Value('prediction_vote')),
-
-        When(dynamic=True, vote_end_date__lte=timezone.now(), then=Value('result_default')),
-        When(vote_end_date__lte=timezone.now(), then=Value('result')),
-
-        When(delegate_vote_end_date__lte=timezone.now(), then=Value('vote')),
-        When(prediction_bet_end_date__lte=timezone.now(), then=Value('delegate_vote')),
-        When(prediction_statement_end_date__lte=timezone.now(), then=Value('prediction_bet')),
-        When(proposal_end_date__lte=timezone.now(), then=Value('prediction_statement')),
-        When(area_vote_end_date__lte=timezone.now(), then=Value('proposal')),
-
-        When(dynamic=True,
-             poll_type=Poll.PollType.SCHEDULE,
-             start_date__lte=timezone.now(),
-             then=Value('schedule')),
-        When(dynamic=True, start_date__lte=timezone.now(), then=Value('dynamic')),
-        When(start_date__lte=timezone.now(), then=Value('area_vote')),
-
-        default=Value('waiting'),
-        output_field=CharField()
-    )
-    
-    polls = Poll.objects.filter(
-
-        ).values('id')
-
-
-    q = (Q(created_by__group__groupuser__user__in=[fetched_by])
-         & Q(created_by__group__groupuser__active=True))  # User in group
-
-
-    base_qs = (
-        q & Q(work_group__isnull=True)  # User in Group
-
-        | Q(created_by__group__public=True)
-        & ~Q(created_by__group__groupuser__user__in=[fetched_by])  # Group is Public
-        & Q(work_group__isnull=True)
-        
-        | q & Q(work_group__isnull=False)  # User in workgroup
-        & Q(work_group__workgroupuser__group_user__user=fetched_by)
-
-        | q & Q(created_by__group__public=True)
-        & Q(created_by__group__groupuser__user__in=[fetched_by])
-        & Q(created_by__group__groupuser__active=False)  # User in group but not active, and group is public
-    
-        | q & Q(work_group__isnull=False)  # User is admin in group
-        & Q(created_by__group__groupuser__user=fetched_by)
-        & ~Q(created_by__group__groupuser__user__in=[fetched_by])
-        & Q(created_by__group__groupuser__is_admin=True))
-
-
     joined_groups = Group.objects.filter(id=OuterRef('created_by__group_id'), groupuser__user__in=[fetched_by])
-    qs = Poll.objects.filter(base_qs).annotate(phase=poll_phase,
+    qs = Poll.objects.filter(group_content_visible_for(user=fetched_by)).annotate_phase().annotate(
                 group_joined=Exists(joined_groups),
-                total_comments=Coalesce(Subquery(
-                    Comment.objects.filter(comment_section_id=OuterRef('comment_section_id'), active=True).values(
-                        'comment_section_id').annotate(total=Count('*')).values('total')[:1]), 0),
-                total_proposals=Count('pollproposal', distinct=True),
-                total_predictions=Coalesce(Subquery(
-                    PollPredictionStatement.objects.filter(poll_id=OuterRef('id')).values('poll_id')
-                    .annotate(total=Count('*')).values('total')[:1]), 0)).all()
+                total_comments=F('comment_section__total_comments'),
+                total_proposals=Coalesce(F('counter__total_proposals'), 0),
+                total_predictions=Coalesce(F('counter__total_predictions'), 0)).all()
 
     return BasePollFilter(filters, qs).qs
 
@@ -1,14 +1,17 @@
+from datetime import datetime
+
 import django_filters
+import numpy as np
 from django.db import models
-from django.db.models import Avg, When, F, Case, Count, Q, Exists, Subquery, OuterRef
+from django.db.models import Avg, When, F, Case, Count, Q, Exists, Subquery, OuterRef, Sum
 from django.db.models.fields.related import RelatedField
 from django.db.models.lookups import LessThan
 from django.utils import timezone
 
 from flowback.common.filters import NumberInFilter
 from flowback.group.selectors import group_user_permissions
-from flowback.poll.models import PollPredictionStatement, PollPredictionBet, PollPredictionStatementVote, \
-    PollPredictionStatementSegment
+from flowback.poll.models import Poll, PollPredictionStatement, PollPredictionBet, PollPredictionStatementVote, \
+    PollPredictionStatementSegment, PollPredictionStatistics, PollPredictionPredictorStatistics
 from flowback.user.models import User
 
 
@@ -71,3 +74,134 @@ def poll_prediction_bet_list(*, fetched_by: User, group_id: int = None, filters=
     qs = PollPredictionBet.objects.filter(prediction_statement__created_by__group_id=group_id,
                                           created_by__user=fetched_by).all()
     return BasePollPredictionBetFilter(filters, qs).qs
+
+
+class PollPredictionBetHistory:
+    """
+    Dense view of every bet relevant for combining the bets of a poll.
+
+    Rows follow predictors, columns follow the statements of the poll (current) or earlier statements in the same
+    tag (previous), ordered newest first. Bets are scaled to 0-1, NaN marks a missing bet.
+    """
+    def __init__(self,
+                 predictors: list[int],
+                 current_statements: list[int],
+                 previous_statements: list[int],
+                 previous_outcomes: np.ndarray,
+                 current_bets: np.ndarray,
+                 previous_bets: np.ndarray):
+        self.predictors = predictors
+        self.current_statements = current_statements
+        self.previous_statements = previous_statements
+        self.previous_outcomes = previous_outcomes
+        self.current_bets = current_bets
+        self.previous_bets = previous_bets
+
+
+def poll_prediction_bet_history(*, poll: Poll, timestamp: datetime = None) -> PollPredictionBetHistory:
+    """Loads the bet history for a poll with two queries, regardless of the amount of statements and predictors"""
+    timestamp = timestamp or timezone.now()
+
+    statements = list(PollPredictionStatement.objects.filter(
+        Q(Q(poll__tag=poll.tag,
+            poll__end_date__lte=timestamp,
+            created_at__lte=timestamp) & ~Q(poll=poll)) | Q(poll=poll)
+    ).annotate(
+        outcome_sum=Sum(Case(When(pollpredictionstatementvote__vote=True, then=1),
+                             When(pollpredictionstatementvote__vote=False, then=-1),
+                             default=0,
+                             output_field=models.IntegerField())),
+        outcome=Case(When(outcome_sum__gt=0, then=1),
+                     When(outcome_sum__lt=0, then=0),
+                     default=0.5,
+                     output_field=models.FloatField())
+    ).order_by('-created_at', '-id').values_list('id', 'poll_id', 'outcome'))
+
+    current_statements = [i[0] for i in statements if i[1] == poll.id]
+    previous_statements = [i[0] for i in statements if i[1] != poll.id]
+    previous_outcomes = np.array([i[2] for i in statements if i[1] != poll.id], dtype=float)
+
+    # Only group users that have bet in the given poll are predictors
+    bets = PollPredictionBet.objects.filter(
+        prediction_statement_id__in=[i[0] for i in statements],
+        created_by_id__in=PollPredictionBet.objects.filter(prediction_statement__poll=poll).values('created_by_id')
+    ).values_list('created_by_id', 'prediction_statement_id', 'score')
+
+    predictor_rows, statement_columns, scores = [], [], []
+    for created_by_id, prediction_statement_id, score in bets.iterator(chunk_size=5000):
+        predictor_rows.append(created_by_id)
+        statement_columns.append(prediction_statement_id)
+        scores.append(score / 5)
+
+    predictors = sorted(set(predictor_rows))
+    row_index = {predictor: i for i, predictor in enumerate(predictors)}
+    column_index = {statement: i for i, statement in enumerate(current_statements + previous_statements)}
+
+    matrix = np.full((len(predictors), len(column_index)), np.nan)
+    matrix[[row_index[i] for i in predictor_rows], [column_index[i] for i in statement_columns]] = scores
+
+    return PollPredictionBetHistory(predictors=predictors,
+                                    current_statements=current_statements,
+                                    previous_statements=previous_statements,
+                                    previous_outcomes=previous_outcomes,
+                                    current_bets=matrix[:, :len(current_statements)],
+                                    previous_bets=matrix[:, len(current_statements):])
+
+
+def poll_prediction_current_bets(*, poll: Poll, timestamp: datetime = None) -> PollPredictionBetHistory:
+    """
+    Loads the bets of a poll placed until timestamp (defaults to now) without any history, to be combined with
+    poll_prediction_statistics
+    """
+    timestamp = timestamp or timezone.now()
+    current_statements = list(PollPredictionStatement.objects.filter(poll=poll)
+                              .order_by('-created_at', '-id').values_list('id', flat=True))
+    bets = list(PollPredictionBet.objects.filter(prediction_statement__poll=poll, created_at__lte=timestamp)
+                .values_list('created_by_id', 'prediction_statement_id', 'score'))
+
+    predictors = sorted({i[0] for i in bets})
+    row_index = {predictor: i for i, predictor in enumerate(predictors)}
+    column_index = {statement: i for i, statement in enumerate(current_statements)}
+
+    matrix = np.full((len(predictors), len(current_statements)), np.nan)
+    for created_by_id, prediction_statement_id, score in bets:
+        matrix[row_index[created_by_id], column_index[prediction_statement_id]] = score / 5
+
+    return PollPredictionBetHistory(predictors=predictors,
+                                    current_statements=current_statements,
+                                    previous_statements=[],
+                                    previous_outcomes=np.zeros(0),
+                                    current_bets=matrix,
+                                    previous_bets=np.zeros((len(predictors), 0)))
+
+
+def poll_prediction_statistics(*, tag_id: int, predictors: list[int]) -> dict:
+    """
+    Reads the stored history sums of the given predictors in a tag, in the format of
+    flowback.prediction.combined_bet.bet_statistics together with the mean outcome of the tag
+    """
+    size = len(predictors)
+    statistics = dict(shared=np.zeros((size, size)),
+                      bet_sums=np.zeros((size, size)),
+                      error_sums=np.zeros((size, size)),
+                      error_products=np.zeros((size, size)))
+
+    tag_statistics = PollPredictionStatistics.objects.filter(tag_id=tag_id).first()
+    if not tag_statistics or not tag_statistics.statement_count:
+        return dict(outcome_mean=0.0, **statistics)
+
+    index = {predictor: i for i, predictor in enumerate(predictors)}
+    rows = PollPredictionPredictorStatistics.objects.filter(tag_id=tag_id,
+                                                            predictor_id__in=predictors,
+                                                            other_id__in=predictors
+                                                            ).values_list('predictor_id', 'other_id', 'count',
+                                                                          'bet_sum', 'error_sum', 'error_product_sum')
+
+    for predictor, other, count, bet_sum, error_sum, error_product_sum in rows:
+        k, j = index[predictor], index[other]
+        statistics['shared'][k, j] = count
+        statistics['bet_sums'][k, j] = bet_sum
+        statistics['error_sums'][k, j] = error_sum
+        statistics['error_products'][k, j] = error_product_sum
+
+    return dict(outcome_mean=tag_statistics.outcome_sum / tag_statistics.statement_count, **statistics)
@@ -3,13 +3,12 @@ from flowback.common.services import get_object, model_update
 from flowback.files.services import upload_collection
 from flowback.group.services.group import group_notification
 from flowback.notification.services import NotificationManager
-from flowback.poll.models import Poll, PollPhaseTemplate
+from flowback.poll.models import Poll, PollPhaseTemplate, PollPhaseTask
+from flowback.poll.services.prediction_statistics import poll_prediction_statistics_update
 from flowback.group.selectors import group_user_permissions
 from django.utils import timezone
 from datetime import datetime
 
-from flowback.poll.tasks import poll_area_vote_count, poll_prediction_bet_count, poll_proposal_vote_count
-
 poll_notification = NotificationManager(sender_type='poll', possible_categories=['timeline',
                                                                                  'poll',
                                                                                  'comment_self',
@@ -23,6 +22,24 @@ def poll_notification_subscribe(*, user_id: int, poll_id: int, categories: list[
     poll_notification.channel_subscribe(user_id=user_id, sender_id=poll.id, category=categories)
 
 
+def poll_phase_task_schedule(*, poll: Poll) -> None:
+    """
+    (Re)schedules the phase transition work of a poll, replacing any pending or dispatched tasks. Phases the poll
+    doesn't have (e.g. dynamic and schedule polls only have an end date) get no task.
+    """
+    phases = ((PollPhaseTask.Task.AREA_VOTE_COUNT, poll.area_vote_end_date),
+              (PollPhaseTask.Task.PREDICTION_BET_COUNT, poll.prediction_bet_end_date),
+              (PollPhaseTask.Task.PROPOSAL_VOTE_COUNT, poll.end_date))
+    tasks = [PollPhaseTask(poll=poll, task=task, due_at=due_at, dispatched_at=None, attempts=0)
+             for task, due_at in phases if due_at is not None]
+
+    PollPhaseTask.objects.filter(poll=poll, task__in=[task for task, due_at in phases if due_at is None]).delete()
+    PollPhaseTask.objects.bulk_create(tasks,
+                                      update_conflicts=True,
+                                      unique_fields=['poll', 'task'],
+                                      update_fields=['due_at', 'dispatched_at', 'attempts', 'updated_at'])
+
+
 def poll_create(*, user_id: int,
                 group_id: int,
                 title: str,
@@ -115,9 +132,7 @@ def poll_create(*, user_id: int,
                               timestamp=start_date,
                               related_id=poll.id)
 
-    poll_area_vote_count.apply_async(kwargs=dict(poll_id=poll.id), eta=poll.area_vote_end_date)
-    poll_prediction_bet_count.apply_async(kwargs=dict(poll_id=poll.id), eta=poll.prediction_bet_end_date)
-    poll_proposal_vote_count.apply_async(kwargs=dict(poll_id=poll.id), eta=poll.end_date)
+    poll_phase_task_schedule(poll=poll)
 
     # Poll notification
     for date, name, phase in poll.labels:
@@ -196,6 +211,9 @@ def poll_delete(*, user_id: int, poll_id: int) -> None:
     if poll.attachments:
         poll.attachments.delete()
 
+    poll_prediction_statistics_update(tag_id=poll.tag_id,
+                                      statement_ids=list(poll.pollpredictionstatement_set.values_list('id', flat=True)),
+                                      remove=True)
     poll.delete()
 
 
@@ -228,24 +246,8 @@ def poll_fast_forward(*, user_id: int, poll_id: int, phase: str):
     poll.full_clean()
     poll.save()
 
-    # TODO update/remove previous celery tasks
-    if poll.area_vote_end_date > timezone.now():
-        poll_area_vote_count.apply_async(kwargs=dict(poll_id=poll.id), eta=poll.area_vote_end_date)
-
-    else:
-        poll_area_vote_count.apply_async(kwargs=dict(poll_id=poll.id), countdown=1)
-
-    if poll.prediction_bet_end_date > timezone.now():
-        poll_prediction_bet_count.apply_async(kwargs=dict(poll_id=poll.id), eta=poll.prediction_bet_end_date)
-
-    else:
-        poll_prediction_bet_count.apply_async(kwargs=dict(poll_id=poll.id), countdown=1)
-
-    if poll.end_date > timezone.now():
-        poll_proposal_vote_count.apply_async(kwargs=dict(poll_id=poll.id), eta=poll.end_date)
-
-    else:
-        poll_proposal_vote_count.apply_async(kwargs=dict(poll_id=poll.id), countdown=1)
+    # Phases that are already due are dispatched again, the counting tasks are idempotent
+    poll_phase_task_schedule(poll=poll)
 
     poll_notification.shift(sender_id=poll_id,
                             category='timeline',
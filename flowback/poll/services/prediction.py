@@ -3,6 +3,7 @@ from typing import Union
 from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 
+from .prediction_statistics import poll_prediction_statistics_update
 from ..models import (PollPredictionBet,
                       PollPredictionStatement,
                       PollPredictionStatementSegment,
@@ -154,6 +155,8 @@ def poll_prediction_statement_vote_create(user: Union[int, User], prediction_sta
     prediction_vote.full_clean()
     prediction_vote.save()
 
+    poll_prediction_statistics_update(tag_id=prediction_statement.poll.tag_id, statement_ids=[prediction_statement.id])
+
 
 def poll_prediction_statement_vote_update(user: Union[int, User],
                                           prediction_statement_id: int,
@@ -174,6 +177,9 @@ def poll_prediction_statement_vote_update(user: Union[int, User],
                                                           fields=non_side_effect_fields,
                                                           data=data)
 
+    poll_prediction_statistics_update(tag_id=prediction_statement_vote.prediction_statement.poll.tag_id,
+                                      statement_ids=[prediction_statement_id])
+
     return prediction_statement_vote
 
 
@@ -190,3 +196,6 @@ def poll_prediction_statement_vote_delete(user: Union[int, User], prediction_sta
         raise ValidationError('Prediction statement vote not created by user')
 
     prediction_statement_vote.delete()
+
+    poll_prediction_statistics_update(tag_id=prediction_statement_vote.prediction_statement.poll.tag_id,
+                                      statement_ids=[prediction_statement_id])
@@ -0,0 +1,307 @@
+from collections import defaultdict
+
+import numpy as np
+from django.db import models, transaction
+from django.db.models import Case, When, Count, Sum
+from django.utils import timezone
+
+from flowback.group.models import GroupTags
+from flowback.poll.models import (PollPredictionStatement,
+                                  PollPredictionBet,
+                                  PollPredictionStatistics,
+                                  PollPredictionPredictorStatistics)
+from flowback.prediction.combined_bet import bet_statistics
+
+
+# Incremental per-tag prediction statistics.
+#
+# A prediction statement is counted in the statistics of its tag once its poll has ended, and recounted whenever its
+# outcome (or combined bet) changes. The counted outcome and error are kept on the statement itself (applied_outcome,
+# applied_error) so a recount only has to subtract the old contribution and add the new one. Every change to a tag is
+# done while holding a lock on its PollPredictionStatistics row.
+
+PREDICTOR_STATISTICS_FIELDS = ('count', 'bet_sum', 'error_sum', 'error_product_sum')
+
+
+def _statement_outcomes(**filters):
+    """Outcome as used when combining bets, and the error of the combined bet as used for IMAC"""
+    return PollPredictionStatement.objects.filter(**filters).annotate(
+        outcome_sum=Sum(Case(When(pollpredictionstatementvote__vote=True, then=1),
+                             When(pollpredictionstatementvote__vote=False, then=-1),
+                             default=0,
+                             output_field=models.IntegerField())),
+        vote_count=Count('pollpredictionstatementvote')
+    ).values_list('id', 'poll__end_date', 'combined_bet', 'outcome_sum', 'vote_count',
+                  'applied_outcome', 'applied_error')
+
+
+def _statement_contribution(*, end_date, combined_bet, outcome_sum, vote_count, timestamp):
+    """Returns the (outcome, error) a statement should count with, or (None, None) if it should not be counted"""
+    if end_date > timestamp:
+        return None, None
+
+    outcome_sum = outcome_sum or 0
+    outcome = 1.0 if outcome_sum > 0 else 0.0 if outcome_sum < 0 else 0.5
+
+    # A tie counts as an incorrect outcome for IMAC, as long as anyone has voted
+    error = None
+    if vote_count and combined_bet is not None:
+        error = abs(float(combined_bet) - (1.0 if outcome_sum > 0 else 0.0))
+
+    return outcome, error
+
+
+def _predictor_statistics_add(statistics: dict, *, predictors: list[int], bets: np.ndarray, outcome: float, sign: int):
+    errors = outcome - bets
+
+    for k, predictor in enumerate(predictors):
+        for j, other in enumerate(predictors):
+            row = statistics[(predictor, other)]
+            row[0] += sign
+            row[1] += sign * bets[k]
+            row[2] += sign * errors[k]
+            row[3] += sign * errors[k] * errors[j]
+
+
+def _predictor_statistics_save(*, tag_id: int, statistics: dict) -> None:
+    predictors = {predictor for predictor, _ in statistics}
+    existing = {(row.predictor_id, row.other_id): row
+                for row in PollPredictionPredictorStatistics.objects.filter(tag_id=tag_id,
+                                                                            predictor_id__in=predictors,
+                                                                            other_id__in=predictors)}
+
+    to_create, to_update, to_delete = [], [], []
+    for (predictor, other), delta in statistics.items():
+        row = existing.get((predictor, other))
+
+        if row is None:
+            row = PollPredictionPredictorStatistics(tag_id=tag_id, predictor_id=predictor, other_id=other)
+            to_create.append(row)
+
+        else:
+            to_update.append(row)
+
+        for field, value in zip(PREDICTOR_STATISTICS_FIELDS, delta):
+            setattr(row, field, getattr(row, field) + value)
+
+    for row in to_update:
+        if row.count <= 0:
+            to_delete.append(row.id)
+
+    PollPredictionPredictorStatistics.objects.filter(id__in=to_delete).delete()
+    PollPredictionPredictorStatistics.objects.bulk_update([i for i in to_update if i.id not in to_delete],
+                                                          fields=[*PREDICTOR_STATISTICS_FIELDS, 'updated_at'])
+    PollPredictionPredictorStatistics.objects.bulk_create([i for i in to_create if i.count > 0])
+
+
+def _statement_bets(statement_ids: list[int]) -> dict[int, tuple[list[int], np.ndarray]]:
+    statement_bets = defaultdict(lambda: ([], []))
+    for statement_id, created_by_id, score in PollPredictionBet.objects.filter(
+            prediction_statement_id__in=statement_ids).values_list('prediction_statement_id', 'created_by_id', 'score'):
+        statement_bets[statement_id][0].append(created_by_id)
+        statement_bets[statement_id][1].append(score / 5)
+
+    return {statement_id: (predictors, np.array(bets, dtype=float))
+            for statement_id, (predictors, bets) in statement_bets.items()}
+
+
+def _tag_statistics_lock(*, tag_id: int) -> PollPredictionStatistics:
+    PollPredictionStatistics.objects.get_or_create(tag_id=tag_id)
+    return PollPredictionStatistics.objects.select_for_update().get(tag_id=tag_id)
+
+
+def poll_prediction_statistics_update(*, tag_id: int, statement_ids: list[int], remove: bool = False) -> None:
+    """
+    Recounts the given statements of a tag, statements of polls that have not ended are not counted.
+    Use remove=True to stop counting the statements, e.g. before deleting them.
+    """
+    if tag_id is None or not statement_ids:
+        return
+
+    timestamp = timezone.now()
+
+    with transaction.atomic():
+        tag_statistics = _tag_statistics_lock(tag_id=tag_id)
+        statements = list(_statement_outcomes(id__in=statement_ids, poll__tag_id=tag_id))
+
+        changes = []
+        for statement_id, end_date, combined_bet, outcome_sum, vote_count, applied_outcome, applied_error in statements:
+            if remove:
+                outcome, error = None, None
+
+            else:
+                outcome, error = _statement_contribution(end_date=end_date,
+                                                         combined_bet=combined_bet,
+                                                         outcome_sum=outcome_sum,
+                                                         vote_count=vote_count,
+                                                         timestamp=timestamp)
+
+            if (outcome, error) != (applied_outcome, applied_error):
+                changes.append((statement_id, applied_outcome, applied_error, outcome, error))
+
+        if not changes:
+            return
+
+        predictor_statistics = defaultdict(lambda: [0, 0.0, 0.0, 0.0])
+        statement_bets = _statement_bets([i[0] for i in changes if i[1] != i[3]])
+
+        for statement_id, applied_outcome, applied_error, outcome, error in changes:
+            for value, sign in ((applied_outcome, -1), (outcome, 1)):
+                if value is None:
+                    continue
+
+                tag_statistics.statement_count += sign
+                tag_statistics.outcome_sum += sign * value
+
+                if value != 0.5 and applied_outcome != outcome and statement_id in statement_bets:
+                    predictors, bets = statement_bets[statement_id]
+                    _predictor_statistics_add(predictor_statistics,
+                                              predictors=predictors,
+                                              bets=bets,
+                                              outcome=value,
+                                              sign=sign)
+
+            for value, sign in ((applied_error, -1), (error, 1)):
+                if value is not None:
+                    tag_statistics.error_count += sign
+                    tag_statistics.error_sum += sign * value
+
+        _predictor_statistics_save(tag_id=tag_id, statistics=predictor_statistics)
+        tag_statistics.save()
+
+        PollPredictionStatement.objects.bulk_update(
+            [PollPredictionStatement(id=statement_id, applied_outcome=outcome, applied_error=error)
+             for statement_id, _, _, outcome, error in changes],
+            fields=['applied_outcome', 'applied_error'])
+
+
+def poll_prediction_statistics_sync(*, tag_id: int) -> None:
+    """Counts every statement in the tag whose poll has ended since the last update"""
+    if tag_id is None:
+        return
+
+    statement_ids = list(PollPredictionStatement.objects.filter(poll__tag_id=tag_id,
+                                                                poll__end_date__lte=timezone.now(),
+                                                                applied_outcome__isnull=True
+                                                                ).values_list('id', flat=True))
+
+    poll_prediction_statistics_update(tag_id=tag_id, statement_ids=statement_ids)
+
+
+class PollPredictionStatisticsComputation:
+    """Statistics of a tag computed from scratch, matching what the incremental updates should have stored"""
+    def __init__(self,
+                 statement_count: int,
+                 outcome_sum: float,
+                 error_count: int,
+                 error_sum: float,
+                 predictor_statistics: dict[tuple[int, int], tuple],
+                 statement_contributions: dict[int, tuple]):
+        self.statement_count = statement_count
+        self.outcome_sum = outcome_sum
+        self.error_count = error_count
+        self.error_sum = error_sum
+        self.predictor_statistics = predictor_statistics
+        self.statement_contributions = statement_contributions
+
+
+def poll_prediction_statistics_compute(*, tag_id: int, timestamp=None) -> PollPredictionStatisticsComputation:
+    timestamp = timestamp or timezone.now()
+
+    statement_contributions = {}
+    for statement_id, end_date, combined_bet, outcome_sum, vote_count, _, _ in _statement_outcomes(
+            poll__tag_id=tag_id, poll__end_date__lte=timestamp):
+        statement_contributions[statement_id] = _statement_contribution(end_date=end_date,
+                                                                        combined_bet=combined_bet,
+                                                                        outcome_sum=outcome_sum,
+                                                                        vote_count=vote_count,
+                                                                        timestamp=timestamp)
+
+    statements = list(statement_contributions)
+    outcomes = np.array([statement_contributions[i][0] for i in statements], dtype=float)
+    errors = [i[1] for i in statement_contributions.values() if i[1] is not None]
+
+    bets = list(PollPredictionBet.objects.filter(prediction_statement_id__in=statements
+                                                 ).values_list('created_by_id', 'prediction_statement_id', 'score'))
+    predictors = sorted({i[0] for i in bets})
+    row_index = {predictor: i for i, predictor in enumerate(predictors)}
+    column_index = {statement: i for i, statement in enumerate(statements)}
+
+    matrix = np.full((len(predictors), len(statements)), np.nan)
+    for created_by_id, statement_id, score in bets:
+        matrix[row_index[created_by_id], column_index[statement_id]] = score / 5
+
+    statistics = bet_statistics(previous_bets=matrix, previous_outcomes=outcomes)
+    predictor_statistics = {(predictors[k], predictors[j]): (int(statistics['shared'][k, j]),
+                                                             float(statistics['bet_sums'][k, j]),
+                                                             float(statistics['error_sums'][k, j]),
+                                                             float(statistics['error_products'][k, j]))
+                            for k, j in zip(*np.nonzero(statistics['shared']))}
+
+    return PollPredictionStatisticsComputation(statement_count=len(statements),
+                                               outcome_sum=float(outcomes.sum()),
+                                               error_count=len(errors),
+                                               error_sum=float(sum(errors)),
+                                               predictor_statistics=predictor_statistics,
+                                               statement_contributions=statement_contributions)
+
+
+def poll_prediction_statistics_rebuild(*, tag_id: int) -> PollPredictionStatisticsComputation:
+    """Replaces the statistics of a tag with a full recomputation"""
+    with transaction.atomic():
+        tag_statistics = _tag_statistics_lock(tag_id=tag_id)
+        computation = poll_prediction_statistics_compute(tag_id=tag_id)
+
+        tag_statistics.statement_count = computation.statement_count
+        tag_statistics.outcome_sum = computation.outcome_sum
+        tag_statistics.error_count = computation.error_count
+        tag_statistics.error_sum = computation.error_sum
+        tag_statistics.save()
+
+        PollPredictionPredictorStatistics.objects.filter(tag_id=tag_id).delete()
+        PollPredictionPredictorStatistics.objects.bulk_create(
+            [PollPredictionPredictorStatistics(tag_id=tag_id,
+                                               predictor_id=predictor,
+                                               other_id=other,
+                                               **dict(zip(PREDICTOR_STATISTICS_FIELDS, values)))
+             for (predictor, other), values in computation.predictor_statistics.items()],
+            batch_size=5000)
+
+        PollPredictionStatement.objects.filter(poll__tag_id=tag_id).exclude(
+            id__in=computation.statement_contributions).update(applied_outcome=None, applied_error=None)
+        PollPredictionStatement.objects.bulk_update(
+            [PollPredictionStatement(id=statement_id, applied_outcome=outcome, applied_error=error)
+             for statement_id, (outcome, error) in computation.statement_contributions.items()],
+            fields=['applied_outcome', 'applied_error'],
+            batch_size=5000)
+
+    return computation
+
+
+def poll_prediction_statistics_check(*, tag_id: int, tolerance: float = 1e-6) -> list[str]:
+    """Compares the stored statistics of a tag with a full recomputation, returns a description of every mismatch"""
+    computation = poll_prediction_statistics_compute(tag_id=tag_id)
+    tag_statistics = PollPredictionStatistics.objects.filter(tag_id=tag_id).first() or PollPredictionStatistics()
+    mismatches = []
+
+    for field in ('statement_count', 'outcome_sum', 'error_count', 'error_sum'):
+        stored, computed = getattr(tag_statistics, field), getattr(computation, field)
+        if abs(stored - computed) > tolerance:
+            mismatches.append(f'{field}: stored {stored}, computed {computed}')
+
+    stored_statistics = {(predictor, other): values for predictor, other, *values in
+                         PollPredictionPredictorStatistics.objects.filter(tag_id=tag_id).values_list(
+                             'predictor_id', 'other_id', *PREDICTOR_STATISTICS_FIELDS)}
+
+    for pair in stored_statistics.keys() | computation.predictor_statistics.keys():
+        stored = stored_statistics.get(pair, (0, 0, 0, 0))
+        computed = computation.predictor_statistics.get(pair, (0, 0, 0, 0))
+
+        if any(abs(a - b) > tolerance for a, b in zip(stored, computed)):
+            mismatches.append(f'predictors {pair}: stored {tuple(stored)}, computed {computed}')
+
+    return mismatches
+
+
+def poll_prediction_statistics_tags() -> list[int]:
+    return list(GroupTags.objects.filter(poll__isnull=False).distinct().values_list('id', flat=True))
@@ -5,6 +5,7 @@ from flowback.common.services import get_object
 from flowback.files.services import upload_collection
 from flowback.group.selectors import group_user_permissions
 from flowback.poll.models import PollProposal, Poll, PollProposalTypeSchedule
+from flowback.poll.services.tally import poll_live_tally_proposals_changed
 
 # TODO proposal can be created without schedule, dangerous
 from flowback.schedule.models import ScheduleEvent
@@ -69,6 +70,8 @@ def poll_proposal_create(*, user_id: int,
 
         schedule_proposal.save()
 
+    poll_live_tally_proposals_changed(poll=poll)
+
     return proposal
 
 
@@ -84,3 +87,4 @@ def poll_proposal_delete(*, user_id: int, proposal_id: int) -> None:
                               "group admin or force_delete_proposal permission")
 
     proposal.delete()
+    poll_live_tally_proposals_changed(poll=proposal.poll)
@@ -0,0 +1,202 @@
+from collections import defaultdict
+
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Case, When, Value, Exists
+from django.db.models.functions import Coalesce
+
+from flowback.group.models import GroupUserDelegator
+from flowback.poll.models import (Poll,
+                                  PollProposal,
+                                  PollVoting,
+                                  PollDelegateVoting,
+                                  PollVotingTypeRanking,
+                                  PollVotingTypeCardinal,
+                                  PollVotingTypeForAgainst)
+
+
+# Set-based vote tallying for poll_proposal_vote_count.
+#
+# Every step below is a single UPDATE over the rows belonging to the given poll, so the amount of queries needed
+# to count a poll is constant regardless of the amount of ballots. Delegate weights are read from
+# PollDelegateVoting.mandate, which poll_delegate_mandate_update brings up-to-date.
+
+
+def poll_delegate_mandate_update(*, poll: Poll, delegate_pools: list[int] = None) -> dict[int, int]:
+    """
+    Counts the mandate of every delegate pool that voted in the poll, that is the active delegators of the pool
+    delegating in the poll tag that did not vote themselves. Only the PollDelegateVoting rows of the poll are updated,
+    optionally limited to the given delegate pools.
+
+    :return: mandate per delegate pool id, pools without a mandate are left out
+    """
+    mandates = {}
+    pool_filter = dict(created_by_id__in=delegate_pools) if delegate_pools is not None else {}
+
+    if poll.tag_id:
+        delegators = GroupUserDelegator.objects.filter(
+            ~Exists(PollVoting.objects.filter(poll=poll, created_by=OuterRef('delegator'))),
+            delegate_pool__polldelegatevoting__poll=poll,
+            delegator__active=True,
+            tags=poll.tag_id)
+
+        if delegate_pools is not None:
+            delegators = delegators.filter(delegate_pool_id__in=delegate_pools)
+
+        mandates = dict(delegators.values('delegate_pool').annotate(mandate=Count('id')
+                                                                     ).values_list('delegate_pool', 'mandate'))
+
+    PollDelegateVoting.objects.filter(poll=poll, **pool_filter).update(
+        mandate=Case(*[When(created_by_id=pool, then=Value(mandate)) for pool, mandate in mandates.items()],
+                     default=Value(0)))
+
+    return mandates
+
+
+def _delegate_mandate():
+    return Subquery(PollDelegateVoting.objects.filter(id=OuterRef('author_delegate_id')).values('mandate')[:1],
+                    output_field=models.IntegerField())
+
+
+def _ranking_ballot_size(author_field: str):
+    return Subquery(PollVotingTypeRanking.objects.filter(**{author_field: OuterRef(author_field)})
+                    .values(author_field)
+                    .annotate(ballot_size=Count('*'))
+                    .values('ballot_size')[:1],
+                    output_field=models.IntegerField())
+
+
+def _poll_proposal_score_update(*, poll: Poll, related_name: str) -> int:
+    """Sums the already calculated ballot scores into PollProposal.score, proposals without votes get NULL"""
+    proposal_scores = PollProposal.objects.filter(id=OuterRef('id')).annotate(
+        final_score=Sum(f'{related_name}__score')).values('final_score')
+
+    return PollProposal.objects.filter(poll=poll).update(score=Subquery(proposal_scores))
+
+
+def poll_ranking_tally(*, poll: Poll) -> None:
+    total_proposals = poll.pollproposal_set.count()
+
+    # A ranking ballot gives total_proposals points to its first choice, one less for each following choice
+    PollVotingTypeRanking.objects.filter(author__poll=poll).update(
+        score=total_proposals - (_ranking_ballot_size('author') - F('priority')))
+
+    PollVotingTypeRanking.objects.filter(author_delegate__poll=poll).update(
+        score=(total_proposals - (_ranking_ballot_size('author_delegate') - F('priority'))) * _delegate_mandate())
+
+    _poll_proposal_score_update(poll=poll, related_name='pollvotingtyperanking')
+
+
+def poll_cardinal_tally(*, poll: Poll) -> None:
+    PollVotingTypeCardinal.objects.filter(author__isnull=False, proposal__poll=poll).update(score=F('raw_score'))
+    PollVotingTypeCardinal.objects.filter(author_delegate__isnull=False, proposal__poll=poll
+                                          ).update(score=F('raw_score') * _delegate_mandate())
+
+    _poll_proposal_score_update(poll=poll, related_name='pollvotingtypecardinal')
+
+
+def poll_schedule_tally(*, poll: Poll) -> None:
+    PollVotingTypeForAgainst.objects.filter(author__poll=poll).update(
+        score=Case(When(vote=True, then=Value(1)), default=Value(0)))
+
+    PollVotingTypeForAgainst.objects.filter(author_delegate__poll=poll).update(
+        score=Case(When(vote=True, then=Coalesce(_delegate_mandate(), 0)), default=Value(0)))
+
+    _poll_proposal_score_update(poll=poll, related_name='pollvotingtypeforagainst')
+
+
+def poll_vote_tally(*, poll: Poll) -> None:
+    """Calculates the score of every ballot in the poll and stores the sum on each PollProposal"""
+    match poll.poll_type:
+        case Poll.PollType.RANKING:
+            poll_ranking_tally(poll=poll)
+        case Poll.PollType.CARDINAL:
+            poll_cardinal_tally(poll=poll)
+        case Poll.PollType.SCHEDULE:
+            poll_schedule_tally(poll=poll)
+
+
+# Live tallies for dynamic polls.
+#
+# Ballots in dynamic polls get their score when they are cast, and PollProposal.score is updated with the difference
+# between the old and the new ballot, so the current standings can be read at any time. Delegate ballots are weighted
+# with the mandate of the delegate at the time of voting, poll_proposal_vote_count reconciles every score with
+# poll_vote_tally once the poll ends.
+
+BALLOT_MODELS = {Poll.PollType.RANKING: PollVotingTypeRanking,
+                 Poll.PollType.CARDINAL: PollVotingTypeCardinal,
+                 Poll.PollType.SCHEDULE: PollVotingTypeForAgainst}
+
+
+def _ballot_scores(*, poll: Poll, ballot: list, mandate: int = None) -> None:
+    """Sets the score of unsaved ballot rows, the same way poll_vote_tally does"""
+    weight = 1 if mandate is None else mandate
+
+    match poll.poll_type:
+        case Poll.PollType.RANKING:
+            total_proposals = poll.pollproposal_set.count()
+            for vote in ballot:
+                vote.score = (total_proposals - (len(ballot) - vote.priority)) * weight
+
+        case Poll.PollType.CARDINAL:
+            for vote in ballot:
+                vote.score = vote.raw_score * weight
+
+        case Poll.PollType.SCHEDULE:
+            for vote in ballot:
+                vote.score = weight if vote.vote else 0
+
+
+def _poll_proposal_score_add(*, poll: Poll, deltas: dict[int, int]) -> None:
+    deltas = {proposal_id: delta for proposal_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    PollProposal.objects.filter(poll=poll, id__in=deltas).update(
+        score=Coalesce(F('score'), 0) + Case(*[When(id=proposal_id, then=Value(delta))
+                                               for proposal_id, delta in deltas.items()],
+                                             default=Value(0)))
+
+
+def poll_ballot_replace(*, poll: Poll, ballot: list, mandate: int = None, **author) -> None:
+    """
+    Replaces the ballot of a voter (author=PollVoting or author_delegate=PollDelegateVoting) with the given unsaved
+    ballot rows, an empty ballot removes it. In dynamic polls the difference is added to the proposal scores.
+    """
+    ballot_model = BALLOT_MODELS[poll.poll_type]
+    previous = ballot_model.objects.filter(**author)
+    voting, = author.values()
+
+    with transaction.atomic():
+        # Concurrent ballots of the same voter wait for each other, so each one replaces the scores of the last
+        type(voting).objects.select_for_update().filter(pk=voting.pk).first()
+
+        if poll.dynamic:
+            deltas = defaultdict(int)
+            for proposal_id, score in previous.values_list('proposal_id', 'score'):
+                deltas[proposal_id] -= score or 0
+
+            _ballot_scores(poll=poll, ballot=ballot, mandate=mandate)
+            for vote in ballot:
+                deltas[vote.proposal_id] += vote.score
+
+            _poll_proposal_score_add(poll=poll, deltas=deltas)
+
+        previous.delete()
+        ballot_model.objects.bulk_create(ballot)
+
+
+def poll_ballot_delete(*, poll: Poll, votings) -> None:
+    """Deletes the given PollVoting or PollDelegateVoting queryset, removing their ballots from live tallies"""
+    with transaction.atomic():
+        if poll.dynamic and poll.poll_type in BALLOT_MODELS:
+            for voting in votings:
+                author = 'author_delegate' if isinstance(voting, PollDelegateVoting) else 'author'
+                poll_ballot_replace(poll=poll, ballot=[], **{author: voting})
+
+        votings.delete()
+
+
+def poll_live_tally_proposals_changed(*, poll: Poll) -> None:
+    """Ranking scores depend on the amount of proposals, so adding or removing one recounts the live tally"""
+    if poll.dynamic and poll.poll_type == Poll.PollType.RANKING:
+        poll_vote_tally(poll=poll)
@@ -6,6 +6,7 @@ from flowback.group.models import GroupUserDelegatePool
 from flowback.poll.models import Poll, PollVoting, PollVotingTypeRanking, PollDelegateVoting, \
     PollVotingTypeForAgainst, PollVotingTypeCardinal
 from flowback.group.selectors import group_user_permissions
+from flowback.poll.services.tally import poll_ballot_replace, poll_ballot_delete, poll_delegate_mandate_update
 
 
 def poll_proposal_vote_update(*, user_id: int, poll_id: int, data: dict) -> None:
@@ -18,7 +19,7 @@ def poll_proposal_vote_update(*, user_id: int, poll_id: int, data: dict) -> None
 
     if poll.poll_type == Poll.PollType.RANKING:
         if not data['proposals']:
-            PollVoting.objects.filter(created_by=group_user, poll=poll).delete()
+            poll_ballot_delete(poll=poll, votings=PollVoting.objects.filter(created_by=group_user, poll=poll))
             return
 
         proposals = poll.pollproposal_set.filter(id__in=[x for x in data['proposals']]).all()
@@ -31,8 +32,7 @@ def poll_proposal_vote_update(*, user_id: int, poll_id: int, data: dict) -> None
                                                    proposal_id=proposal,
                                                    priority=len(data['proposals']) - priority)
                              for priority, proposal in enumerate(data['proposals'])]
-        PollVotingTypeRanking.objects.filter(author=poll_vote).delete()
-        PollVotingTypeRanking.objects.bulk_create(poll_vote_ranking)
+        poll_ballot_replace(poll=poll, ballot=poll_vote_ranking, author=poll_vote)
 
     elif poll.poll_type == Poll.PollType.CARDINAL:
 
@@ -44,7 +44,7 @@ def poll_proposal_vote_update(*, user_id: int, poll_id: int, data: dict) -> None
 
         # Delete votes if no polls are registered
         if not data['proposals']:
-            PollVoting.objects.filter(created_by=group_user, poll=poll).delete()
+            poll_ballot_delete(poll=poll, votings=PollVoting.objects.filter(created_by=group_user, poll=poll))
             return
 
         if len(data['scores']) != len(data['proposals']):
@@ -60,12 +60,11 @@ def poll_proposal_vote_update(*, user_id: int, poll_id: int, data: dict) -> None
                                                      raw_score=data['scores'][i])
                               for i in range(len(data['proposals']))]
 
-        PollVotingTypeCardinal.objects.filter(author=user_vote).delete()
-        PollVotingTypeCardinal.objects.bulk_create(poll_vote_cardinal)
+        poll_ballot_replace(poll=poll, ballot=poll_vote_cardinal, author=user_vote)
 
     elif poll.poll_type == Poll.PollType.SCHEDULE:
         if not data['proposals']:
-            PollVoting.objects.filter(created_by=group_user, poll=poll).delete()
+            poll_ballot_delete(poll=poll, votings=PollVoting.objects.filter(created_by=group_user, poll=poll))
             return
 
         proposals = poll.pollproposal_set.filter(id__in=data['proposals']).all()
@@ -78,13 +77,18 @@ def poll_proposal_vote_update(*, user_id: int, poll_id: int, data: dict) -> None
                                                        proposal_id=proposal,
                                                        vote=True)
                               for proposal in data['proposals']]
-        PollVotingTypeForAgainst.objects.filter(author=poll_vote).delete()
-        PollVotingTypeForAgainst.objects.bulk_create(poll_vote_schedule)
+        poll_ballot_replace(poll=poll, ballot=poll_vote_schedule, author=poll_vote)
 
     else:
         raise ValidationError('Unknown poll type')
 
 
+def _delegate_live_mandate(*, poll: Poll, delegate_pool: GroupUserDelegatePool) -> int | None:
+    # Live tallies weigh delegate ballots with the mandate at the time of voting
+    if poll.dynamic:
+        return poll_delegate_mandate_update(poll=poll, delegate_pools=[delegate_pool.id]).get(delegate_pool.id, 0)
+
+
 # TODO update in future for delegate pool
 def poll_proposal_delegate_vote_update(*, user_id: int, poll_id: int, data) -> None:
     poll = get_object(Poll, id=poll_id)
@@ -98,7 +102,7 @@ def poll_proposal_delegate_vote_update(*, user_id: int, poll_id: int, data) -> N
 
     if poll.poll_type == Poll.PollType.RANKING:
         if not data['proposals']:
-            PollDelegateVoting.objects.filter(created_by=delegate_pool, poll=poll).delete()
+            poll_ballot_delete(poll=poll, votings=PollDelegateVoting.objects.filter(created_by=delegate_pool, poll=poll))
             return
 
         proposals = poll.pollproposal_set.filter(id__in=data['proposals']).all()
@@ -111,14 +115,16 @@ def poll_proposal_delegate_vote_update(*, user_id: int, poll_id: int, data) -> N
                                                    proposal_id=proposal,
                                                    priority=len(data['proposals']) - priority)
                              for priority, proposal in enumerate(data['proposals'])]
-        PollVotingTypeRanking.objects.filter(author_delegate=poll_vote).delete()
-        PollVotingTypeRanking.objects.bulk_create(poll_vote_ranking)
+        poll_ballot_replace(poll=poll,
+                            ballot=poll_vote_ranking,
+                            mandate=_delegate_live_mandate(poll=poll, delegate_pool=delegate_pool),
+                            author_delegate=poll_vote)
 
     elif poll.poll_type == Poll.PollType.CARDINAL:
 
         # Delete votes if no polls are registered
         if not data['proposals']:
-            PollDelegateVoting.objects.filter(created_by=delegate_pool, poll=poll).delete()
+            poll_ballot_delete(poll=poll, votings=PollDelegateVoting.objects.filter(created_by=delegate_pool, poll=poll))
             return
 
         if len(data['scores']) != len(data['proposals']):
@@ -140,12 +146,14 @@ def poll_proposal_delegate_vote_update(*, user_id: int, poll_id: int, data) -> N
                                                      raw_score=data['scores'][i])
                               for i in range(len(data['proposals']))]
 
-        PollVotingTypeCardinal.objects.filter(author_delegate=pool_vote).delete()
-        PollVotingTypeCardinal.objects.bulk_create(poll_vote_cardinal)
+        poll_ballot_replace(poll=poll,
+                            ballot=poll_vote_cardinal,
+                            mandate=_delegate_live_mandate(poll=poll, delegate_pool=delegate_pool),
+                            author_delegate=pool_vote)
 
     elif poll.poll_type == Poll.PollType.SCHEDULE:
         if not data['proposals']:
-            PollDelegateVoting.objects.filter(created_by=delegate_pool, poll=poll).delete()
+            poll_ballot_delete(poll=poll, votings=PollDelegateVoting.objects.filter(created_by=delegate_pool, poll=poll))
             return
 
         proposals = poll.pollproposal_set.filter(id__in=data['proposals']).all()
@@ -157,9 +165,11 @@ def poll_proposal_delegate_vote_update(*, user_id: int, poll_id: int, data) -> N
         poll_vote_schedule = [PollVotingTypeForAgainst(author_delegate=poll_vote,
                                                        proposal_id=proposal,
                                                        vote=True)
-                              for proposal in enumerate(data['proposals'])]
-        PollVotingTypeForAgainst.objects.filter(author_delegate=poll_vote).delete()
-        PollVotingTypeForAgainst.objects.bulk_create(poll_vote_schedule)
+                              for proposal in data['proposals']]
+        poll_ballot_replace(poll=poll,
+                            ballot=poll_vote_schedule,
+                            mandate=_delegate_live_mandate(poll=poll, delegate_pool=delegate_pool),
+                            author_delegate=poll_vote)
 
     else:
         raise ValidationError('Unknown poll type')
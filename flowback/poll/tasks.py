@@ -1,22 +1,32 @@
-import random
+import logging
+from datetime import datetime
+
 from celery import shared_task
 from django.contrib.postgres.aggregates import ArrayAgg
-from django.db import models
-from django.db.models import Count, Q, Sum, OuterRef, Case, When, F, Subquery
-from django.db.models.functions import Cast
+from django.db.models import Count, Q
+from django.db import transaction
 from django.utils import timezone
 
 from flowback.common.services import get_object
-from flowback.group.models import GroupTags, GroupUser, GroupUserDelegatePool
+from flowback.group.models import GroupTags, GroupUser
 from flowback.group.selectors import group_tags_interval_mean_absolute_correctness
-from flowback.poll.models import Poll, PollAreaStatement, PollPredictionBet, PollPredictionStatementVote, \
-    PollPredictionStatement, PollDelegateVoting, PollVotingTypeRanking, PollProposal, PollVoting, \
-    PollVotingTypeCardinal, PollVotingTypeForAgainst
+from flowback.poll.models import Poll, PollAreaStatement, PollPredictionStatementVote, PollPredictionStatement, \
+    PollProposal, PollVoting, PollPhaseTask
 
 import numpy as np
 
+from flowback.poll.services.tally import poll_vote_tally, poll_delegate_mandate_update
+from flowback.poll.selectors.prediction import poll_prediction_current_bets, poll_prediction_statistics
+from flowback.poll.services.prediction_statistics import poll_prediction_statistics_sync, \
+    poll_prediction_statistics_update
+from flowback.prediction.combined_bet import combine_bets_from_statistics
 from flowback.schedule.services import create_event
 
+logger = logging.getLogger(__name__)
+
+POLL_PHASE_TASK_MAX_ATTEMPTS = 5
+POLL_PHASE_TASK_RETRY_DELAY = 60  # Seconds before the first retry, doubled on every following one
+
 
 @shared_task
 def poll_area_vote_count(poll_id: int):
@@ -47,386 +57,35 @@ def poll_prediction_bet_count(poll_id: int):
     poll.status_prediction = 2
     poll.save()
 
-    # Get list of previous outcomes in a given area (poll)
-    statements = PollPredictionStatement.objects.filter(
-        Q(Q(poll__tag=poll.tag,
-            poll__end_date__lte=timestamp,
-            created_at__lte=timestamp) & ~Q(poll=poll)) | Q(poll=poll)
-    ).annotate(
-        outcome_sum=Sum(Case(When(pollpredictionstatementvote__vote=True, then=1),
-                             When(pollpredictionstatementvote__vote=False, then=-1),
-                             default=0,
-                             output_field=models.IntegerField())),
-        outcome=Case(When(outcome_sum__gt=0, then=1),
-                     When(outcome_sum__lt=0, then=0),
-                     default=0.5,
-                     output_field=models.FloatField())
-    ).order_by('-created_at').all()
-
-    previous_outcomes = list(statements.filter(~Q(poll=poll)).values_list('outcome', flat=True))
-    previous_outcome_avg = 0 if len(previous_outcomes) == 0 else sum(previous_outcomes) / len(previous_outcomes)
-    poll_statements = statements.filter(poll=poll).all().values_list('id', flat=True)
-
-    # Get group users associated with the relevant poll
-    predictors = GroupUser.objects.filter(pollpredictionbet__prediction_statement__poll=poll).all().distinct()
-
-    current_bets = []
-    previous_bets = []
-    for predictor in predictors:
-        bets = list(PollPredictionBet.objects.filter(
-            created_by=predictor,
-            prediction_statement__in=statements,
-            prediction_statement__poll=poll).order_by('-prediction_statement__created_at').annotate(
-            real_score=Cast(F('score'), models.FloatField()) / 5).values_list('prediction_statement_id', 'real_score'))
-
-        bets_statements = [i[0] for i in bets]
-        current_bet = []
-        for statement in poll_statements:
-            if statement in bets_statements:
-                current_bet.append(bets[bets_statements.index(statement)][1])
-
-            else:
-                current_bet.append(None)
-
-        current_bets.append(current_bet)
-
-
-        previous_bets.append(list(PollPredictionBet.objects.filter(
-            Q(created_by=predictor,
-            prediction_statement__in=statements)
-            & ~Q(prediction_statement__poll=poll)).order_by('-prediction_statement__created_at').annotate(
-            real_score=Cast(F('score'), models.FloatField()) / 5).values_list('real_score', flat=True)))
-
-    # Current
-    # Bets: [[0.2, 0.2], [0.0, 0.0], [1.0, 0.0]]
-    # Previous
-    # Outcomes: [1.0]
-    # Previous
-    # Bets: [[0.0], [0.2], [1.0]]
-
-    previous_bets = [[] for _ in range(len(predictors))]
-    for i, statement in enumerate(statements.filter(~Q(poll=poll))):
-        for j, predictor in enumerate(predictors):
-            try:
-                bet = PollPredictionBet.objects.get(Q(created_by=predictor)
-                                                    & Q(prediction_statement=statement))
-                previous_bets[j].append(bet.score / 5)
-
-            except PollPredictionBet.DoesNotExist:
-                previous_bets[j].append(None)
-
-        # prediction_bets.append()
-        # print(PollPredictionBet.objects.filter(
-        #     Q(created_by=predictor,
-        #     prediction_statement__in=statements)
-        #     & ~Q(prediction_statement__poll=poll)).count())
-        #
-        # previous_bets.append(list(PollPredictionBet.objects.filter(
-        #     Q(created_by=predictor,
-        #     prediction_statement__in=statements)
-        #     & ~Q(prediction_statement__poll=poll)).order_by('-prediction_statement__poll__created_at').annotate(
-        #     real_score=Cast(F('score'), models.FloatField()) / 5).values_list('real_score', flat=True)))
-
-    # Get bets
-
-    # Get list of bets in the given poll, ordered
-    #   - if any bet missing, dismiss count
-
-    # Small decimal (AT LEAST a magnitude below 10^(-6))
-    small_decimal = 10 ** -7
-
-    # Current bets by each predictor for one given statement, in order # TODO Loke check this
-    #   (first equal to predictor 1 bets, 2 to 2 bets etc.)
-    # IMPORTANT: do not append the current bet until AFTER the combined bet has been calculated
-    #   and saved and there is an outcome
-    # current_bets = np.array([[0.99], [0.9]])
-
-    # Create lists of predictor bets in order (matching outcomes, None for missing),
-    #   don't include ongoing bets (max 100)
-    # If the determinant of a predictor bets list is zero then set the first value to the smallest non zero value
-    # TODO future test combinations of values
-    # previous_bets = [[0, 1, 0.7, 0, 1], [0, 0.2, 1, 0, 0.8]]
-
-    # Delete any predictors with no previous history, if there is at least one user with a previous history
-    to_delete = []
-    if not all([all(i is None for i in predictor_bets) for predictor_bets in previous_bets]):
-        for j, predictor_bets in enumerate(previous_bets):
-            if all(i is None for i in predictor_bets):
-                to_delete.append(j)
-
-        current_bets = [u for i, u in enumerate(current_bets) if i not in to_delete]
-        previous_bets = [u for i, u in enumerate(previous_bets) if i not in to_delete]
-
-    # Delete any previous_outcomes where outcome is 0.5 (that is, undecided)
-    to_delete = []
-    for j, previous_outcome in enumerate(previous_outcomes):
-        if previous_outcome == 0.5:
-            to_delete.append(j)
-
-    previous_outcomes = [j for n, j in enumerate(previous_outcomes) if n not in to_delete]
-    poll_statements = [j for n, j in enumerate(poll_statements) if n not in to_delete]
-
-    for i in range(len(previous_bets)):
-        previous_bets[i] = [j for n, j in enumerate(previous_bets[i]) if n not in to_delete]
-
-    print("\n\n" + "#" * 50)
-
-    # Assume previous_bets matches order of current_bets
-    print("Current Bets:", current_bets)
-    print("Previous Outcomes:", previous_outcomes)
-    print("Previous Bets:", previous_bets)
-
-    print("Total Statement:", len(poll_statements))
-
-    # Calculation below
-    # for i, statement in enumerate(poll_statements):
-    for i, statement in enumerate(poll_statements):
-        bias_adjustments = []
-        predictor_errors = []
-        main_bets = [bets[i] for bets in current_bets if bets[i] is not None]
-
-        # If there's no previous bets then do nothing
-        if len(previous_bets) == 0 or len(previous_bets[0]) == 0:
-            combined_bet = None if all(bets[i] is None for bets in current_bets) else (sum(main_bets)) / len(main_bets)
-            print(f"No previous bets found, returning {combined_bet}")
-            PollPredictionStatement.objects.filter(id=statement).update(combined_bet=combined_bet)
-
-            continue
-
-        # Skip if all current bets for a given prediction statement is equal to None
-        if all(x[i] is None for x in current_bets):
-            continue
-
-        previous_bets_trimmed = [previous_bets[j] for j in range(len(previous_bets)) if current_bets[j][i] is not None]
-        print("Previous Bets Trimmed:", previous_bets_trimmed)
-        for bets in previous_bets_trimmed:
-            bets_trimmed = [i for i in bets if i is not None]
-            bias_adjustments.append(0 if len(bets) == 0 else previous_outcome_avg - (sum(bets_trimmed) /
-                                                                                     len(bets_trimmed)))
-
-            predictor_errors.append(np.array([previous_outcomes[i] - bets[i]
-                                              if bets[i] is not None
-                                              else None for i in range(len(previous_outcomes))]))
-
-        # If a predictor has not bet on a certain prediction then their bet will be None for said prediction
-        def drop_incomparable_values(arr_1, arr_2):
-            drop_list = []
-
-            for i in range(len(arr_1)):
-                if arr_1[i] is None or arr_2[i] is None:
-                    drop_list.append(i)
-
-            arr_1 = np.delete(arr_1, drop_list)
-            arr_2 = np.delete(arr_2, drop_list)
-
-            return arr_1, arr_2
-
-        def covariance(arr_1, arr_2):
-            covariance_array = [(arr_1[i] - np.mean(arr_1)) * (arr_2[i] - np.mean(arr_2)) for i in range(len(arr_1))]
-            return (1 / len(arr_1)) * sum(covariance_array)
-
-        covariance_matrix = []
-        for k in range(len(predictor_errors)):
-            row = []
-
-            for j in range(len(predictor_errors)):
-                comparable_errors = drop_incomparable_values(predictor_errors[k], predictor_errors[j])
-                row.append(covariance(comparable_errors[0], comparable_errors[1]))
-
-            covariance_matrix.append(row)
-
-        # TODO check the following if statement is valid
-        if not covariance_matrix:
-            continue
-
-        np_covariance_matrix = np.array(covariance_matrix)
-
-        # The inverse only exists when the determinant is non-zero, this can be made sure of by changing small decimals
-        if np.linalg.det(np_covariance_matrix) == 0:
-            determinant_is_zero = True
-            print("Zero determinant")
-
-            while determinant_is_zero:
-                for m in range(np_covariance_matrix.shape[0]):
-                    for j in range(np_covariance_matrix.shape[0]):
-                        np_covariance_matrix[m][j] += small_decimal * [-1, 1][random.randint(0, 1)]
-
-                det = np.linalg.det(np_covariance_matrix)
-                if det != 0:
-                    determinant_is_zero = False
-
-        inverse_covariance_matrix = np.linalg.inv(np_covariance_matrix)
+    # Combine the bets on the poll with the stored history of its predictors in the same area (tag)
+    poll_prediction_statistics_sync(tag_id=poll.tag_id)
+    current = poll_prediction_current_bets(poll=poll, timestamp=timestamp)
+    combined_bets = combine_bets_from_statistics(current_bets=current.current_bets,
+                                                 **poll_prediction_statistics(tag_id=poll.tag_id,
+                                                                              predictors=current.predictors))
 
-        column_one_vector = np.array([[1]] * inverse_covariance_matrix.shape[0])
-        row_one_vector = np.array([1] * inverse_covariance_matrix.shape[0])
+    for statement, combined_bet in zip(current.current_statements, combined_bets):
+        PollPredictionStatement.objects.filter(id=statement).update(
+            combined_bet=None if np.isnan(combined_bet) else float(combined_bet))
 
-        nominator = np.matmul(inverse_covariance_matrix, column_one_vector)
-
-        denominator_vector = np.matmul(inverse_covariance_matrix, row_one_vector)
-        denominator = np.matmul(row_one_vector, denominator_vector)
-
-        if denominator == 0:
-            denominator = small_decimal
-
-        bet_weights = nominator * (1 / denominator)
-        transposed_bet_weights = np.transpose(bet_weights)
-
-        print("Transposed_bet_weights:", transposed_bet_weights)
-        print("Main bets:", main_bets)
-        print("Bias_adjustments:", bias_adjustments)
-
-        # I am unsure if I should limit the bias adjusted bets or only limit the combined bet in the end,
-        # I think this might make more sense but I have to think about this more
-        # TODO: think about this more
-
-        # For main bets is list of bets per predictor
-        # Bias adjustments is adjustments per predictor
-        #
-        bias_adjusted_bet = [main_bets[j] + bias_adjustments[j] for j in range(len(main_bets))]
-        for j in range(len(bias_adjusted_bet)):
-            if bias_adjusted_bet[j] < 0:
-                bias_adjusted_bet[j] = 0.0
-            elif bias_adjusted_bet[j] > 1:
-                bias_adjusted_bet[j] = 1.0
-
-        print(f"Results: {np.matmul(transposed_bet_weights, bias_adjusted_bet)}")
-        combined_bet = float(np.matmul(transposed_bet_weights, bias_adjusted_bet)[0])
-
-        if combined_bet < 0:
-            combined_bet = 0
-        elif combined_bet > 1:
-            combined_bet = 1
-
-        # Sanity check
-        check = np.matmul(transposed_bet_weights, row_one_vector)
-        if (check[0] > 1 + small_decimal) or (0.99 + small_decimal > check[0]):
-            print(f"Error with weights: {check[0]:.4f}")
-
-        print(combined_bet)
-
-        PollPredictionStatement.objects.filter(id=statement).update(combined_bet=combined_bet)
+    # Statements of a poll that has already ended are counted with their combined bet
+    poll_prediction_statistics_update(tag_id=poll.tag_id, statement_ids=current.current_statements)
 
     poll.status_prediction = 1
     poll.save()
 
 
-@shared_task
-def poll_proposal_vote_count(poll_id: int) -> None:
-    poll = get_object(Poll, id=poll_id)
+def _poll_proposal_vote_count(*, poll: Poll) -> None:
     group = poll.created_by.group
-    total_proposals = poll.pollproposal_set.count()
-
-    if poll.status:
-        return
-
-    # Count delegators participating in poll
-    mandate = GroupUserDelegatePool.objects.filter(polldelegatevoting__poll=poll).aggregate(
-        mandate=Count('groupuserdelegator',
-                      filter=~Q(groupuserdelegator__delegator__pollvoting__poll=poll
-                                ) & Q(groupuserdelegator__tags__in=[poll.tag]
-                                      ) & Q(groupuserdelegator__delegator__active=True)
-                      ))['mandate']
-
-    mandate_subquery = GroupUserDelegatePool.objects.filter(id=OuterRef('author_delegate__created_by')).annotate(
-        mandate=Count('groupuserdelegator',
-                      filter=~Q(groupuserdelegator__delegator__pollvoting__poll=poll
-                                ) & Q(groupuserdelegator__tags__in=[poll.tag]
-                                      ) & Q(groupuserdelegator__delegator__active=True)
-                      )).values('mandate')
-
-    # Count mandate for each delegate, save it to PollDelegateVoting account
-    total_mandate = PollDelegateVoting.objects.filter(id=OuterRef('id')).annotate(
-        total_mandate=Count('created_by__groupuserdelegator',
-                      filter=~Q(created_by__groupuserdelegator__delegator__pollvoting__poll=poll
-                                ) & Q(created_by__groupuserdelegator__tags__in=[poll.tag]
-                                      ) & Q(created_by__groupuserdelegator__delegator__active=True)
-                      )).values('total_mandate')
-
-    PollDelegateVoting.objects.update(mandate=Subquery(total_mandate))
 
-    if poll.poll_type == Poll.PollType.RANKING:
-        if poll.tag:
-            delegate_votes = PollVotingTypeRanking.objects.filter(author_delegate__poll=poll).values('pk').annotate(
-                score=(total_proposals - (Count('author_delegate__pollvotingtyperanking') - F('priority'))
-                       ) * Subquery(mandate_subquery))
+    # Count mandate for each delegate, save it to the PollDelegateVoting accounts of the poll
+    mandate = sum(poll_delegate_mandate_update(poll=poll).values())
 
-            # Set score to the same as priority for user votes
-            user_votes = PollVotingTypeRanking.objects.filter(author__poll=poll
-                                                              ).values('pk').annotate(
-                score=total_proposals - (Count('author__pollvotingtyperanking') - F('priority')))
+    if poll.tag and poll.poll_type in (Poll.PollType.RANKING, Poll.PollType.CARDINAL, Poll.PollType.SCHEDULE):
+        poll_vote_tally(poll=poll)
 
-            for i in user_votes:
-                PollVotingTypeRanking.objects.filter(id=i['pk']).update(score=i['score'])
-
-            for i in delegate_votes:
-                PollVotingTypeRanking.objects.filter(id=i['pk']).update(score=i['score'])
-
-            # TODO make this work, replace both above
-            # PollVotingTypeRanking.objects.bulk_update(delegate_votes | user_votes, fields=('score',))
-
-            # Update scores on each proposal, Summarize both regular votes and delegate votes
-            proposals = PollProposal.objects.filter(poll_id=poll_id).values('pk') \
-                .annotate(score=Sum('pollvotingtyperanking__score'))
-
-            for i in proposals:
-                PollProposal.objects.filter(id=i['pk']).update(score=i['score'])
-
-            # TODO make this work aswell, replace above
-            # PollProposal.objects.bulk_update(proposals, fields=('score',))
-
-            poll.participants = (mandate + PollVoting.objects.filter(poll=poll).all().count()) or 1
-            poll.save()
-
-    if poll.poll_type == Poll.PollType.CARDINAL:
-        if poll.tag:
-            # Sets baseline scores to all votes
-            PollVotingTypeCardinal.objects.filter(author__isnull=False,
-                                                  proposal__poll=poll).update(score=F('raw_score'))
-            # Calculate final scores
-            multiplier = PollVotingTypeCardinal.objects.filter(id=OuterRef('id')).annotate(
-                multiplier=F('author_delegate__mandate')).values('multiplier')
-
-            PollVotingTypeCardinal.objects.filter(author_delegate__isnull=False, proposal__poll=poll
-                                                  ).update(score=F('raw_score') * Subquery(multiplier))
-
-            proposal_scores = PollProposal.objects.filter(id=OuterRef('id')).annotate(final_score=Sum('pollvotingtypecardinal__score')).values('final_score')
-            PollProposal.objects.update(score=Subquery(proposal_scores))
-
-            poll.participants = (mandate + PollVoting.objects.filter(poll=poll).all().count()) or 1
-            poll.save()
-
-    if poll.poll_type == Poll.PollType.SCHEDULE:
-        if poll.tag:
-            delegate_votes = PollVotingTypeForAgainst.objects.filter(author_delegate__poll=poll).values('pk').annotate(
-                score=(Count('author_delegate__pollvotingtypeforagainst',
-                             filter=Q(vote=True)) * Subquery(mandate_subquery) -
-                       Count('author_delegate__pollvotingtypeforagainst',
-                             filter=Q(vote=False)) * Subquery(mandate_subquery)))
-
-            # Set score to the same as priority for user votes
-            user_votes = PollVotingTypeForAgainst.objects.filter(author__poll=poll, vote=True).values('pk', 'vote')
-
-            for i in user_votes:
-                PollVotingTypeForAgainst.objects.filter(id=i['pk']).update(score=int(i['vote']))
-
-            for i in delegate_votes:
-                PollVotingTypeForAgainst.objects.filter(id=i['pk']).update(score=int(i['vote']))
-
-            # TODO make this work, replace both above (Copied from ranking comment)
-            # PollVotingTypeSchedule.objects.bulk_update(delegate_votes | user_votes, fields=('score',))
-
-            # Update scores on each proposal, Summarize both regular votes and delegate votes
-            proposals = PollProposal.objects.filter(poll_id=poll_id).values('pk') \
-                .annotate(score=Sum('pollvotingtypeforagainst__score'))
-
-            for i in proposals:
-                PollProposal.objects.filter(id=i['pk']).update(score=i['score'])
-
-            # TODO make this work aswell, replace above
-            # PollProposal.objects.bulk_update(proposals, fields=('score',))
-
-            poll.participants = (mandate + PollVoting.objects.filter(poll=poll).all().count()) or 1
-            poll.save()
+        poll.participants = (mandate + PollVoting.objects.filter(poll=poll).all().count()) or 1
+        poll.save()
 
     total_group_users = GroupUser.objects.filter(group=group).count()
     quorum = (poll.quorum if poll.quorum is not None else group.default_quorum) / 100
@@ -434,7 +93,7 @@ def poll_proposal_vote_count(poll_id: int) -> None:
     if poll.finished and not poll.result:
         if poll.poll_type == Poll.PollType.SCHEDULE:
             winning_proposal = PollProposal.objects.filter(
-                poll_id=poll_id).order_by('-score', '-pollproposaltypeschedule__event__start_date').first()
+                poll_id=poll.id).order_by('-score', '-pollproposaltypeschedule__event__start_date').first()
             if winning_proposal:
                 event = winning_proposal.pollproposaltypeschedule.event
                 create_event(schedule_id=group.schedule_id,
@@ -445,10 +104,127 @@ def poll_proposal_vote_count(poll_id: int) -> None:
                              origin_id=poll.id,
                              description=poll.description)
 
-        print(f"Total Participants: {poll.participants}")
-        print(f"Total Group Users: {total_group_users}")
-        print(f"Quorum: {quorum}")
-        poll.status = 1 if poll.participants > total_group_users * quorum else -1
+        logger.debug('Poll %s closed with %s participant(s) of %s group user(s), quorum %s',
+                     poll.id, poll.participants, total_group_users, quorum)
+        poll.status = (Poll.Status.FINISHED if poll.participants > total_group_users * quorum
+                       else Poll.Status.FAILED_QUORUM)
+        poll_prediction_statistics_sync(tag_id=poll.tag_id)
         poll.interval_mean_absolute_correctness = group_tags_interval_mean_absolute_correctness(tag_id=poll.tag_id)
         poll.result = True
         poll.save()
+
+
+def _poll_proposal_vote_count_locked(*, poll_id: int, skip_locked: bool = False) -> bool:
+    """
+    Counts an ongoing poll while holding a lock on its row, so concurrent runs (e.g. a retry or a fast forwarded
+    poll) wait for the first run and then find the poll closed. Returns False if the poll was skipped.
+    """
+    with transaction.atomic():
+        poll = Poll.objects.select_for_update(skip_locked=skip_locked).filter(id=poll_id,
+                                                                              status=Poll.Status.ONGOING).first()
+        if not poll:
+            return False
+
+        _poll_proposal_vote_count(poll=poll)
+        return True
+
+
+@shared_task
+def poll_proposal_vote_count(poll_id: int) -> None:
+    get_object(Poll, id=poll_id)
+    _poll_proposal_vote_count_locked(poll_id=poll_id)
+
+
+@shared_task
+def poll_proposal_vote_count_batch(poll_ids: list[int] = None, end_date_before: str = None) -> int:
+    """
+    Counts many polls in one worker invocation, either the given polls or every ongoing poll that ended before
+    end_date_before (ISO 8601, defaults to now). Given polls wait for their row lock, while polls found by end date
+    that are locked by another worker are skipped (they're picked up by the next run).
+
+    A poll that fails to count doesn't abort the rest of the batch, its phase task is retried later, see
+    poll_phase_task_retry.
+
+    :return: the amount of polls counted
+    """
+    skip_locked = poll_ids is None
+    if poll_ids is None:
+        end_date_before = datetime.fromisoformat(end_date_before) if end_date_before else timezone.now()
+        poll_ids = list(Poll.objects.filter(status=Poll.Status.ONGOING,
+                                            result=False,
+                                            end_date__lte=end_date_before
+                                            ).order_by('end_date').values_list('id', flat=True))
+
+    counted = 0
+    for poll_id in poll_ids:
+        try:
+            counted += _poll_proposal_vote_count_locked(poll_id=poll_id, skip_locked=skip_locked)
+
+        except Exception:
+            logger.exception('Failed to count poll %s', poll_id)
+            poll_phase_task_retry(poll_id=poll_id, task=PollPhaseTask.Task.PROPOSAL_VOTE_COUNT)
+
+    return counted
+
+
+def poll_phase_task_retry(*, poll_id: int, task: str) -> None:
+    """
+    Makes a failed phase task pending again with exponential backoff, until it has failed
+    POLL_PHASE_TASK_MAX_ATTEMPTS times, after which it stays dispatched (and is only run again if the poll is
+    rescheduled, e.g. fast forwarded)
+    """
+    with transaction.atomic():
+        phase_task = PollPhaseTask.objects.select_for_update().filter(poll_id=poll_id, task=task).first()
+        if not phase_task:
+            return
+
+        phase_task.attempts += 1
+        if phase_task.attempts >= POLL_PHASE_TASK_MAX_ATTEMPTS:
+            logger.error('Giving up on %s of poll %s after %s failed attempts', task, poll_id, phase_task.attempts)
+            phase_task.save(update_fields=['attempts', 'updated_at'])
+            return
+
+        phase_task.due_at = timezone.now() + timezone.timedelta(
+            seconds=POLL_PHASE_TASK_RETRY_DELAY * 2 ** (phase_task.attempts - 1))
+        phase_task.dispatched_at = None
+        phase_task.save(update_fields=['attempts', 'due_at', 'dispatched_at', 'updated_at'])
+
+
+POLL_PHASE_TASKS = {PollPhaseTask.Task.AREA_VOTE_COUNT: poll_area_vote_count,
+                    PollPhaseTask.Task.PREDICTION_BET_COUNT: poll_prediction_bet_count}
+
+
+@shared_task
+def poll_phase_dispatch(batch_size: int = 500) -> int:
+    """
+    Sends every due PollPhaseTask to the workers, runs periodically through celery beat.
+
+    Tasks are claimed in batches with SKIP LOCKED so concurrent dispatchers never send the same task twice, and a task
+    is only marked as dispatched once it has been sent. If sending fails the batch is rolled back and retried on the
+    next run, which is safe as every phase task is idempotent.
+    """
+    dispatched = 0
+
+    while True:
+        with transaction.atomic():
+            due = list(PollPhaseTask.objects.select_for_update(skip_locked=True)
+                       .filter(dispatched_at__isnull=True, due_at__lte=timezone.now())
+                       .order_by('due_at').values_list('id', 'poll_id', 'task')[:batch_size])
+
+            # Polls closing in the same run are counted together in one worker invocation
+            closing = []
+            for _, poll_id, task in due:
+                if task == PollPhaseTask.Task.PROPOSAL_VOTE_COUNT:
+                    closing.append(poll_id)
+                else:
+                    POLL_PHASE_TASKS[task].delay(poll_id=poll_id)
+
+            if closing:
+                poll_proposal_vote_count_batch.delay(poll_ids=closing)
+
+            PollPhaseTask.objects.filter(id__in=[i[0] for i in due]).update(dispatched_at=timezone.now())
+
+        dispatched += len(due)
+
+        if len(due) < batch_size:
+            return dispatched
@@ -1,6 +1,9 @@
 import json
+import unittest
+from unittest.mock import patch
 
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db.models import Q
 from django.utils import timezone
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
@@ -8,16 +11,29 @@ from rest_framework.test import APIRequestFactory, force_authenticate, APITransa
 from .factories import PollFactory, PollProposalFactory, PollPredictionStatementFactory
 
 from .utils import generate_poll_phase_kwargs
-from ..models import Poll
-from ..services.poll import poll_fast_forward, poll_create
+from ..models import Poll, PollPhaseTask
+from ..selectors.poll import poll_list
+from ..services.poll import poll_fast_forward, poll_create, poll_phase_task_schedule
+from ..tasks import (POLL_PHASE_TASK_MAX_ATTEMPTS,
+                     _poll_proposal_vote_count,
+                     poll_phase_dispatch,
+                     poll_area_vote_count,
+                     poll_prediction_bet_count,
+                     poll_proposal_vote_count,
+                     poll_proposal_vote_count_batch)
 from ..views.poll import PollListApi, PollCreateAPI, PollUpdateAPI, PollDeleteAPI
 from ...comment.tests.factories import CommentFactory
-from ...common.tests import generate_request
+from ...comment.models import CommentSection
+from ...common.tests import generate_request, benchmark, RUN_BENCHMARKS, BENCHMARK_SIZE
 from ...files.tests.factories import FileSegmentFactory
 from ...group.models import GroupUser
-from ...group.tests.factories import GroupFactory, GroupUserFactory, GroupTagsFactory
+from ...group.selectors import group_content_visible_for
+from ...group.tests.factories import GroupFactory, GroupUserFactory, GroupTagsFactory, WorkGroupFactory, \
+    WorkGroupUserFactory, group_user_bulk_create
 from ...notification.models import NotificationChannel
 from ...user.models import User
+from ...user.selectors import user_home_feed
+from ...user.tests.factories import UserFactory
 
 
 class PollTest(APITransactionTestCase):
@@ -59,6 +75,38 @@ class PollTest(APITransactionTestCase):
         self.assertEqual(response.data['results'][1]['total_proposals'], 12)
         self.assertEqual(response.data['results'][1]['total_predictions'], 15)
 
+    def test_list_polls_visibility(self):
+        user = UserFactory()
+        private_group, public_group = GroupFactory(public=False), GroupFactory(public=True)
+        member = GroupUserFactory(group=private_group, user=user)
+        GroupUserFactory(group=public_group, user=user, active=False)
+        work_group, other_work_group = WorkGroupFactory.create_batch(2, group=private_group)
+        WorkGroupUserFactory(group_user=member, work_group=work_group)
+
+        def create_poll(group, **kwargs):
+            return PollFactory(created_by=group.group_user_creator, **kwargs).id
+
+        visible = {create_poll(private_group),
+                   create_poll(private_group, work_group=work_group),
+                   create_poll(public_group)}
+        admin_only = create_poll(private_group, work_group=other_work_group)
+        hidden = {admin_only,
+                  create_poll(public_group, work_group=WorkGroupFactory(group=public_group)),
+                  create_poll(GroupFactory(public=False))}
+
+        def visible_polls():
+            return set(poll_list(fetched_by=user, group_id=None).values_list('id', flat=True))
+
+        self.assertTrue(visible <= visible_polls())
+        self.assertFalse(hidden & visible_polls())
+        self.assertEqual(visible_polls(), {item.object_id for item in user_home_feed(fetched_by=user)
+                                           if item.related_model == 'poll'})
+
+        # Group admins see the polls of every work group in their group
+        member.is_admin = True
+        member.save()
+        self.assertIn(admin_only, visible_polls())
+
     def test_create_poll(self):
         factory = APIRequestFactory()
         user = self.group_user_creator.user
@@ -117,6 +165,21 @@ class PollTest(APITransactionTestCase):
         self.assertTrue(json.loads(response.rendered_content).get('detail')[0] == 'Schedule poll must be dynamic',
                         json.loads(response.rendered_content))
 
+    def test_create_schedule_poll(self):
+        # Schedule polls only have a start and an end date, so only their result is scheduled
+        poll = poll_create(user_id=self.group_user_creator.user.id,
+                           group_id=self.group.id,
+                           title='test title',
+                           start_date=timezone.now(),
+                           end_date=timezone.now() + timezone.timedelta(hours=1),
+                           poll_type=Poll.PollType.SCHEDULE,
+                           public=True,
+                           tag=self.group_tag.id,
+                           dynamic=True)
+
+        self.assertEqual(list(PollPhaseTask.objects.filter(poll=poll).values_list('task', 'due_at')),
+                         [(PollPhaseTask.Task.PROPOSAL_VOTE_COUNT, poll.end_date)])
+
     def test_update_poll(self):
         factory = APIRequestFactory()
         user = self.group_user_one.user
@@ -177,6 +240,132 @@ class PollTest(APITransactionTestCase):
         poll.refresh_from_db()
         self.assertEqual('vote', poll.current_phase)
 
+    def test_poll_phase_annotation(self):
+        polls = [PollFactory(created_by=self.group_user_one,
+                             poll_type=poll_type,
+                             dynamic=dynamic,
+                             **generate_poll_phase_kwargs(phase))
+                 for poll_type, dynamic in ((Poll.PollType.CARDINAL, False),
+                                            (Poll.PollType.CARDINAL, True),
+                                            (Poll.PollType.SCHEDULE, True))
+                 for phase in ('waiting', 'area_vote', 'proposal', 'vote', 'result', 'prediction_vote')]
+        now = timezone.now()
+
+        annotated = dict(Poll.objects.filter(id__in=[poll.id for poll in polls]).annotate_phase(now)
+                         .values_list('id', 'phase'))
+
+        for poll in polls:
+            phase = poll.phase_at(now)
+            self.assertEqual(annotated[poll.id], phase)
+            self.assertEqual(list(Poll.objects.filter(id__in=[poll.id for poll in polls])
+                                  .filter_phase(phase, now=now).filter(id=poll.id).values_list('id', flat=True)),
+                             [poll.id])
+
+        self.assertEqual(Poll.objects.filter(id__in=[poll.id for poll in polls]).filter_phase('dynamic', now=now).count(),
+                         4)
+
+        # The phase is resolved once per instance, until its phase dates change
+        poll = Poll.objects.annotate_phase(now).get(id=polls[1].id)
+        self.assertEqual(poll.current_phase, 'area_vote')
+        poll.start_date = now + timezone.timedelta(hours=1)
+        self.assertEqual(poll.current_phase, 'waiting')
+
+    def test_poll_phase_dispatch(self):
+        poll = PollFactory(created_by__is_admin=True,
+                           allow_fast_forward=True,
+                           poll_type=4,
+                           dynamic=False,
+                           **generate_poll_phase_kwargs())
+        poll_phase_task_schedule(poll=poll)
+
+        with (patch.object(poll_area_vote_count, 'delay') as area_vote_count,
+              patch.object(poll_prediction_bet_count, 'delay') as prediction_bet_count,
+              patch.object(poll_proposal_vote_count_batch, 'delay') as proposal_vote_count):
+            self.assertEqual(poll_phase_dispatch(), 0)
+
+            # Fast forwarding reschedules the existing tasks, making the passed phases due
+            poll_fast_forward(user_id=poll.created_by.user.id, poll_id=poll.id, phase='vote')
+            self.assertEqual(PollPhaseTask.objects.filter(poll=poll).count(), 3)
+
+            self.assertEqual(poll_phase_dispatch(batch_size=1), 2)
+            self.assertEqual(poll_phase_dispatch(), 0)
+
+        area_vote_count.assert_called_once_with(poll_id=poll.id)
+        prediction_bet_count.assert_called_once_with(poll_id=poll.id)
+        proposal_vote_count.assert_not_called()
+
+        poll.refresh_from_db()
+        self.assertEqual(PollPhaseTask.objects.get(poll=poll, task=PollPhaseTask.Task.PROPOSAL_VOTE_COUNT).due_at,
+                         poll.end_date)
+
+    def test_poll_proposal_vote_count_idempotent(self):
+        poll = PollFactory(created_by=self.group_user_one,
+                           poll_type=Poll.PollType.CARDINAL,
+                           tag=self.group_tag,
+                           **generate_poll_phase_kwargs('result'))
+
+        poll_proposal_vote_count(poll_id=poll.id)
+        poll.refresh_from_db()
+        self.assertTrue(poll.result)
+        self.assertIn(poll.status, (Poll.Status.FINISHED, Poll.Status.FAILED_QUORUM))
+
+        # A closed poll is never counted again, only looked up and locked (BEGIN, SELECT ... FOR UPDATE, COMMIT)
+        with self.assertNumQueries(4):
+            poll_proposal_vote_count(poll_id=poll.id)
+
+    def test_poll_proposal_vote_count_batch(self):
+        closing = [PollFactory(created_by=self.group_user_one,
+                               poll_type=Poll.PollType.CARDINAL,
+                               tag=self.group_tag,
+                               **generate_poll_phase_kwargs('prediction_vote')) for _ in range(3)]
+        ongoing = PollFactory(created_by=self.group_user_one,
+                              poll_type=Poll.PollType.CARDINAL,
+                              tag=self.group_tag,
+                              **generate_poll_phase_kwargs('vote'))
+
+        self.assertEqual(poll_proposal_vote_count_batch(), 3)
+        self.assertEqual(poll_proposal_vote_count_batch(), 0)
+        self.assertEqual(poll_proposal_vote_count_batch(poll_ids=[poll.id for poll in closing]), 0)
+
+        self.assertEqual(Poll.objects.filter(id__in=[poll.id for poll in closing], result=True).count(), 3)
+        ongoing.refresh_from_db()
+        self.assertEqual(ongoing.status, Poll.Status.ONGOING)
+        self.assertFalse(ongoing.result)
+
+    def test_poll_proposal_vote_count_batch_failure(self):
+        failing, closing = [PollFactory(created_by=self.group_user_one,
+                                        poll_type=Poll.PollType.CARDINAL,
+                                        tag=self.group_tag,
+                                        **generate_poll_phase_kwargs('prediction_vote')) for _ in range(2)]
+        poll_phase_task_schedule(poll=failing)
+        PollPhaseTask.objects.filter(poll=failing).update(dispatched_at=timezone.now())
+
+        def count(*, poll):
+            if poll.id == failing.id:
+                raise ValueError('Counting failed')
+            return _poll_proposal_vote_count(poll=poll)
+
+        def phase_task():
+            return PollPhaseTask.objects.get(poll=failing, task=PollPhaseTask.Task.PROPOSAL_VOTE_COUNT)
+
+        # A failing poll doesn't stop the batch, and its task is dispatched again after a delay
+        with patch('flowback.poll.tasks._poll_proposal_vote_count', side_effect=count):
+            self.assertEqual(poll_proposal_vote_count_batch(poll_ids=[failing.id, closing.id]), 1)
+
+            self.assertTrue(Poll.objects.get(id=closing.id).result)
+            self.assertFalse(Poll.objects.get(id=failing.id).result)
+            self.assertEqual((phase_task().attempts, phase_task().dispatched_at), (1, None))
+            self.assertGreater(phase_task().due_at, timezone.now())
+            self.assertEqual(poll_phase_dispatch(), 0)
+
+            # Until it has failed too often
+            for _ in range(POLL_PHASE_TASK_MAX_ATTEMPTS - 1):
+                PollPhaseTask.objects.filter(poll=failing).update(dispatched_at=timezone.now())
+                poll_proposal_vote_count_batch(poll_ids=[failing.id])
+
+        self.assertEqual(phase_task().attempts, POLL_PHASE_TASK_MAX_ATTEMPTS)
+        self.assertIsNotNone(phase_task().dispatched_at)
+
     @staticmethod
     def delete_poll(poll: Poll, user: User):
         factory = APIRequestFactory()
@@ -205,3 +394,75 @@ class PollTest(APITransactionTestCase):
 
         self.assertTrue(response.status_code == 200)
         self.assertTrue(not Poll.objects.filter(id=poll.id).exists())
+
+
+def _legacy_poll_visibility(user: User) -> Q:
+    """The join based visibility filter that group_content_visible_for replaced, kept as a baseline"""
+    q = (Q(created_by__group__groupuser__user__in=[user])
+         & Q(created_by__group__groupuser__active=True))
+
+    return (q & Q(work_group__isnull=True)
+            | Q(created_by__group__public=True)
+            & ~Q(created_by__group__groupuser__user__in=[user])
+            & Q(work_group__isnull=True)
+            | q & Q(work_group__isnull=False)
+            & Q(work_group__workgroupuser__group_user__user=user))
+
+
+@unittest.skipUnless(RUN_BENCHMARKS, 'Set FLOWBACK_RUN_BENCHMARKS to run benchmarks')
+class PollListBenchmark(APITransactionTestCase):
+    sizes = (10_000, 100_000, 1_000_000)
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.groups = [GroupFactory(public=i % 2 == 0) for i in range(20)]
+        self.work_groups = [WorkGroupFactory(group=group) for group in self.groups]
+
+        for i, group in enumerate(self.groups[:5]):
+            group_user = GroupUserFactory(group=group, user=self.user, is_admin=i == 0)
+            WorkGroupUserFactory(group_user=group_user, work_group=self.work_groups[i])
+
+        for group in self.groups:
+            group_user_bulk_create(group=group, amount=BENCHMARK_SIZE)
+
+    def create_polls(self, amount: int):
+        comment_section = CommentSection.objects.create()
+        now = timezone.now()
+        polls = []
+
+        for i in range(amount):
+            group = i % len(self.groups)
+            polls.append(Poll(created_by=self.groups[group].group_user_creator,
+                              work_group=self.work_groups[group] if i % 10 == 0 else None,
+                              title=f'poll {i}',
+                              poll_type=Poll.PollType.CARDINAL,
+                              dynamic=True,
+                              start_date=now,
+                              end_date=now + timezone.timedelta(days=1),
+                              comment_section=comment_section))
+
+        Poll.objects.bulk_create(polls, batch_size=10_000)
+
+    def test_poll_list_visibility_benchmark(self):
+        created = 0
+
+        for size in self.sizes:
+            self.create_polls(size - created)
+            created = size
+
+            # The legacy filter repeats every public poll for each member of its group, it is skipped at 1M
+            filters = [('exists', group_content_visible_for(user=self.user))]
+            if size <= 100_000:
+                filters.append(('legacy', _legacy_poll_visibility(self.user)))
+
+            results = {}
+            for name, q in filters:
+                qs = Poll.objects.filter(q).order_by('-start_date')
+                count = benchmark(qs.count)
+                page = benchmark(lambda: list(qs[:25]))
+                results[name] = qs.values('id').distinct().count()
+
+                print(f"\nPoll visibility ({name}), {size} polls: {results[name]} visible polls, "
+                      f"count {count['seconds']:.3f}s, first page {page['seconds']:.3f}s\n{qs[:25].explain()}")
+
+            self.assertEqual(results.get('legacy', results['exists']), results['exists'])
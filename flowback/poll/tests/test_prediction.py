@@ -1,8 +1,11 @@
 import json
+import os
 import random
 from pprint import pprint
 
+import numpy as np
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command, CommandError
 from django.db import models
 from django.db.models import Sum, Case, When, F
 from django.db.models.functions import Abs
@@ -13,7 +16,13 @@ from flowback.group.models import GroupUser, GroupTags
 from flowback.group.tests.factories import GroupFactory, GroupUserFactory, GroupTagsFactory
 from flowback.group.views.tag import GroupTagsListApi, GroupTagIntervalMeanAbsoluteCorrectnessAPI
 from flowback.poll.models import Poll, PollPredictionStatement, PollPredictionStatementSegment, PollPredictionBet, \
-    PollPredictionStatementVote, PollProposal
+    PollPredictionStatementVote, PollProposal, PollPredictionStatistics, PollPredictionPredictorStatistics
+from flowback.poll.selectors.prediction import poll_prediction_bet_history
+from flowback.poll.services.prediction import (poll_prediction_statement_vote_create,
+                                               poll_prediction_statement_vote_update,
+                                               poll_prediction_statement_vote_delete)
+from flowback.poll.services.prediction_statistics import poll_prediction_statistics_check
+from flowback.prediction.combined_bet import combine_bets
 from flowback.poll.tasks import poll_prediction_bet_count
 from flowback.poll.tests.factories import PollFactory, PollPredictionBetFactory, PollProposalFactory, \
     PollPredictionStatementFactory, PollPredictionStatementSegmentFactory, PollPredictionStatementVoteFactory
@@ -433,3 +442,98 @@ class PollPredictionStatementTest(APITransactionTestCase):
 
         data = json.loads(response.rendered_content)
         pprint(data)
+
+    def test_poll_prediction_bet_history(self):
+        previous_poll = PollFactory(created_by=self.user_group_creator,
+                                    tag=self.poll.tag,
+                                    **generate_poll_phase_kwargs('prediction_vote'))
+        self.generate_previous_bet(poll=previous_poll,
+                                   bet_users=[self.BetUser(group_user=self.user_prediction_caster_one,
+                                                           score=5,
+                                                           vote=True),
+                                              self.BetUser(group_user=self.user_prediction_caster_two,
+                                                           score=0,
+                                                           vote=True)])
+
+        PollPredictionBetFactory(prediction_statement=self.prediction_statement,
+                                 created_by=self.user_prediction_caster_one,
+                                 score=1)
+        PollPredictionBetFactory(prediction_statement=self.prediction_statement,
+                                 created_by=self.user_prediction_caster_three,
+                                 score=4)
+
+        with self.assertNumQueries(2):
+            history = poll_prediction_bet_history(poll=self.poll)
+
+        # caster_two never bet in the poll, so they're not a predictor
+        self.assertEqual(history.predictors, sorted([self.user_prediction_caster_one.id,
+                                                     self.user_prediction_caster_three.id]))
+        one, three = (history.predictors.index(i.id) for i in [self.user_prediction_caster_one,
+                                                                self.user_prediction_caster_three])
+
+        self.assertEqual(history.current_statements, [self.prediction_statement.id])
+        self.assertEqual(list(history.previous_outcomes), [1.0])
+        self.assertAlmostEqual(history.current_bets[one, 0], 0.2)
+        self.assertAlmostEqual(history.current_bets[three, 0], 0.8)
+        self.assertEqual(history.previous_bets[one, 0], 1.0)
+        self.assertTrue(np.isnan(history.previous_bets[three, 0]))
+
+    def test_poll_prediction_statistics_combined_bet(self):
+        casters = [self.user_prediction_caster_one, self.user_prediction_caster_two, self.user_prediction_caster_three]
+        self.run_combined_bet([[1, True], [5, True], None],
+                              [[3, True], None, [3, False]],
+                              [[4, False], [5, True], [0, False]],
+                              group_users=casters)
+        self.run_combined_bet([[0, False], [2, True], [5, True]],
+                              [None, [1, True], [4, False]],
+                              group_users=casters)
+
+        for caster, score in zip(casters, [2, 4, 5]):
+            PollPredictionBetFactory(prediction_statement=self.prediction_statement, created_by=caster, score=score)
+
+        history = poll_prediction_bet_history(poll=self.poll)
+        expected = combine_bets(current_bets=history.current_bets,
+                                previous_bets=history.previous_bets,
+                                previous_outcomes=history.previous_outcomes)
+
+        poll_prediction_bet_count(poll_id=self.poll.id)
+        self.prediction_statement.refresh_from_db()
+
+        self.assertAlmostEqual(float(self.prediction_statement.combined_bet), expected[0], places=6)
+        self.assertEqual(poll_prediction_statistics_check(tag_id=self.poll.tag_id), [])
+
+    def test_poll_prediction_statistics_statement_vote(self):
+        poll = PollFactory(created_by=self.user_group_creator,
+                           tag=self.poll.tag,
+                           **generate_poll_phase_kwargs('prediction_vote'))
+        statement = PollPredictionStatementFactory(poll=poll, created_by=self.user_prediction_creator)
+        for caster, score in [(self.user_prediction_caster_one, 5), (self.user_prediction_caster_two, 1)]:
+            PollPredictionBetFactory(prediction_statement=statement, created_by=caster, score=score)
+
+        def statistics():
+            self.assertEqual(poll_prediction_statistics_check(tag_id=poll.tag_id), [])
+            return PollPredictionStatistics.objects.get(tag_id=poll.tag_id)
+
+        user = self.user_prediction_caster_one.user
+        poll_prediction_statement_vote_create(user=user, prediction_statement_id=statement.id, vote=True)
+        self.assertEqual(statistics().outcome_sum, 1)
+        self.assertEqual(PollPredictionPredictorStatistics.objects.filter(tag_id=poll.tag_id).count(), 4)
+
+        poll_prediction_statement_vote_update(user=user, prediction_statement_id=statement.id, data=dict(vote=False))
+        self.assertEqual(statistics().outcome_sum, 0)
+
+        poll_prediction_statement_vote_delete(user=user, prediction_statement_id=statement.id)
+        self.assertEqual(statistics().outcome_sum, 0.5)
+        self.assertEqual(statistics().statement_count, 1)
+        self.assertFalse(PollPredictionPredictorStatistics.objects.filter(tag_id=poll.tag_id).exists())
+
+    def test_poll_prediction_statistics_command(self):
+        self.run_combined_bet([[1, True], [5, True]],
+                              group_users=[self.user_prediction_caster_one, self.user_prediction_caster_two])
+        call_command('poll_prediction_statistics', '--check', stdout=open(os.devnull, 'w'))
+
+        PollPredictionPredictorStatistics.objects.filter(tag_id=self.poll.tag_id).update(count=42)
+        with self.assertRaises(CommandError):
+            call_command('poll_prediction_statistics', '--check', stdout=open(os.devnull, 'w'))
+
+        call_command('poll_prediction_statistics', '--rebuild', '--check', stdout=open(os.devnull, 'w'))
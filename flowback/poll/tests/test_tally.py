@@ -0,0 +1,219 @@
+import unittest
+
+from django.db.models import Count, F, Sum, OuterRef, Subquery
+from rest_framework.test import APITransactionTestCase
+
+from .factories import (PollFactory,
+                        PollProposalFactory,
+                        PollVotingFactory,
+                        PollDelegateVotingFactory,
+                        PollVotingTypeRankingFactory)
+from .utils import generate_poll_phase_kwargs
+from ..models import Poll, PollProposal, PollVoting, PollVotingTypeRanking, PollDelegateVoting
+from ..services.tally import poll_vote_tally, poll_delegate_mandate_update, poll_live_tally_proposals_changed
+from ..services.vote import poll_proposal_vote_update, poll_proposal_delegate_vote_update
+from ...common.tests import benchmark, RUN_BENCHMARKS, BENCHMARK_SIZE
+from ...group.tests.factories import GroupFactory, GroupUserFactory, GroupTagsFactory, GroupUserDelegatePoolFactory, \
+    GroupUserDelegatorFactory, GroupUserDelegateFactory, group_user_bulk_create
+
+
+class PollTallyTest(APITransactionTestCase):
+    def setUp(self):
+        self.group = GroupFactory()
+        self.group_user_one, self.group_user_two = GroupUserFactory.create_batch(2, group=self.group)
+        self.poll = PollFactory(created_by=self.group_user_one,
+                                poll_type=Poll.PollType.RANKING,
+                                tag=GroupTagsFactory(group=self.group),
+                                **generate_poll_phase_kwargs('result'))
+        self.proposals = PollProposalFactory.create_batch(3, created_by=self.group_user_one, poll=self.poll)
+
+    def vote_ranking(self, proposals: list[PollProposal], **author):
+        for priority, proposal in enumerate(proposals):
+            PollVotingTypeRankingFactory(proposal=proposal, priority=len(proposals) - priority, **author)
+
+    def test_ranking_tally(self):
+        p1, p2, p3 = self.proposals
+        self.vote_ranking([p1, p2], author=PollVotingFactory(created_by=self.group_user_one, poll=self.poll))
+        self.vote_ranking([p3, p1, p2], author=PollVotingFactory(created_by=self.group_user_two, poll=self.poll))
+        delegate_voting = PollDelegateVotingFactory(created_by=GroupUserDelegatePoolFactory(group=self.group),
+                                                    poll=self.poll,
+                                                    mandate=2)
+        self.vote_ranking([p2], author_delegate=delegate_voting)
+
+        # Ranking, ballot size and mandate must not matter for the amount of queries
+        with self.assertNumQueries(4):
+            poll_vote_tally(poll=self.poll)
+
+        for proposal in self.proposals:
+            proposal.refresh_from_db()
+
+        self.assertEqual(p1.score, 5)
+        self.assertEqual(p2.score, 9)
+        self.assertEqual(p3.score, 3)
+
+    def test_tally_ignores_other_polls(self):
+        other_proposal = PollProposalFactory(created_by=self.group_user_one,
+                                             poll=PollFactory(created_by=self.group_user_one,
+                                                              poll_type=Poll.PollType.RANKING))
+        PollProposal.objects.filter(id=other_proposal.id).update(score=42)
+
+        self.vote_ranking(self.proposals, author=PollVotingFactory(created_by=self.group_user_one, poll=self.poll))
+        poll_vote_tally(poll=self.poll)
+
+        other_proposal.refresh_from_db()
+        self.assertEqual(other_proposal.score, 42)
+        self.assertEqual(sorted(PollProposal.objects.filter(poll=self.poll).values_list('score', flat=True)),
+                         [1, 2, 3])
+
+    def test_delegate_mandate_update(self):
+        pool = GroupUserDelegatePoolFactory(group=self.group)
+        delegate_voting = PollDelegateVotingFactory(created_by=pool, poll=self.poll)
+
+        delegators = [GroupUserDelegatorFactory(group=self.group, delegate_pool=pool) for _ in range(4)]
+        for delegator in delegators[:3]:
+            delegator.tags.add(self.poll.tag)
+
+        # Delegators voting themselves or being inactive do not count towards the mandate
+        PollVotingFactory(created_by=delegators[0].delegator, poll=self.poll)
+        delegators[1].delegator.active = False
+        delegators[1].delegator.save()
+
+        other_delegate_voting = PollDelegateVotingFactory(created_by=pool,
+                                                          poll=PollFactory(created_by=self.group_user_one),
+                                                          mandate=42)
+
+        with self.assertNumQueries(2):
+            mandates = poll_delegate_mandate_update(poll=self.poll)
+
+        delegate_voting.refresh_from_db()
+        other_delegate_voting.refresh_from_db()
+
+        self.assertEqual(mandates, {pool.id: 1})
+        self.assertEqual(delegate_voting.mandate, 1)
+        self.assertEqual(other_delegate_voting.mandate, 42)
+
+
+class PollLiveTallyTest(APITransactionTestCase):
+    def setUp(self):
+        self.group = GroupFactory()
+        self.group_user_one, self.group_user_two = GroupUserFactory.create_batch(2, group=self.group)
+        self.tag = GroupTagsFactory(group=self.group)
+
+    def create_poll(self, poll_type: int, dynamic: bool = True) -> tuple[Poll, list[PollProposal]]:
+        poll = PollFactory(created_by=self.group_user_one,
+                           poll_type=poll_type,
+                           dynamic=dynamic,
+                           tag=self.tag,
+                           **generate_poll_phase_kwargs('vote'))
+        return poll, PollProposalFactory.create_batch(3, created_by=self.group_user_one, poll=poll)
+
+    @staticmethod
+    def scores(proposals: list[PollProposal]) -> list[int | None]:
+        return [PollProposal.objects.get(id=proposal.id).score for proposal in proposals]
+
+    def vote(self, group_user, poll: Poll, proposals: list[PollProposal], scores: list[int] = None, delegate=False):
+        vote_update = poll_proposal_delegate_vote_update if delegate else poll_proposal_vote_update
+        vote_update(user_id=group_user.user.id,
+                    poll_id=poll.id,
+                    data=dict(proposals=[proposal.id for proposal in proposals], scores=scores))
+
+    def test_live_tally_cardinal(self):
+        poll, (p1, p2, p3) = self.create_poll(Poll.PollType.CARDINAL)
+
+        self.vote(self.group_user_one, poll, [p1, p2], [3, 5])
+        self.assertEqual(self.scores([p1, p2, p3]), [3, 5, None])
+
+        self.vote(self.group_user_two, poll, [p2, p3], [1, 2])
+        self.assertEqual(self.scores([p1, p2, p3]), [3, 6, 2])
+
+        self.vote(self.group_user_one, poll, [p3], [4])
+        self.assertEqual(self.scores([p1, p2, p3]), [0, 1, 6])
+
+        # Delegate ballots count with the mandate at the time of voting
+        delegate = GroupUserDelegateFactory(group=self.group)
+        delegator = GroupUserDelegatorFactory(group=self.group, delegate_pool=delegate.pool)
+        delegator.tags.add(self.tag)
+
+        self.vote(delegate.group_user, poll, [p1], [10], delegate=True)
+        self.assertEqual(self.scores([p1, p2, p3]), [10, 1, 6])
+
+        # The final count reconciles with the same result
+        live_scores = self.scores([p1, p2, p3])
+        poll_vote_tally(poll=poll)
+        self.assertEqual(self.scores([p1, p2, p3]), live_scores)
+
+        self.vote(self.group_user_two, poll, [], [])
+        self.assertEqual(self.scores([p1, p2, p3]), [10, 0, 4])
+
+    def test_live_tally_ranking_proposal_changes(self):
+        poll, (p1, p2, p3) = self.create_poll(Poll.PollType.RANKING)
+
+        self.vote(self.group_user_one, poll, [p1, p2])
+        self.assertEqual(self.scores([p1, p2, p3]), [3, 2, None])
+
+        p4 = PollProposalFactory(created_by=self.group_user_one, poll=poll)
+        poll_live_tally_proposals_changed(poll=poll)
+        self.assertEqual(self.scores([p1, p2, p3, p4]), [4, 3, None, None])
+
+    def test_live_tally_only_dynamic(self):
+        poll, (p1, p2, p3) = self.create_poll(Poll.PollType.CARDINAL, dynamic=False)
+
+        self.vote(self.group_user_one, poll, [p1, p2], [3, 5])
+        self.assertEqual(self.scores([p1, p2, p3]), [None, None, None])
+
+
+def _legacy_ranking_tally(poll: Poll):
+    """The per-row implementation that poll_vote_tally replaced, kept as a baseline for the benchmark"""
+    total_proposals = poll.pollproposal_set.count()
+    mandate = PollDelegateVoting.objects.filter(id=OuterRef('author_delegate')).values('mandate')
+
+    delegate_votes = PollVotingTypeRanking.objects.filter(author_delegate__poll=poll).values('pk').annotate(
+        score=(total_proposals - (Count('author_delegate__pollvotingtyperanking') - F('priority'))
+               ) * Subquery(mandate))
+    user_votes = PollVotingTypeRanking.objects.filter(author__poll=poll).values('pk').annotate(
+        score=total_proposals - (Count('author__pollvotingtyperanking') - F('priority')))
+
+    for i in user_votes:
+        PollVotingTypeRanking.objects.filter(id=i['pk']).update(score=i['score'])
+
+    for i in delegate_votes:
+        PollVotingTypeRanking.objects.filter(id=i['pk']).update(score=i['score'])
+
+    proposals = PollProposal.objects.filter(poll=poll).values('pk').annotate(score=Sum('pollvotingtyperanking__score'))
+    for i in proposals:
+        PollProposal.objects.filter(id=i['pk']).update(score=i['score'])
+
+
+@unittest.skipUnless(RUN_BENCHMARKS, 'Set FLOWBACK_RUN_BENCHMARKS to run benchmarks')
+class PollTallyBenchmark(APITransactionTestCase):
+    def setUp(self):
+        self.group = GroupFactory()
+        self.poll = PollFactory(created_by=self.group.group_user_creator,
+                                poll_type=Poll.PollType.RANKING,
+                                tag=GroupTagsFactory(group=self.group),
+                                **generate_poll_phase_kwargs('result'))
+        self.proposals = PollProposalFactory.create_batch(5, created_by=self.group.group_user_creator, poll=self.poll)
+
+        group_users = group_user_bulk_create(group=self.group, amount=BENCHMARK_SIZE)
+        votings = PollVoting.objects.bulk_create([PollVoting(created_by=group_user, poll=self.poll)
+                                                  for group_user in group_users])
+        PollVotingTypeRanking.objects.bulk_create([PollVotingTypeRanking(author=voting,
+                                                                         proposal=proposal,
+                                                                         priority=len(self.proposals) - priority)
+                                                   for voting in votings
+                                                   for priority, proposal in enumerate(self.proposals)])
+
+    def test_ranking_tally_benchmark(self):
+        legacy = benchmark(_legacy_ranking_tally, self.poll)
+        legacy_scores = list(PollProposal.objects.filter(poll=self.poll).order_by('id').values_list('score', flat=True))
+        PollProposal.objects.filter(poll=self.poll).update(score=None)
+
+        tally = benchmark(poll_vote_tally, poll=self.poll)
+        tally_scores = list(PollProposal.objects.filter(poll=self.poll).order_by('id').values_list('score', flat=True))
+
+        print(f"\nRanking tally, {BENCHMARK_SIZE} ballots:"
+              f"\n  legacy: {legacy['queries']} queries, {legacy['seconds']:.3f}s"
+              f"\n  tally:  {tally['queries']} queries, {tally['seconds']:.3f}s")
+
+        self.assertEqual(legacy_scores, tally_scores)
+        self.assertLess(tally['queries'], legacy['queries'])
@@ -14,7 +14,7 @@ from .views.vote import (PollProposalVoteListAPI,
                          PollProposalDelegateVoteUpdateAPI,
                          DelegatePollVoteListAPI)
 from .views.comment import PollCommentListAPI, PollCommentCreateAPI, PollCommentUpdateAPI, PollCommentDeleteAPI, \
-    PollCommentVoteAPI, PollCommentAncestorListAPI
+    PollCommentVoteAPI, PollCommentAncestorListAPI, PollCommentTreeAPI
 from .views.prediction import (PollPredictionStatementListAPI,
                                PollPredictionBetListAPI,
                                PollPredictionStatementCreateAPI,
@@ -56,6 +56,7 @@ poll_patterns = [
     path('<int:poll_id>/comment/<int:comment_id>/ancestor',
          PollCommentAncestorListAPI.as_view(),
          name='poll_comment_ancestor_list'),
+    path('<int:poll_id>/comment/tree', PollCommentTreeAPI.as_view(), name='poll_comment_tree'),
     path('<int:poll_id>/comment/create', PollCommentCreateAPI.as_view(), name='poll_comment_create'),
     path('<int:poll_id>/comment/<int:comment_id>/update', PollCommentUpdateAPI.as_view(), name='poll_comment_update'),
     path('<int:poll_id>/comment/<int:comment_id>/delete', PollCommentDeleteAPI.as_view(), name='poll_comment_delete'),
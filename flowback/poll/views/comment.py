@@ -1,6 +1,6 @@
 from drf_spectacular.utils import extend_schema
 
-from ..selectors.comment import poll_comment_list, poll_comment_ancestor_list
+from ..selectors.comment import poll_comment_list, poll_comment_ancestor_list, poll_comment_tree
 
 from ..services.comment import (poll_comment_create,
                                 poll_comment_update,
@@ -12,7 +12,8 @@ from flowback.comment.views import (CommentListAPI,
                                     CommentUpdateAPI,
                                     CommentDeleteAPI,
                                     CommentVoteAPI,
-                                    CommentAncestorListAPI)
+                                    CommentAncestorListAPI,
+                                    CommentTreeAPI)
 
 
 @extend_schema(tags=['poll/comment'])
@@ -25,6 +26,11 @@ class PollCommentAncestorListAPI(CommentAncestorListAPI):
     lazy_action = poll_comment_delete
 
 
+@extend_schema(tags=['poll/comment'])
+class PollCommentTreeAPI(CommentTreeAPI):
+    lazy_action = poll_comment_tree
+
+
 @extend_schema(tags=['poll/comment'])
 class PollCommentCreateAPI(CommentCreateAPI):
     lazy_action = poll_comment_create
@@ -0,0 +1,167 @@
+import numpy as np
+
+# Small decimal (AT LEAST a magnitude below 10^(-6))
+SMALL_DECIMAL = 10 ** -7
+
+# Covariance matrices with a condition number above this are treated as singular
+MAX_CONDITION = 10 ** 12
+
+
+def to_float_matrix(rows) -> np.ndarray:
+    """Converts a (nested) list of bets, where None marks a missing bet, to a float matrix with NaN for None"""
+    matrix = np.array(rows, dtype=object)
+    if matrix.size == 0:
+        return np.zeros(matrix.shape, dtype=float)
+
+    return np.where(matrix == None, np.nan, matrix).astype(float)  # noqa: E711
+
+
+def bet_statistics(*, previous_bets: np.ndarray, previous_outcomes: np.ndarray) -> dict[str, np.ndarray]:
+    """
+    Running sums over the decided history of every ordered pair of predictors, NaN marks a missing bet.
+
+    For predictor k and predictor j, only statements both have bet on are summed (pairwise-complete):
+        shared[k, j]: amount of statements
+        bet_sums[k, j]: sum of the bets of k
+        error_sums[k, j]: sum of the errors (outcome - bet) of k
+        error_products[k, j]: sum of the error of k times the error of j
+
+    The diagonal holds the statistics of each predictor on its own. Undecided (0.5) outcomes are ignored.
+    """
+    previous_bets = np.asarray(previous_bets, dtype=float)
+    previous_outcomes = np.asarray(previous_outcomes, dtype=float)
+
+    decided = previous_outcomes != 0.5
+    previous_bets = previous_bets[:, decided]
+    errors = previous_outcomes[decided] - previous_bets
+
+    mask = ~np.isnan(previous_bets)
+    weights = mask.astype(float)
+    filled_bets = np.where(mask, previous_bets, 0.0)
+    filled_errors = np.where(mask, errors, 0.0)
+
+    return dict(shared=weights @ weights.T,
+                bet_sums=filled_bets @ weights.T,
+                error_sums=filled_errors @ weights.T,
+                error_products=filled_errors @ filled_errors.T)
+
+
+def covariance_from_statistics(*, shared: np.ndarray, error_sums: np.ndarray, error_products: np.ndarray):
+    """Population covariance of the errors of each predictor pair, pairs without shared statements get 0"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = error_products / shared - (error_sums * error_sums.T) / shared ** 2
+
+    return np.where(shared > 0, covariance, 0.0)
+
+
+def pairwise_covariance(values: np.ndarray) -> np.ndarray:
+    """
+    Population covariance between every pair of rows in values, NaN marks a missing value.
+
+    Each pair is compared on the columns where both rows have a value (pairwise-complete), with the means taken over
+    those columns only. Pairs without any shared column get a covariance of 0.
+    """
+    mask = ~np.isnan(values)
+    weights = mask.astype(float)
+    filled = np.where(mask, values, 0.0)
+
+    return covariance_from_statistics(shared=weights @ weights.T,
+                                      error_sums=filled @ weights.T,
+                                      error_products=filled @ filled.T)
+
+
+def combination_weights(covariance: np.ndarray) -> np.ndarray:
+    """
+    Minimum variance weights w = C⁻¹1 / (1ᵀC⁻¹1), summing up to one.
+
+    Singular (or nearly singular) covariance matrices get a small ridge added to the diagonal, making the
+    solution deterministic for identical input.
+    """
+    size = covariance.shape[0]
+    ones = np.ones(size)
+
+    if np.linalg.cond(covariance) > MAX_CONDITION:
+        ridge = SMALL_DECIMAL * max(1.0, float(np.abs(covariance).max()))
+        covariance = covariance + ridge * np.eye(size)
+
+    solution = np.linalg.solve(covariance, ones)
+    denominator = ones @ solution
+
+    if denominator == 0:
+        denominator = SMALL_DECIMAL
+
+    return solution / denominator
+
+
+def combine_bets_from_statistics(*,
+                                 current_bets: np.ndarray,
+                                 outcome_mean: float,
+                                 shared: np.ndarray,
+                                 bet_sums: np.ndarray,
+                                 error_sums: np.ndarray,
+                                 error_products: np.ndarray) -> np.ndarray:
+    """
+    Combines the bets of every predictor into one bet per statement, assuming no bias and stationary predictors.
+
+    :param current_bets: predictor × statement matrix of the bets to combine, NaN for missing bets
+    :param outcome_mean: mean outcome of the history, used for bias adjustment
+    :param shared, bet_sums, error_sums, error_products: predictor × predictor history sums, see bet_statistics
+    :return: combined bet per statement, NaN for statements without bets
+    """
+    current_bets = np.asarray(current_bets, dtype=float)
+    shared, bet_sums = np.asarray(shared, dtype=float), np.asarray(bet_sums, dtype=float)
+    error_sums, error_products = np.asarray(error_sums, dtype=float), np.asarray(error_products, dtype=float)
+
+    # Ignore predictors with no history, if there is at least one predictor with a history
+    has_history = np.diagonal(shared) > 0
+    if not has_history.any():
+        has_bets = ~np.isnan(current_bets)
+        with np.errstate(invalid='ignore'):
+            combined = np.nansum(current_bets, axis=0) / has_bets.sum(axis=0)
+
+        return np.where(has_bets.any(axis=0), combined, np.nan)
+
+    current_bets = current_bets[has_history]
+    shared, bet_sums = shared[np.ix_(has_history, has_history)], bet_sums[np.ix_(has_history, has_history)]
+    error_sums = error_sums[np.ix_(has_history, has_history)]
+    error_products = error_products[np.ix_(has_history, has_history)]
+
+    bias_adjustments = outcome_mean - np.diagonal(bet_sums) / np.diagonal(shared)
+    covariance = covariance_from_statistics(shared=shared, error_sums=error_sums, error_products=error_products)
+
+    has_bets = ~np.isnan(current_bets)
+    combined = np.full(current_bets.shape[1], np.nan)
+
+    for i in range(current_bets.shape[1]):
+        predictors = np.flatnonzero(has_bets[:, i])
+        if predictors.size == 0:
+            continue
+
+        weights = combination_weights(covariance[np.ix_(predictors, predictors)])
+        adjusted_bets = np.clip(current_bets[predictors, i] + bias_adjustments[predictors], 0, 1)
+        combined[i] = np.clip(weights @ adjusted_bets, 0, 1)
+
+    return combined
+
+
+def combine_bets(*,
+                 current_bets: np.ndarray,
+                 previous_bets: np.ndarray,
+                 previous_outcomes: np.ndarray,
+                 outcome_mean: float = None) -> np.ndarray:
+    """
+    Combines the bets of every predictor using their full history, see combine_bets_from_statistics.
+
+    :param previous_bets: predictor × history matrix of earlier bets in the same area, NaN for missing bets
+    :param previous_outcomes: outcome (0 or 1) of every history column, undecided (0.5) columns are ignored
+    :param outcome_mean: mean outcome used for bias adjustment, defaults to the mean of previous_outcomes
+    """
+    previous_outcomes = np.asarray(previous_outcomes, dtype=float)
+
+    if outcome_mean is None:
+        outcome_mean = float(previous_outcomes.mean()) if previous_outcomes.size else 0.0
+
+    return combine_bets_from_statistics(current_bets=current_bets,
+                                        outcome_mean=outcome_mean,
+                                        **bet_statistics(previous_bets=previous_bets,
+                                                         previous_outcomes=previous_outcomes))
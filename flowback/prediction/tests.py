@@ -1,3 +1,116 @@
-from django.test import TestCase
+import time
+import unittest
 
-# Create your tests here.
+import numpy as np
+
+from flowback.common.tests import RUN_BENCHMARKS
+from flowback.prediction.combined_bet import pairwise_covariance, combine_bets, to_float_matrix
+
+
+def _legacy_covariance_matrix(predictor_errors: list[list[float | None]]) -> list[list[float]]:
+    """The pure-python covariance that pairwise_covariance replaced, kept as a reference"""
+    def drop_incomparable_values(arr_1, arr_2):
+        drop_list = [i for i in range(len(arr_1)) if arr_1[i] is None or arr_2[i] is None]
+        return np.delete(np.array(arr_1), drop_list), np.delete(np.array(arr_2), drop_list)
+
+    def covariance(arr_1, arr_2):
+        return (1 / len(arr_1)) * sum([(arr_1[i] - np.mean(arr_1)) * (arr_2[i] - np.mean(arr_2))
+                                       for i in range(len(arr_1))])
+
+    return [[covariance(*drop_incomparable_values(k, j)) for j in predictor_errors] for k in predictor_errors]
+
+
+def _random_bets(predictors: int, statements: int, missing: float, seed: int = 0) -> list[list[float | None]]:
+    rng = np.random.default_rng(seed)
+    return [[None if rng.random() < missing else float(rng.integers(0, 6)) / 5 for _ in range(statements)]
+            for _ in range(predictors)]
+
+
+class CombinedBetTest(unittest.TestCase):
+    def test_to_float_matrix(self):
+        matrix = to_float_matrix([[0.2, None], [None, 1.0]])
+        self.assertTrue(np.isnan(matrix[0, 1]) and np.isnan(matrix[1, 0]))
+        self.assertEqual(matrix[0, 0], 0.2)
+        self.assertEqual(to_float_matrix([]).shape, (0,))
+
+    def test_pairwise_covariance_matches_reference(self):
+        outcomes = [1.0, 0.0, 1.0, 1.0, 0.0, 1.0, 0.0, 0.0]
+        bets = _random_bets(predictors=5, statements=len(outcomes), missing=0.2)
+        errors = [[outcome - bet if bet is not None else None for outcome, bet in zip(outcomes, row)]
+                  for row in bets]
+
+        np.testing.assert_allclose(pairwise_covariance(to_float_matrix(errors)),
+                                   _legacy_covariance_matrix(errors),
+                                   atol=1e-12)
+
+    def test_pairwise_covariance_without_shared_values(self):
+        covariance = pairwise_covariance(to_float_matrix([[0.5, None], [None, 0.5]]))
+        self.assertEqual(covariance[0, 1], 0)
+        self.assertEqual(covariance[1, 0], 0)
+
+    def test_combine_bets_without_history(self):
+        combined = combine_bets(current_bets=to_float_matrix([[0.2, None], [0.6, None]]),
+                                previous_bets=np.zeros((2, 0)),
+                                previous_outcomes=[])
+
+        self.assertAlmostEqual(combined[0], 0.4)
+        self.assertTrue(np.isnan(combined[1]))
+
+    def test_combine_bets_ignores_predictors_without_history(self):
+        combined = combine_bets(current_bets=to_float_matrix([[1.0], [0.0]]),
+                                previous_bets=to_float_matrix([[1.0, 0.0], [None, None]]),
+                                previous_outcomes=[1.0, 0.0])
+
+        self.assertAlmostEqual(combined[0], 1.0)
+
+    def test_combine_bets_singular_covariance_is_deterministic(self):
+        # Two identical predictors make the covariance matrix singular
+        kwargs = dict(current_bets=to_float_matrix([[0.2], [0.6]]),
+                      previous_bets=to_float_matrix([[0.8, 0.2, 0.6], [0.8, 0.2, 0.6]]),
+                      previous_outcomes=[1.0, 0.0, 1.0])
+
+        first, second = combine_bets(**kwargs), combine_bets(**kwargs)
+        self.assertEqual(first[0], second[0])
+        self.assertTrue(0 <= first[0] <= 1)
+
+    def test_combine_bets_ignores_undecided_outcomes(self):
+        kwargs = dict(current_bets=to_float_matrix([[0.2], [0.6]]), outcome_mean=0.5)
+        combined = combine_bets(previous_bets=to_float_matrix([[0.8, 0.2, 1.0, 0.4], [0.6, 0.4, 0.0, 1.0]]),
+                                previous_outcomes=[1.0, 0.0, 0.5, 0.5],
+                                **kwargs)
+        expected = combine_bets(previous_bets=to_float_matrix([[0.8, 0.2], [0.6, 0.4]]),
+                                previous_outcomes=[1.0, 0.0],
+                                **kwargs)
+
+        self.assertEqual(combined[0], expected[0])
+
+
+@unittest.skipUnless(RUN_BENCHMARKS, 'Set FLOWBACK_RUN_BENCHMARKS to run benchmarks')
+class CombinedBetBenchmark(unittest.TestCase):
+    @staticmethod
+    def timed(func, *args, **kwargs) -> float:
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        return time.perf_counter() - start
+
+    def test_covariance_benchmark(self):
+        for predictors, history in ((10, 100), (50, 200), (100, 500)):
+            errors = _random_bets(predictors=predictors, statements=history, missing=0.3)
+            matrix = to_float_matrix(errors)
+
+            kernel = self.timed(pairwise_covariance, matrix)
+            legacy = self.timed(_legacy_covariance_matrix, errors) if predictors <= 50 else None
+
+            print(f"\nCovariance, {predictors} predictors × {history} statements: kernel {kernel * 1000:.2f}ms"
+                  + (f", legacy {legacy * 1000:.0f}ms" if legacy is not None else ""))
+
+    def test_combine_bets_benchmark(self):
+        for predictors, statements, history in ((50, 10, 200), (200, 20, 500)):
+            outcomes = [float(x) for x in np.random.default_rng(1).integers(0, 2, history)]
+            seconds = self.timed(combine_bets,
+                                 current_bets=to_float_matrix(_random_bets(predictors, statements, 0.5, seed=2)),
+                                 previous_bets=to_float_matrix(_random_bets(predictors, history, 0.3, seed=3)),
+                                 previous_outcomes=outcomes)
+
+            print(f"\ncombine_bets, {predictors} predictors, {statements} statements, {history} history: "
+                  f"{seconds * 1000:.2f}ms")
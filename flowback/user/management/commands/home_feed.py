@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from flowback.group.models import Group
+from flowback.user.models import User
+from flowback.user.selectors import user_home_feed, user_home_feed_scan
+from flowback.user.services import home_feed_group_rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds (backfills) or checks the precomputed home feed against the polls and threads visible to users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Replace the home feed entries of every group')
+        parser.add_argument('--check', action='store_true',
+                            help='Compare the home feed of users with the polls and threads visible to them')
+        parser.add_argument('--user', action='append', type=int, dest='user_ids',
+                            help='Only check the given user id(s)')
+
+    def handle(self, *args, rebuild: bool, check: bool, user_ids: list[int], **options):
+        if not rebuild and not check:
+            raise CommandError('Use --rebuild and/or --check')
+
+        if rebuild:
+            group_ids = list(Group.objects.order_by('id').values_list('id', flat=True))
+            for group_id in group_ids:
+                home_feed_group_rebuild(group_id=group_id)
+
+            self.stdout.write(f'Rebuilt the home feed of {len(group_ids)} group(s)')
+
+        if not check:
+            return
+
+        users = User.objects.filter(is_active=True).order_by('id')
+        if user_ids:
+            users = users.filter(id__in=user_ids)
+
+        checked_users = mismatched_users = 0
+        for user in users.iterator():
+            checked_users += 1
+            feed = list(user_home_feed(fetched_by=user).values_list('related_model', 'object_id'))
+            expected = user_home_feed_scan(fetched_by=user)
+
+            missing, unexpected = expected - set(feed), set(feed) - expected
+            duplicates = len(feed) - len(set(feed))
+            if missing or unexpected or duplicates:
+                mismatched_users += 1
+                self.stdout.write(self.style.ERROR(f'User {user.id}: {len(missing)} missing, '
+                                                   f'{len(unexpected)} unexpected, {duplicates} duplicate(s)'))
+
+        if mismatched_users:
+            raise CommandError(f'{mismatched_users} of {checked_users} home feed(s) differ')
+
+        self.stdout.write(self.style.SUCCESS(f'{checked_users} home feed(s) match'))
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.17 on 2026-10-18 05:43
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('group', '0049_groupcounter_groupthreadcounter'),
+        ('poll', '0049_pollcounter'),
+        ('user', '0016_remove_user_direct_message'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserHomeFeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='group.group')),
+                ('poll', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='poll.poll')),
+                ('thread', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='group.groupthread')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('work_group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='group.workgroup')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-created_at', '-id'], name='home_feed_entry_user_idx'), models.Index(condition=models.Q(('user__isnull', True)), fields=['-created_at', '-id'], name='home_feed_entry_shared_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='userhomefeedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'poll'), name='home_feed_entry_unique_poll'),
+        ),
+        migrations.AddConstraint(
+            model_name='userhomefeedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'thread'), name='home_feed_entry_unique_thread'),
+        ),
+        migrations.AddConstraint(
+            model_name='userhomefeedentry',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('poll__isnull', False), ('thread__isnull', True)), models.Q(('poll__isnull', True), ('thread__isnull', False)), _connector='OR'), name='home_feed_entry_poll_or_thread'),
+        ),
+    ]
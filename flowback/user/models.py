@@ -160,4 +160,25 @@ class UserChatInvite(BaseModel):
         constraints = [models.UniqueConstraint(fields=['user', 'message_channel'], name='unique_user_invite')]
 
 
-post_save.connect(UserChatInvite.post_save, sender=UserChatInvite)
\ No newline at end of file
+post_save.connect(UserChatInvite.post_save, sender=UserChatInvite)
+
+# Precomputed home feed, kept up-to-date by flowback.user.services.home_feed_*. Polls and threads are fanned out to
+# an entry per member that can see them, polls visible outside of their group and content of groups above
+# FLOWBACK_HOME_FEED_FANOUT_LIMIT members get one shared entry (without user) that is checked on read instead.
+class UserHomeFeedEntry(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    group = models.ForeignKey('group.Group', on_delete=models.CASCADE)
+    work_group = models.ForeignKey('group.WorkGroup', on_delete=models.SET_NULL, null=True, blank=True)
+    poll = models.ForeignKey('poll.Poll', on_delete=models.CASCADE, null=True, blank=True)
+    thread = models.ForeignKey('group.GroupThread', on_delete=models.CASCADE, null=True, blank=True)
+    created_at = models.DateTimeField()  # Of the poll or thread
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'poll'], name='home_feed_entry_unique_poll'),
+                       models.UniqueConstraint(fields=['user', 'thread'], name='home_feed_entry_unique_thread'),
+                       models.CheckConstraint(check=models.Q(poll__isnull=False, thread__isnull=True)
+                                                    | models.Q(poll__isnull=True, thread__isnull=False),
+                                              name='home_feed_entry_poll_or_thread')]
+        indexes = [models.Index(fields=['user', '-created_at', '-id'], name='home_feed_entry_user_idx'),
+                   models.Index(fields=['-created_at', '-id'], condition=models.Q(user__isnull=True),
+                                name='home_feed_entry_shared_idx')]
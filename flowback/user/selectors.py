@@ -1,6 +1,7 @@
 import django_filters
 from django.db import models
-from django.db.models import OuterRef, Q, Exists, Subquery, Count, F
+from django.db.models import OuterRef, Q, Exists, Subquery, Count, Case, When, Value
+from django.db.models.functions import Coalesce
 from django_filters import FilterSet
 from rest_framework.exceptions import ValidationError
 
@@ -8,10 +9,11 @@ from flowback.comment.models import Comment
 from flowback.common.filters import NumberInFilter
 from flowback.common.services import get_object
 from flowback.group.models import Group, GroupUser, GroupThread
+from flowback.group.selectors import group_content_visible_for
 from flowback.poll.models import Poll, PollPredictionStatement
 from flowback.schedule.selectors import schedule_event_list
 from flowback.kanban.selectors import kanban_entry_list
-from flowback.user.models import User, UserChatInvite
+from flowback.user.models import User, UserChatInvite, UserHomeFeedEntry
 from backend.settings import env
 
 
@@ -78,84 +80,53 @@ class UserHomeFeedFilter(django_filters.FilterSet):
     order_by = django_filters.OrderingFilter(fields=(('created_at', 'created_at_asc'),
                                                      ('-created_at', 'created_at_desc'),
                                                      ('-pinned', 'pinned')))
-    id = django_filters.NumberFilter(lookup_expr='exact')
-    created_by_id = django_filters.NumberFilter(lookup_expr='exact')
+    id = django_filters.NumberFilter(field_name='object_id', lookup_expr='exact')
+    created_by_id = django_filters.NumberFilter(field_name='created_by', lookup_expr='exact')
     title = django_filters.CharFilter(lookup_expr='icontains')
     description = django_filters.CharFilter(lookup_expr='icontains')
     related_model = django_filters.CharFilter(lookup_expr='exact')
     group_joined = django_filters.BooleanFilter(lookup_expr='exact')
-    group_ids = NumberInFilter(field_name='created_by__group_id')
+    group_ids = NumberInFilter(field_name='group_id')
 
 
 # TODO add relevant Count (proposal, prediction, comments) to the home feed if possible
 def user_home_feed(*, fetched_by: User, filters=None):
+    """
+    Polls and threads visible to the user, read from the precomputed UserHomeFeedEntry rows: the entries of the user
+    and the shared entries they can see.
+    """
     filters = filters or {}
-    ordering_filter = {}
-
-    if 'order_by' in filters.keys():
-        ordering_filter['order_by'] = filters.pop('order_by')
-
-    joined_groups = Group.objects.filter(id=OuterRef('created_by__group_id'), groupuser__user__in=[fetched_by])
-    related_fields = ['id',
-                      'created_by',
-                      'created_at',
-                      'updated_at',
-                      'group_id',
-                      'title',
-                      'description',
-                      'related_model',
-                      'group_joined',
-                      'pinned']
-
-    q = (Q(created_by__group__groupuser__user__in=[fetched_by])
-         & Q(created_by__group__groupuser__active=True))  # User in group
-
-    thread_qs = GroupThread.objects.filter(
-        q & Q(work_group__isnull=True)  # All threads without workgroup
-
-        | q & Q(work_group__isnull=False)  # User in workgroup
-        & Q(work_group__workgroupuser__group_user__user=fetched_by)
-
-        | q & Q(work_group__isnull=False)  # User is admin in group
-        & Q(created_by__group__groupuser__user=fetched_by)
-        & Q(created_by__group__groupuser__is_admin=True))
-
-    thread_qs = thread_qs.annotate(related_model=models.Value('group_thread', models.CharField()),
-                                   group_id=F('created_by__group_id'),
-                                   group_joined=Exists(joined_groups))
-    thread_qs = thread_qs.values(*related_fields)
-    thread_qs = UserHomeFeedFilter(filters, thread_qs).qs
-
-
-    # Poll
-    poll_qs = Poll.objects.filter(
-        q & Q(work_group__isnull=True)  # User in Group
-
-        | Q(created_by__group__public=True)
-        & ~Q(created_by__group__groupuser__user__in=[fetched_by])  # Group is Public
-        & Q(work_group__isnull=True)
-        
-        | q & Q(work_group__isnull=False)  # User in workgroup
-        & Q(work_group__workgroupuser__group_user__user=fetched_by)
-
-        | q & Q(created_by__group__public=True)
-        & Q(created_by__group__groupuser__user__in=[fetched_by])
-        & Q(created_by__group__groupuser__active=False)  # User in group but not active, and group is public
-    
-        | q & Q(work_group__isnull=False)  # User is admin in group
-        & Q(created_by__group__groupuser__user=fetched_by)
-        & ~Q(created_by__group__groupuser__user__in=[fetched_by])
-        & Q(created_by__group__groupuser__is_admin=True))
-    poll_qs = poll_qs.annotate(related_model=models.Value('poll', models.CharField()),
-                               group_id=F('created_by__group_id'),
-                               group_joined=Exists(joined_groups))
-    poll_qs = poll_qs.values(*related_fields)
-    poll_qs = UserHomeFeedFilter(filters, poll_qs).qs
-
-    qs = thread_qs.union(poll_qs).order_by('-created_at')
-    qs = UserHomeFeedFilter(ordering_filter, qs).qs
-
-    return qs
+
+    shared = Q(user__isnull=True) & (group_content_visible_for(user=fetched_by, public=False, group_field='group')
+                                     | Q(poll__isnull=False, work_group__isnull=True, group__public=True))
+    joined_groups = GroupUser.objects.filter(user=fetched_by, group_id=OuterRef('group_id'))
+
+    qs = UserHomeFeedEntry.objects.filter(Q(user=fetched_by) | shared).annotate(
+        object_id=Coalesce('poll_id', 'thread_id'),
+        related_model=Case(When(poll__isnull=False, then=Value('poll')),
+                           default=Value('group_thread'),
+                           output_field=models.CharField()),
+        created_by=Coalesce('poll__created_by_id', 'thread__created_by_id'),
+        updated_at=Coalesce('poll__updated_at', 'thread__updated_at'),
+        title=Coalesce('poll__title', 'thread__title'),
+        description=Coalesce('poll__description', 'thread__description'),
+        pinned=Coalesce('poll__pinned', 'thread__pinned'),
+        group_joined=Exists(joined_groups)
+    ).order_by('-created_at')
+
+    return UserHomeFeedFilter(filters, qs).qs
+
+
+def user_home_feed_scan(*, fetched_by: User) -> set[tuple[str, int]]:
+    """
+    The (related_model, id) of every poll and thread visible to the user, read from the polls and threads themselves
+    rather than the home feed entries. Used to check the entries against, see the home_feed command.
+    """
+    thread_qs = GroupThread.objects.filter(group_content_visible_for(user=fetched_by, public=False))
+    poll_qs = Poll.objects.filter(group_content_visible_for(user=fetched_by))
+
+    return ({('group_thread', thread_id) for thread_id in thread_qs.values_list('id', flat=True)}
+            | {('poll', poll_id) for poll_id in poll_qs.values_list('id', flat=True)})
 
 
 class UserChatInviteFilter(django_filters.FilterSet):
@@ -4,21 +4,24 @@ import uuid
 from functools import reduce
 
 from django.core.mail import send_mail
-from django.db.models import Q, Count
+from django.db.models import Q, Count, Exists, OuterRef
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.password_validation import validate_password
 from django.utils import timezone
 
 from rest_framework.exceptions import ValidationError
 
-from backend.settings import DEFAULT_FROM_EMAIL, FLOWBACK_URL, EMAIL_HOST
+from backend.settings import DEFAULT_FROM_EMAIL, FLOWBACK_URL, EMAIL_HOST, FLOWBACK_HOME_FEED_FANOUT_LIMIT
 from flowback.chat.models import MessageChannel, MessageChannelParticipant
 from flowback.chat.services import message_channel_create, message_channel_join
 from flowback.common.services import model_update, get_object
 from flowback.kanban.services import KanbanManager
 from flowback.schedule.models import ScheduleEvent
 from flowback.schedule.services import ScheduleManager, unsubscribe_schedule
-from flowback.user.models import User, OnboardUser, PasswordReset, Report, UserChatInvite
+from flowback.group.models import Group, GroupCounter, GroupThread, GroupUser, WorkGroupUser
+from flowback.group.selectors import group_content_visible_for
+from flowback.poll.models import Poll
+from flowback.user.models import User, OnboardUser, PasswordReset, Report, UserChatInvite, UserHomeFeedEntry
 
 user_schedule = ScheduleManager(schedule_origin_name='user')
 user_kanban = KanbanManager(origin_type='user')
@@ -322,3 +325,84 @@ def report_create(*, user_id: int, title: str, description: str):
     report.save()
 
     return report
+
+
+# Home feed fan-out, see UserHomeFeedEntry
+def home_feed_fan_out(*, group: Group, polls=(), threads=()) -> None:
+    """
+    Creates the home feed entries of new polls and threads of the group: one shared entry each if the group has
+    more members than FLOWBACK_HOME_FEED_FANOUT_LIMIT, or for polls outside work groups of a public group (visible to
+    everyone), otherwise an entry for every member that can see them.
+    """
+    items = ([('poll', poll.id, poll.work_group_id, poll.created_at) for poll in polls]
+             + [('thread', thread.id, thread.work_group_id, thread.created_at) for thread in threads])
+    if not items:
+        return
+
+    shared_group = GroupCounter.objects.filter(group=group, member_count__gt=FLOWBACK_HOME_FEED_FANOUT_LIMIT).exists()
+    viewers, work_group_viewers = None, {}
+    entries = []
+
+    for field, item_id, work_group_id, created_at in items:
+        entry = dict(group_id=group.id, work_group_id=work_group_id, created_at=created_at, **{f'{field}_id': item_id})
+
+        if shared_group or (field == 'poll' and group.public and work_group_id is None):
+            entries.append(UserHomeFeedEntry(**entry))
+            continue
+
+        if viewers is None:
+            members = GroupUser.objects.filter(group=group, active=True)
+            viewers = dict(members.values_list('user_id', 'is_admin'))
+            for work_group, user_id in WorkGroupUser.objects.filter(group_user__in=members).values_list(
+                    'work_group_id', 'group_user__user_id'):
+                work_group_viewers.setdefault(work_group, set()).add(user_id)
+
+        if work_group_id is None:
+            user_ids = viewers.keys()
+
+        else:
+            user_ids = (work_group_viewers.get(work_group_id, set())
+                        | {user_id for user_id, is_admin in viewers.items() if is_admin})
+
+        entries += [UserHomeFeedEntry(user_id=user_id, **entry) for user_id in user_ids]
+
+    UserHomeFeedEntry.objects.bulk_create(entries, batch_size=1000, ignore_conflicts=True)
+
+
+def home_feed_group_rebuild(*, group_id: int) -> None:
+    """Replaces the home feed entries of every poll and thread in the group"""
+    UserHomeFeedEntry.objects.filter(group_id=group_id).delete()
+
+    if group := Group.objects.filter(id=group_id).first():
+        home_feed_fan_out(group=group,
+                          polls=Poll.objects.filter(created_by__group=group).only('work_group_id', 'created_at'),
+                          threads=GroupThread.objects.filter(created_by__group=group).only('work_group_id',
+                                                                                           'created_at'))
+
+
+def home_feed_member_rebuild(*, user_id: int, group_id: int) -> None:
+    """
+    Replaces the home feed entries of a member of the group, after their membership changed. Polls and threads with
+    a shared entry are left out, their visibility is checked on read.
+    """
+    UserHomeFeedEntry.objects.filter(user_id=user_id, group_id=group_id).delete()
+
+    entries = []
+    visible = group_content_visible_for(user=user_id, public=False)
+    for field, model in (('poll', Poll), ('thread', GroupThread)):
+        shared = UserHomeFeedEntry.objects.filter(user__isnull=True, **{field: OuterRef('pk')})
+        items = model.objects.filter(visible, created_by__group_id=group_id).exclude(Exists(shared))
+        entries += [UserHomeFeedEntry(user_id=user_id,
+                                      group_id=group_id,
+                                      work_group_id=work_group_id,
+                                      created_at=created_at,
+                                      **{f'{field}_id': item_id})
+                    for item_id, work_group_id, created_at in items.values_list('id', 'work_group_id', 'created_at')]
+
+    UserHomeFeedEntry.objects.bulk_create(entries, batch_size=1000, ignore_conflicts=True)
+
+
+def home_feed_work_group_leave(*, user_id: int, work_group_id: int) -> None:
+    """Removes the work group content from the home feed of a member, unless they're admin of the group"""
+    admin = GroupUser.objects.filter(user_id=user_id, group_id=OuterRef('group_id'), is_admin=True, active=True)
+    UserHomeFeedEntry.objects.filter(user_id=user_id, work_group_id=work_group_id).exclude(Exists(admin)).delete()
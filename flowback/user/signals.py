@@ -0,0 +1,69 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from flowback.group.models import Group, GroupThread, GroupUser, WorkGroup, WorkGroupUser
+from flowback.poll.models import Poll
+from flowback.user.models import UserHomeFeedEntry
+from flowback.user.services import (home_feed_fan_out, home_feed_group_rebuild, home_feed_member_rebuild,
+                                    home_feed_work_group_leave)
+
+
+# Keeps the precomputed home feed up-to-date, see UserHomeFeedEntry. Deletes only remove entries, as they may be part
+# of a cascade where new entries would refer to rows about to be deleted.
+@receiver(post_save, sender=Poll)
+def home_feed_poll_create(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        home_feed_fan_out(group=instance.created_by.group, polls=[instance])
+
+
+@receiver(post_save, sender=GroupThread)
+def home_feed_thread_create(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        home_feed_fan_out(group=instance.created_by.group, threads=[instance])
+
+
+@receiver(pre_save, sender=Group)
+def home_feed_group_public_changed(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance._state.adding or (update_fields is not None and 'public' not in update_fields):
+        return
+
+    instance.__dict__['_home_feed_rebuild'] = not Group.objects.filter(id=instance.id, public=instance.public).exists()
+
+
+@receiver(post_save, sender=Group)
+def home_feed_group_update(sender, instance, **kwargs):
+    # Polls of public groups are shared with everyone, private groups fan them out to the members
+    if instance.__dict__.pop('_home_feed_rebuild', False):
+        home_feed_group_rebuild(group_id=instance.id)
+
+
+@receiver(post_save, sender=GroupUser)
+def home_feed_group_user_update(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and not {'active', 'is_admin'} & set(update_fields)):
+        return
+
+    home_feed_member_rebuild(user_id=instance.user_id, group_id=instance.group_id)
+
+
+@receiver(post_delete, sender=GroupUser)
+def home_feed_group_user_delete(sender, instance, **kwargs):
+    UserHomeFeedEntry.objects.filter(user_id=instance.user_id, group_id=instance.group_id).delete()
+
+
+@receiver(post_save, sender=WorkGroupUser)
+def home_feed_work_group_user_update(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        home_feed_member_rebuild(user_id=instance.group_user.user_id, group_id=instance.group_user.group_id)
+
+
+@receiver(post_delete, sender=WorkGroupUser)
+def home_feed_work_group_user_delete(sender, instance, **kwargs):
+    home_feed_work_group_leave(user_id=instance.group_user.user_id, work_group_id=instance.work_group_id)
+
+
+@receiver(post_delete, sender=WorkGroup)
+def home_feed_work_group_delete(sender, instance, **kwargs):
+    # Threads of the work group are now visible to the whole group, rebuilt once the deletion (which may be of the
+    # group itself) is committed
+    transaction.on_commit(lambda: home_feed_group_rebuild(group_id=instance.group_id))
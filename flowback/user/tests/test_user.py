@@ -1,6 +1,10 @@
 import json
 import math
+from io import StringIO
+from unittest.mock import patch
+from urllib.parse import urlparse, parse_qs
 
+from django.core.management import call_command, CommandError
 from rest_framework import status
 from rest_framework.test import APITransactionTestCase, APIRequestFactory, force_authenticate
 
@@ -13,7 +17,7 @@ from flowback.group.tests.factories import GroupThreadFactory, GroupUserFactory,
     WorkGroupUserFactory
 from flowback.poll.models import Poll
 from flowback.poll.tests.factories import PollFactory
-from flowback.user.models import User, UserChatInvite
+from flowback.user.models import User, UserChatInvite, UserHomeFeedEntry
 from flowback.user.services import user_create, user_create_verify
 from flowback.user.tests.factories import UserFactory
 from flowback.user.views.home import UserHomeFeedAPI
@@ -134,6 +138,29 @@ class UserTest(APITransactionTestCase):
         self.assertEqual(response.status_code, 200, response.data)
         self.assertEqual(response.data['count'], 17)
 
+    def test_user_home_feed_cursor(self):
+        group_user = GroupUserFactory()
+        GroupThreadFactory.create_batch(size=4, created_by=group_user)
+        PollFactory.create_batch(size=4, created_by=group_user)
+
+        response = generate_request(api=UserHomeFeedAPI, user=group_user.user)
+        expected = [(item['related_model'], item['id']) for item in response.data['results']]
+
+        data = dict(limit=3, cursor='')
+        results = []
+        while True:
+            response = generate_request(api=UserHomeFeedAPI, user=group_user.user, data=data)
+            self.assertEqual(response.status_code, 200, response.data)
+            results += [(item['related_model'], item['id']) for item in response.data['results']]
+
+            if not response.data['next']:
+                break
+
+            data['cursor'] = parse_qs(urlparse(response.data['next']).query)['cursor'][0]
+
+        self.assertEqual(results, expected)
+        self.assertEqual(len(results), 8)
+
     def test_user_home_feed_visibility(self):
         # Create public group with 5 polls and 10 threads
         group_public = GroupFactory(public=True)
@@ -202,6 +229,59 @@ class UserTest(APITransactionTestCase):
 
 
 
+    def test_user_home_feed_entries(self):
+        group_private = GroupFactory(public=False)
+        group_public = GroupFactory(public=True)
+        member = GroupUserFactory(group=group_private)
+        public_member = GroupUserFactory(group=group_public, user=member.user)
+        work_group_user = WorkGroupUserFactory(work_group__group=group_private, group_user__group=group_private)
+        work_group = work_group_user.work_group
+
+        PollFactory.create_batch(size=2, created_by=member)
+        PollFactory(created_by=member, work_group=work_group)
+        GroupThreadFactory(created_by=member, work_group=work_group)
+        PollFactory.create_batch(size=2, created_by=public_member)
+        GroupThreadFactory.create_batch(size=2, created_by=public_member)
+
+        def check():
+            call_command('home_feed', check=True, stdout=StringIO())
+
+        check()
+
+        # Membership changes
+        WorkGroupUserFactory(work_group=work_group, group_user=member)
+        check()
+        work_group_user.delete()
+        check()
+        member.active = False
+        member.save()
+        check()
+
+        group_private.public = True
+        group_private.save()
+        check()
+        work_group.delete()
+        check()
+
+        # Groups above the fan-out limit share one entry per poll or thread
+        with patch('flowback.user.services.FLOWBACK_HOME_FEED_FANOUT_LIMIT', 0):
+            thread = GroupThreadFactory(created_by=public_member)
+
+        self.assertEqual(list(UserHomeFeedEntry.objects.filter(thread=thread).values_list('user', flat=True)), [None])
+        GroupUserFactory(group=group_public)
+        check()
+
+        response = generate_request(api=UserHomeFeedAPI, user=member.user, data=dict(related_model='group_thread'))
+        self.assertEqual(response.data['results'][0]['id'], thread.id)
+        self.assertEqual(response.data['count'], 3)
+
+        # Backfill
+        UserHomeFeedEntry.objects.all().delete()
+        with self.assertRaises(CommandError):
+            check()
+
+        call_command('home_feed', rebuild=True, check=True, stdout=StringIO())
+
     def test_user_get_chat_channel(self):
         participants = UserFactory.create_batch(25)
 
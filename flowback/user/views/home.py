@@ -2,14 +2,14 @@ from drf_spectacular.utils import extend_schema
 from rest_framework import serializers
 from rest_framework.views import APIView
 
-from flowback.common.pagination import get_paginated_response, LimitOffsetPagination
+from flowback.common.pagination import get_paginated_response, CursorPagination
 from flowback.group.serializers import GroupUserSerializer
 from flowback.user.selectors import user_home_feed
 
 
 @extend_schema(tags=['user'])
 class UserHomeFeedAPI(APIView):
-    class Pagination(LimitOffsetPagination):
+    class Pagination(CursorPagination):
         default_limit = 25
         max_limit = 100
 
@@ -29,7 +29,7 @@ class UserHomeFeedAPI(APIView):
         updated_at = serializers.DateTimeField()
         group_id = serializers.IntegerField()
         pinned = serializers.BooleanField()
-        id = serializers.IntegerField()
+        id = serializers.IntegerField(source='object_id')
         title = serializers.CharField()
         description = serializers.CharField(allow_null=True, default=None)
         related_model = serializers.CharField()